@@ -0,0 +1,99 @@
+"""Throughput of coordinate -> county lookups (``county_geo.CountyGrid``).
+
+Draws points uniformly over the state's bounding box and, separately, next
+to county boundaries (the slow path: the cell's edges are tested), and
+times ``CountyGrid.locate`` on both for a few grid cell sizes. For
+reference it also times a brute-force point-in-polygon test (NumPy ray
+casting against every county polygon in turn) and the location text
+detector, and checks that the grid agrees with the brute-force answer on
+every point.
+
+Usage (from the repo root):
+    python benchmarks/bench_county_geo.py --points 100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+
+import county_geo  # noqa: E402
+from counties import get_county_detector  # noqa: E402
+from county_geo import CountyGrid, _edges, load_boundaries  # noqa: E402
+
+
+def brute_force(edges: dict[str, np.ndarray]):
+    def locate(lon: float, lat: float):
+        for key, e in edges.items():
+            ax, ay, bx, by = e.T
+            crossing = (ay > lat) != (by > lat)
+            x = ax[crossing] + (lat - ay[crossing]) * (bx[crossing] - ax[crossing]) / (by[crossing] - ay[crossing])
+            if np.count_nonzero(x > lon) % 2:
+                return key
+        return None
+
+    return locate
+
+
+def timed(fn, points) -> tuple[float, list]:
+    start = time.perf_counter()
+    out = [fn(lon, lat) for lon, lat in points]
+    return (time.perf_counter() - start) / len(points) * 1e6, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boundaries", type=Path, default=county_geo.BOUNDARIES_PATH)
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--cells", type=float, nargs="+", default=[0.05, 0.02, 0.01])
+    parser.add_argument("--brute-points", type=int, default=2000, help="points for the brute-force baseline")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Exact point-in-polygon answers only: no snapping to nearby boundaries
+    county_geo.SNAP_KM = 0.0
+    boundaries = load_boundaries(args.boundaries)
+    edges = {key: _edges(rings) for key, rings in boundaries.items()}
+    every = np.vstack(list(edges.values()))
+    rng = np.random.default_rng(args.seed)
+    low = every[:, :2].min(axis=0)
+    high = every[:, :2].max(axis=0)
+    workloads = {
+        "uniform": rng.uniform(low, high, (args.points, 2)),
+        # Within ~30 m of a boundary vertex
+        "near boundary": every[rng.integers(len(every), size=args.points), :2]
+        + rng.normal(0, 3e-4, (args.points, 2)),
+    }
+    workloads = {name: points.tolist() for name, points in workloads.items()}
+    print(f"{len(boundaries)} counties, {len(every)} edges, {args.points} points per workload\n")
+
+    brute = brute_force(edges)
+    expected = {name: timed(brute, points[: args.brute_points]) for name, points in workloads.items()}
+
+    print(f"{'method':<28}{'build ms':>10}{'cells':>10}{'boundary':>10}" + "".join(f"{name + ' us':>18}" for name in workloads))
+    print(f"{'brute force (numpy)':<28}{'':>10}{'':>10}{'':>10}" + "".join(f"{expected[name][0]:>18.1f}" for name in workloads))
+    for cell in args.cells:
+        start = time.perf_counter()
+        grid = CountyGrid(boundaries, cell)
+        build_ms = (time.perf_counter() - start) * 1e3
+        row = f"{f'grid {cell}°':<28}{build_ms:>10.0f}{grid.nx * grid.ny:>10}{grid.crossed_cells:>10}"
+        for name, points in workloads.items():
+            us, out = timed(grid.locate, points)
+            wrong = sum(a != b for a, b in zip(out, expected[name][1]))
+            if wrong:
+                raise SystemExit(f"grid {cell}° disagrees with brute force on {wrong} {name} points")
+            row += f"{us:>18.2f}"
+        print(row)
+
+    detector = get_county_detector()
+    locations = ["Ithaca, NY", "123 Main St, Saratoga Springs, NY 12866", "Brooklyn, NY", "Somewhere, NY"]
+    us, _ = timed(lambda text, _: detector.detect(text), [(loc, None) for loc in locations] * 5000)
+    print(f"\nlocation text detector: {us:.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
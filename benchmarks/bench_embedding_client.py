@@ -0,0 +1,89 @@
+"""Tail latency and failure behaviour of the service's embedding client.
+
+Runs the client against ``fake_embedding_server.py`` with a slow tail
+(``--tail-prob`` of the responses take ``--tail-ms``) and reports latency
+percentiles and provider calls with hedging off, with a fixed hedge delay
+and with the adaptive (p90) delay. A second phase makes every response fail
+and shows the circuit breaker turning provider timeouts into fast failures.
+
+Usage (from the repo root):
+    python benchmarks/bench_embedding_client.py --calls 300 --tail-prob 0.05
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from embedding_client import EmbeddingClient, EmbeddingUnavailable  # noqa: E402
+from fake_embedding_server import Handler, start_server  # noqa: E402
+
+
+def run(base_url: str, calls: int, hedge_after, label: str) -> None:
+    client = EmbeddingClient("fake", base_url=base_url, hedge_after=hedge_after, cache_size=0)
+    # Prime the adaptive hedge delay; not measured
+    for i in range(30):
+        client.embed([f"warmup {i}"])
+    requests_before = Handler.requests
+    client.requests = client.hedges = client.hedge_wins = 0
+
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        client.embed([f"plastic bottle recycling query {i}"])
+        latencies.append(time.perf_counter() - start)
+    client.close()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    print(
+        f"{label:<18}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{max(latencies) * 1e3:>9.1f}"
+        f"{(Handler.requests - requests_before) / calls:>12.2f}{client.hedges:>8}{client.hedge_wins:>6}"
+    )
+
+
+def breaker_phase(base_url: str, timeout: float) -> None:
+    Handler.behaviour.error_rate = 1.0
+    client = EmbeddingClient(
+        "fake", base_url=base_url, timeout=timeout, hedge_after=0,
+        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60), cache_size=0,
+    )
+    print(f"\n{'call':>4}{'ms':>9}  outcome")
+    for i in range(10):
+        start = time.perf_counter()
+        try:
+            client.embed(["battery"])
+            outcome = "ok"
+        except EmbeddingUnavailable as e:
+            outcome = str(e)[:60]
+        print(f"{i:>4}{(time.perf_counter() - start) * 1e3:>9.1f}  {outcome}")
+    print(f"breaker state: {client.breaker.state}")
+    client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--tail-prob", type=float, default=0.05)
+    parser.add_argument("--tail-ms", type=float, default=500.0)
+    parser.add_argument("--hedge-ms", type=float, default=60.0)
+    args = parser.parse_args()
+
+    server, base_url = start_server(
+        dims=256, latency_ms=args.latency_ms, tail_prob=args.tail_prob, tail_ms=args.tail_ms
+    )
+    print(f"{'mode':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'calls/req':>12}{'hedges':>8}{'wins':>6}")
+    run(base_url, args.calls, 0, "no hedging")
+    run(base_url, args.calls, args.hedge_ms / 1000, f"hedge @{args.hedge_ms:.0f} ms")
+    run(base_url, args.calls, None, "hedge @p90")
+    breaker_phase(base_url, timeout=args.tail_ms / 1000)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
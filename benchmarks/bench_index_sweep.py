@@ -0,0 +1,181 @@
+"""Index size, build time, latency and recall over a chunking / index parameter grid.
+
+Builds one serving snapshot per (chunk size, chunk overlap, embedder
+dimension) from the scraped corpus, embedding chunks and queries offline with the
+deterministic hashed bag-of-words vectors of ``fake_embedding_server.py``
+(no API calls, so every run sees the same vectors). Each snapshot is served
+through ``rag_query.query_rag`` at every ``--top-k`` and answers the golden
+query set (``golden_queries.yaml``: material, location and the source pages
+a good answer cites). Chunk size and overlap are in tokens, as
+``SentenceSplitter`` counts them. The embedder dimension is the length of the
+fake embedder's vectors, not the export's ``--dims`` reduction (the snapshots
+are exported at full dimension). Reported per configuration:
+
+- chunks and on-disk snapshot size;
+- build time (chunking, embedding and export);
+- p50 / p95 ``query_rag`` latency;
+- recall: share of golden queries citing an expected source, and the mean
+  reciprocal rank of the first such source.
+
+The hashed embedder ranks by shared words, not meaning, so compare
+configurations with each other rather than with production recall.
+``--no-topic-routing`` scans the index for every query instead of answering
+from the county's topic page first.
+
+Usage (from the repo root):
+    python benchmarks/bench_index_sweep.py --chunk-sizes 400 800 1600 --overlaps 0 120 --top-k 5 15
+"""
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "rag_service"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import rag_query  # noqa: E402
+from fake_embedding_server import fake_embedding  # noqa: E402
+from index_manager import IndexManager  # noqa: E402
+from semantic_cache import SemanticCache  # noqa: E402
+
+GOLDEN_QUERIES = Path(__file__).parent / "golden_queries.yaml"
+
+
+class OfflineEmbedder:
+    """Stands in for the service's embedding client."""
+
+    def __init__(self, dims: int):
+        self.dims = dims
+
+    def embed_query(self, text: str, timeout=None) -> np.ndarray:
+        return fake_embedding(text, self.dims)
+
+
+def build_snapshot(root: Path, nodes, dims: int, quantization: Optional[str]) -> tuple[float, int]:
+    """Embed and export ``nodes`` as the current snapshot under ``root``; (seconds, bytes)."""
+    from llama_index.core.schema import MetadataMode
+
+    from rag_service.snapshots import new_version, publish_snapshot, snapshot_dir
+    from rag_service.text_normalize import DISPLAY_TEXT_KEY
+    from store_rag_index import write_serving_export
+
+    start = time.perf_counter()
+    vectors = np.stack([fake_embedding(n.get_content(metadata_mode=MetadataMode.EMBED), dims) for n in nodes])
+    version = new_version(root)
+    out_dir = snapshot_dir(root, version)
+    with contextlib.redirect_stdout(io.StringIO()):
+        meta = write_serving_export(
+            out_dir,
+            [n.node_id for n in nodes],
+            vectors,
+            [n.metadata[DISPLAY_TEXT_KEY] for n in nodes],
+            [n.metadata for n in nodes],
+            quantization,
+        )
+        publish_snapshot(root, version, {"count": meta["count"]}, keep=1)
+    seconds = time.perf_counter() - start
+    size = sum(p.stat().st_size for p in out_dir.rglob("*") if p.is_file())
+    return seconds, size
+
+
+def run_queries(golden: list[dict], repeat: int) -> tuple[list[float], float, float]:
+    """Latencies (ms) of every query_rag call, recall and MRR over the golden set."""
+    latencies = []
+    for _ in range(repeat):
+        # Deterministic: every pass finds the same sources
+        found, reciprocal_ranks = 0, 0.0
+        for case in golden:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, sources = rag_query.query_rag(case["material"], case["location"])
+            latencies.append((time.perf_counter() - start) * 1e3)
+            distinct = list(dict.fromkeys(sources))
+            rank = next(
+                (i for i, source in enumerate(distinct, 1) if any(e in source for e in case["expect"])),
+                None,
+            )
+            if rank is not None:
+                found += 1
+                reciprocal_ranks += 1 / rank
+    return latencies, found / len(golden), reciprocal_ranks / len(golden)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=Path, default=ROOT / "rag" / "rag_docs")
+    parser.add_argument("--golden", type=Path, default=GOLDEN_QUERIES)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[400, 800, 1600], help="in tokens")
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 120], help="in tokens")
+    parser.add_argument(
+        "--embed-dims", "--dims", type=int, nargs="+", default=[256, 1536],
+        help="dimensions of the fake embedder's vectors (no export reduction)",
+    )
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 15])
+    parser.add_argument(
+        "--quantize", help="scan matrix type of every snapshot (default: the build's, float32 at full dimension)"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the golden set per configuration")
+    parser.add_argument("--no-topic-routing", action="store_true")
+    args = parser.parse_args()
+
+    from llama_index.core.node_parser import SentenceSplitter
+
+    from store_rag_index import build_nodes, load_documents
+
+    golden = yaml.safe_load(args.golden.read_text())
+    detector = rag_query.get_county_detector()
+    unresolved = [case["location"] for case in golden if detector.detect(case["location"]) is None]
+    if unresolved:
+        print(f"warning: no county detected for {unresolved}")
+    # Rankings must come from the snapshot under test, not an earlier one
+    rag_query._semantic_cache = SemanticCache(capacity=0)
+    rag_query.TOPIC_ROUTING = not args.no_topic_routing
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        docs = load_documents(str(args.docs))
+    print(f"{len(docs)} documents loaded in {time.perf_counter() - start:.1f} s, {len(golden)} golden queries\n")
+    print("chunk and overlap in tokens; emb d: fake embedder dimension")
+    print(
+        f"{'chunk':>6}{'overlap':>8}{'emb d':>6}{'top_k':>6}{'chunks':>8}{'index MB':>10}"
+        f"{'build s':>9}{'p50 ms':>8}{'p95 ms':>8}{'recall':>8}{'MRR':>7}"
+    )
+    for chunk_size in args.chunk_sizes:
+        for overlap in args.overlaps:
+            if overlap >= chunk_size:
+                continue
+            start = time.perf_counter()
+            nodes = build_nodes(docs, SentenceSplitter(chunk_size=chunk_size, chunk_overlap=overlap))
+            chunk_seconds = time.perf_counter() - start
+            for dims in args.embed_dims:
+                with tempfile.TemporaryDirectory() as tmp:
+                    build_seconds, size = build_snapshot(Path(tmp), nodes, dims, args.quantize)
+                    manager = IndexManager(Path(tmp))
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        manager.reload()
+                    rag_query._index_manager = manager
+                    rag_query.get_embedding_client = lambda model=None, dims=dims: OfflineEmbedder(dims)
+                    # Untimed pass: maps every county shard the golden set touches
+                    run_queries(golden, 1)
+                    for top_k in args.top_k:
+                        rag_query.SIMILARITY_TOP_K = top_k
+                        latencies, recall, mrr = run_queries(golden, args.repeat)
+                        p50, p95 = np.percentile(latencies, [50, 95])
+                        print(
+                            f"{chunk_size:>6}{overlap:>8}{dims:>6}{top_k:>6}{len(nodes):>8}"
+                            f"{size / 2**20:>10.1f}{chunk_seconds + build_seconds:>9.1f}"
+                            f"{p50:>8.2f}{p95:>8.2f}{recall:>8.2f}{mrr:>7.2f}"
+                        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Wall time and peak memory of the batch build vs the streaming pipeline.
+
+Indexes the scraped corpus (``--copies`` times over, to see how memory
+scales with corpus size) twice, each in a fresh process against
+``fake_embedding_server.py``:
+
+- batch: the old flow. "Scrape" every document to a directory one after
+  another (a sleep of ``--fetch-latency-ms`` per document stands in for the
+  network), then run ``store_rag_index.py`` on it: load everything, chunk
+  everything, embed everything, export.
+- pipeline: ``ingest_pipeline.py`` with the same per-document fetch latency
+  inside its fetch workers.
+
+Usage (from the repo root):
+    python benchmarks/bench_ingest_pipeline.py --copies 1 4 --fetch-latency-ms 50
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from build_manifest import peak_rss_mb  # noqa: E402
+
+
+def copy_corpus(docs: Path, out: Path, copies: int) -> int:
+    out.mkdir(parents=True)
+    count = 0
+    for copy in range(copies):
+        for path in sorted(docs.iterdir()):
+            if path.is_file():
+                shutil.copy(path, out / f"{path.stem}-{copy}{path.suffix}")
+                count += 1
+    return count
+
+
+def run_batch(docs: Path, persist_dir: Path, fetch_latency: float) -> None:
+    import store_rag_index
+
+    # Sequential scrape to disk, as load_rag_urls.py does
+    scraped = persist_dir.parent / "scraped"
+    scraped.mkdir()
+    for path in sorted(docs.iterdir()):
+        time.sleep(fetch_latency)
+        shutil.copy(path, scraped / path.name)
+    sys.argv = ["store_rag_index.py", "--docs", str(scraped), "--persist-dir", str(persist_dir)]
+    store_rag_index.main()
+
+
+def run_pipeline(docs: Path, persist_dir: Path, fetch_latency: float, embed_workers: int) -> None:
+    import ingest_pipeline
+
+    fetch = ingest_pipeline.fetch
+
+    def slow_fetch(task):
+        time.sleep(fetch_latency)
+        return fetch(task)
+
+    ingest_pipeline.fetch = slow_fetch
+    sys.argv = [
+        "ingest_pipeline.py", "--docs", str(docs), "--persist-dir", str(persist_dir),
+        "--embed-workers", str(embed_workers),
+    ]
+    ingest_pipeline.main()
+
+
+def child(args) -> None:
+    persist_dir = Path(args.persist_dir)
+    # The builds print progress; keep only the result line on stdout
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    start = time.perf_counter()
+    if args.mode == "batch":
+        run_batch(args.docs, persist_dir, args.fetch_latency_ms / 1000)
+    else:
+        run_pipeline(args.docs, persist_dir, args.fetch_latency_ms / 1000, args.embed_workers)
+    wall = time.perf_counter() - start
+    manifest = json.loads((persist_dir / "manifest.json").read_text())
+    current = next(s for s in manifest["snapshots"] if s["version"] == manifest["current"])
+    sys.stdout = stdout
+    print(json.dumps({
+        "wall": wall,
+        "rss_mb": peak_rss_mb(),
+        "chunks": current["count"],
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=Path, default=ROOT / "rag" / "rag_docs")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--fetch-latency-ms", type=float, default=50.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=100.0)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--mode", choices=["batch", "pipeline"], help=argparse.SUPPRESS)
+    parser.add_argument("--persist-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        child(args)
+        return
+
+    from fake_embedding_server import start_server
+
+    _, embed_url = start_server(dims=args.dims, latency_ms=args.embed_latency_ms)
+    env = {**os.environ, "OPENAI_API_KEY": "fake", "OPENAI_API_BASE": embed_url}
+    print(f"{'docs':>6}{'mode':>10}{'chunks':>8}{'wall s':>9}{'peak RSS MB':>13}")
+    for copies in args.copies:
+        with tempfile.TemporaryDirectory() as tmp:
+            docs = Path(tmp) / "docs"
+            count = copy_corpus(args.docs, docs, copies)
+            for mode in ("batch", "pipeline"):
+                work = Path(tmp) / mode
+                work.mkdir()
+                out = subprocess.run(
+                    [
+                        sys.executable, __file__, "--mode", mode, "--docs", str(docs),
+                        "--persist-dir", str(work / "index"),
+                        "--fetch-latency-ms", str(args.fetch_latency_ms),
+                        "--embed-workers", str(args.embed_workers),
+                    ],
+                    env=env, cwd=ROOT, capture_output=True, text=True,
+                )
+                if out.returncode != 0:
+                    raise SystemExit(out.stderr)
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{count:>6}{mode:>10}{result['chunks']:>8}{result['wall']:>9.1f}{result['rss_mb']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Size and materialization cost of the chunk store variants.
+
+Rewrites the chunk texts of an existing serving export (or a synthetic
+corpus) as an uncompressed and a zstd-compressed node store, then reports
+blob and metadata size and the time and traced allocations to materialize
+the ``--top-k`` chunks of a random query. Legacy (pre-interning) metadata
+size is shown for comparison.
+
+Usage (from the repo root):
+    python benchmarks/bench_node_store.py --serving-dir rag_service/rag_index_morechunked/snapshots/<version>
+    python benchmarks/bench_node_store.py --synthetic 20000
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+
+from node_store import NodeStore, write_node_store  # noqa: E402
+
+
+def load_corpus(serving_dir: Path) -> tuple[list[str], list[dict]]:
+    store = NodeStore(serving_dir)
+    texts = [store.text(row) for row in range(len(store))]
+    metadata = [
+        {"source_url": store.source(row), "county": store.county(row), "topic": store.topic(row)}
+        for row in range(len(store))
+    ]
+    return texts, metadata
+
+
+def synthetic_corpus(n: int) -> tuple[list[str], list[dict]]:
+    rng = np.random.default_rng(0)
+    words = (
+        "recycling batteries plastic containers accepted curbside drop-off county "
+        "residents transfer station hazardous waste electronics collection schedule"
+    ).split()
+    texts = [" ".join(rng.choice(words, 120)) for _ in range(n)]
+    metadata = [
+        {"source_url": f"https://example.gov/page{i // 8}", "county": f"county{i % 62}", "topic": f"page{i // 8}"}
+        for i in range(n)
+    ]
+    return texts, metadata
+
+
+def measure(store: NodeStore, queries: int, top_k: int) -> tuple[float, float]:
+    rng = np.random.default_rng(1)
+    rows = rng.integers(0, len(store), size=(queries, top_k))
+    start = time.perf_counter()
+    for query_rows in rows:
+        " ".join(store.chunk(int(row)).text for row in query_rows)
+    per_query_us = (time.perf_counter() - start) / queries * 1e6
+
+    tracemalloc.start()
+    for query_rows in rows[:50]:
+        " ".join(store.chunk(int(row)).text for row in query_rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_query_us, peak / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--serving-dir", type=Path)
+    source.add_argument("--synthetic", type=int, metavar="N")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=15)
+    args = parser.parse_args()
+
+    texts, metadata = (
+        load_corpus(args.serving_dir) if args.serving_dir else synthetic_corpus(args.synthetic)
+    )
+    legacy_meta = len(json.dumps({
+        "sources": [md.get("source_url") for md in metadata],
+        "counties": [md.get("county") for md in metadata],
+        "topics": [md.get("topic") for md in metadata],
+    }))
+    print(f"{len(texts)} chunks, {sum(len(t.encode()) for t in texts) / 1e6:.1f} MB of text; "
+          f"legacy per-row metadata {legacy_meta / 1024:.0f} KB")
+    print(f"{'store':<8}{'blob MB':>10}{'meta KB':>10}{'us/query':>10}{'peak alloc KB':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression in (None, "zstd"):
+            out = Path(tmp) / str(compression)
+            write_node_store(out, texts, metadata, compression)
+            store = NodeStore(out)
+            meta_kb = ((out / "chunk_meta.json").stat().st_size + (out / "chunk_fields.npy").stat().st_size) / 1024
+            per_query_us, peak_kb = measure(store, args.queries, args.top_k)
+            print(
+                f"{compression or 'plain':<8}{store.blob_bytes / 1e6:>10.2f}{meta_kb:>10.0f}"
+                f"{per_query_us:>10.1f}{peak_kb:>15.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Latency and goodput of ``/query`` under overload, with and without load shedding.
+
+Builds a synthetic serving snapshot, starts ``fake_embedding_server.py`` and
+runs the service with uvicorn in a child process, once with admission
+control and deadlines effectively off (the old behaviour) and once with the
+defaults. Each run measures the service's sequential throughput, then offers
+``--overload`` times that rate in an open loop for ``--seconds``. Every
+client gives up after ``--timeout-ms`` like the Node backend does, and sends
+``X-Request-Timeout-Ms``.
+
+The report counts answers that arrived in time (ok, partial), fast 503s,
+and client timeouts, plus latency percentiles of the answers. Without
+shedding the queue grows until nearly every request times out. With it, the
+admitted requests stay fast and the excess is refused right away.
+
+Usage (from the repo root):
+    python benchmarks/bench_overload.py --chunks 100000 --overload 3
+"""
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from dense_index import normalize_rows, write_dense_index  # noqa: E402
+from fake_embedding_server import start_server  # noqa: E402
+from node_store import write_node_store  # noqa: E402
+from snapshots import new_version, publish_snapshot, snapshot_dir  # noqa: E402
+
+SCENARIOS = {
+    "no shedding": {
+        "RAG_MAX_INFLIGHT_QUERIES": "100000",
+        "RAG_MAX_QUEUED_QUERIES": "100000",
+        "RAG_QUERY_TIMEOUT_SECONDS": "0",
+    },
+    "deadline + admission": {},
+}
+
+
+def build(root: Path, chunks: int, dims: int) -> None:
+    rng = np.random.default_rng(0)
+    vectors = normalize_rows(rng.standard_normal((chunks, dims)).astype(np.float32))
+    version = new_version(root)
+    out = snapshot_dir(root, version)
+    meta = write_dense_index(out, [str(i) for i in range(chunks)], vectors, "int8")
+    write_node_store(out, ["recycling rules " * 40] * chunks, [{"county": "albany"}] * chunks)
+    publish_snapshot(root, version, {"count": meta["count"]})
+
+
+def serve(root: str, port: int, env: dict) -> None:
+    os.environ.update(env)
+    # The service logs every query; keep the report readable
+    sys.stdout = open(os.devnull, "w")
+    import uvicorn
+
+    import index_manager
+    import rag_query
+
+    rag_query._index_manager = index_manager.IndexManager(Path(root))
+    import app
+
+    uvicorn.run(app.app, host="127.0.0.1", port=port, log_level="error")
+
+
+async def wait_ready(base: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(200):
+            try:
+                if (await client.get(f"{base}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError("service did not start")
+
+
+async def query(client: httpx.AsyncClient, base: str, i: int, timeout_ms: float, send_deadline: bool):
+    headers = {"X-Request-Timeout-Ms": str(timeout_ms - 50)} if send_deadline else {}
+    start = time.perf_counter()
+    try:
+        # Total deadline like the Node client's AbortSignal (httpx timeouts are per read)
+        response = await asyncio.wait_for(
+            client.post(
+                f"{base}/query",
+                json={"material": f"widget {i}", "location": "Albany, NY"},
+                headers=headers,
+            ),
+            timeout_ms / 1000,
+        )
+    except asyncio.TimeoutError:
+        return "timeout", None
+    except httpx.TransportError:
+        return "error", None
+    elapsed = time.perf_counter() - start
+    if response.status_code == 503:
+        return "shed", elapsed
+    return ("partial" if response.json().get("partial") else "ok"), elapsed
+
+
+async def measure(base: str, args, send_deadline: bool) -> tuple[float, dict]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        # Capacity: closed loop of concurrent clients, each waiting for its answer
+        done = 0
+        stop = time.perf_counter() + 3.0
+
+        async def closed_loop() -> None:
+            nonlocal done
+            while time.perf_counter() < stop:
+                done += 1
+                await query(client, base, -done, 60_000, False)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(closed_loop() for _ in range(16)))
+        capacity = done / (time.perf_counter() - start)
+
+        rate = capacity * args.overload
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(rate * args.seconds)):
+            await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+            tasks.append(asyncio.ensure_future(query(client, base, i, args.timeout_ms, send_deadline)))
+        results = await asyncio.gather(*tasks)
+    kinds = ("ok", "partial", "shed", "timeout", "error")
+    return capacity, {kind: [t for k, t in results if k == kind] for kind in kinds}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--overload", type=float, default=3.0, help="offered load / measured capacity")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--timeout-ms", type=float, default=1000.0, help="client timeout")
+    parser.add_argument("--port", type=int, default=8013)
+    args = parser.parse_args()
+
+    _, embed_url = start_server(dims=args.dims, latency_ms=args.embed_latency_ms)
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        build(Path(tmp), args.chunks, args.dims)
+        print(
+            f"{'scenario':<22}{'cap/s':>7}{'offered':>9}{'ok/s':>7}{'partial':>9}{'503':>6}"
+            f"{'timeout':>9}{'error':>7}{'p50 ms':>8}{'p99 ms':>8}{'503 p50':>9}"
+        )
+        for label, overrides in SCENARIOS.items():
+            env = {"OPENAI_API_KEY": "fake", "OPENAI_BASE_URL": embed_url, **overrides}
+            proc = ctx.Process(target=serve, args=(tmp, args.port, env), daemon=True)
+            proc.start()
+            base = f"http://127.0.0.1:{args.port}"
+            try:
+                asyncio.run(wait_ready(base))
+                capacity, out = asyncio.run(measure(base, args, send_deadline=label != "no shedding"))
+            finally:
+                proc.terminate()
+                proc.join()
+            answered = out["ok"] + out["partial"]
+            p50, p99 = np.percentile(answered, [50, 99]) * 1e3 if answered else (float("nan"),) * 2
+            shed_p50 = np.percentile(out["shed"], 50) * 1e3 if out["shed"] else float("nan")
+            offered = sum(len(v) for v in out.values())
+            print(
+                f"{label:<22}{capacity:>7.0f}{offered:>9}{len(out['ok']) / args.seconds:>7.0f}"
+                f"{len(out['partial']):>9}{len(out['shed']):>6}{len(out['timeout']):>9}{len(out['error']):>7}"
+                f"{p50:>8.0f}{p99:>8.0f}{shed_p50:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
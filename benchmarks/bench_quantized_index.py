@@ -0,0 +1,122 @@
+"""Recall and latency of quantized serving indexes against full precision.
+
+Builds serving exports (rag_service/dense_index.py) for several
+quantization / dimension settings from the same vectors and compares their
+top-k against exact float32 cosine search.
+
+Vectors come from an existing llama_index persist dir (``--persist-dir``,
+needs ``default__vector_store.json``) or are synthetic (``--synthetic N``):
+clustered, low-rank vectors shaped like text embeddings. Queries are noisy
+copies of random corpus vectors.
+
+Usage (from the repo root):
+    python benchmarks/bench_quantized_index.py --synthetic 5000
+    python benchmarks/bench_quantized_index.py --persist-dir rag_service/rag_index_morechunked
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+
+from dense_index import DenseIndex, normalize_rows, write_dense_index  # noqa: E402
+
+CONFIGS = [
+    ("float32", None),
+    ("float16", None),
+    ("int8", None),
+    ("float16", 512),
+    ("int8", 512),
+    ("int8", 256),
+]
+
+
+def load_vectors(persist_dir: Path) -> np.ndarray:
+    with open(persist_dir / "default__vector_store.json", encoding="utf-8") as f:
+        embedding_dict = json.load(f)["embedding_dict"]
+    return np.array(list(embedding_dict.values()), dtype=np.float32)
+
+
+def synthetic_vectors(n: int, dims: int, rng: np.random.Generator) -> np.ndarray:
+    latent, clusters = 96, 64
+    basis = rng.standard_normal((latent, dims)).astype(np.float32)
+    centers = rng.standard_normal((clusters, latent)).astype(np.float32) * 2.0
+    assign = rng.integers(0, clusters, n)
+    coords = centers[assign] + rng.standard_normal((n, latent)).astype(np.float32)
+    noise = rng.standard_normal((n, dims)).astype(np.float32) * 0.3
+    return normalize_rows(coords @ basis + noise)
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1e3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--persist-dir", type=Path)
+    source.add_argument("--synthetic", type=int, metavar="N")
+    parser.add_argument("--dims", type=int, default=1536, help="synthetic dims")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.persist_dir:
+        vectors = normalize_rows(load_vectors(args.persist_dir))
+    else:
+        vectors = synthetic_vectors(args.synthetic, args.dims, rng)
+    n, dims = vectors.shape
+
+    picks = rng.integers(0, n, args.queries)
+    queries = normalize_rows(
+        vectors[picks] + rng.standard_normal((args.queries, dims)).astype(np.float32)
+        * args.noise / np.sqrt(dims) * 8
+    )
+    truth = [set(np.argsort(-(vectors @ q))[: args.top_k]) for q in queries]
+    node_ids = [str(i) for i in range(n)]
+
+    print(f"{n} vectors x {dims} dims, {args.queries} queries, top_k={args.top_k}")
+    python_floats_mb = n * dims * 32 / 1e6  # float object + list slot after JSON load
+    print(f"JSON-loaded Python float lists: ~{python_floats_mb:.1f} MB\n")
+    header = f"{'config':<16}{'resident MB':>12}{'vs f32':>8}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+    print("-" * len(header))
+
+    baseline_mb = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantization, reduced in CONFIGS:
+            if reduced and reduced >= dims:
+                continue
+            out_dir = Path(tmp) / f"{quantization}-{reduced or dims}"
+            write_dense_index(out_dir, node_ids, vectors, quantization, reduced)
+            index = DenseIndex(out_dir)
+            index.search(queries[0], args.top_k)  # warm up
+
+            latencies, hits = [], 0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = index.search(q, args.top_k)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & {row for row, _ in result})
+
+            resident_mb = index.resident_bytes / 1e6
+            baseline_mb = baseline_mb or resident_mb
+            label = f"{quantization}/{reduced or dims}"
+            print(
+                f"{label:<16}{resident_mb:>12.2f}{baseline_mb / resident_mb:>7.1f}x"
+                f"{hits / (len(truth) * args.top_k):>10.3f}"
+                f"{percentile_ms(latencies, 50):>9.2f}{percentile_ms(latencies, 95):>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
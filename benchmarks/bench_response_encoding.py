@@ -0,0 +1,98 @@
+"""Serialization time and bytes on the wire of typical ``/query`` responses.
+
+Builds responses like the service's (``--chunks`` chunks of
+~``--chunk-chars`` characters from the markdown corpus plus their source
+URLs) and compares the old FastAPI path (Pydantic model ->
+``jsonable_encoder`` -> ``json.dumps``) with ``FastJSONResponse`` (orjson
+from a dict), then the size and cost of each negotiated compression.
+
+Usage (from the repo root):
+    python benchmarks/bench_response_encoding.py --responses 500
+"""
+import argparse
+import gzip
+import random
+import sys
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from bench_text_normalize import load_chunks  # noqa: E402
+from responses import (  # noqa: E402
+    BROTLI_AVAILABLE,
+    BROTLI_QUALITY,
+    GZIP_LEVEL,
+    ORJSON_AVAILABLE,
+    FastJSONResponse,
+    compress,
+)
+from text_normalize import CHUNK_SEPARATOR  # noqa: E402
+
+
+class RAGQueryResponse(BaseModel):
+    """Same fields as app.RAGQueryResponse (importing app would load the index)."""
+
+    regulations: str
+    sources: list[str]
+    partial: bool = False
+
+
+def timed(fn, items) -> tuple[float, list]:
+    start = time.perf_counter()
+    out = [fn(item) for item in items]
+    return (time.perf_counter() - start) / len(items) * 1e6, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=Path, default=ROOT / "rag" / "rag_docs")
+    parser.add_argument("--chunks", type=int, default=15, help="chunks per response")
+    parser.add_argument("--chunk-chars", type=int, default=3200)
+    parser.add_argument("--responses", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.docs, args.chunk_chars)
+    rng = random.Random(args.seed)
+    payloads = []
+    for _ in range(args.responses):
+        picked = rng.sample(range(len(chunks)), args.chunks)
+        payloads.append({
+            "regulations": CHUNK_SEPARATOR.join(chunks[i] for i in picked),
+            "sources": [f"https://www.example-county.gov/recycling/page{i}" for i in picked],
+            "partial": False,
+        })
+
+    print(f"orjson: {ORJSON_AVAILABLE}, brotli: {BROTLI_AVAILABLE}")
+    print(f"{'serialization':<34}{'us/response':>12}{'KB':>8}")
+    old_us, old_bodies = timed(
+        lambda p: JSONResponse(jsonable_encoder(RAGQueryResponse(**p))).body, payloads
+    )
+    new_us, bodies = timed(lambda p: FastJSONResponse(p).body, payloads)
+    raw_kb = sum(map(len, bodies)) / len(bodies) / 1024
+    print(f"{'pydantic + jsonable_encoder + json':<34}{old_us:>12.1f}{sum(map(len, old_bodies)) / len(old_bodies) / 1024:>8.1f}")
+    print(f"{'FastJSONResponse (dict)':<34}{new_us:>12.1f}{raw_kb:>8.1f}   {old_us / new_us:.1f}x faster")
+
+    print(f"\n{'compression':<34}{'us/response':>12}{'KB':>8}{'ratio':>8}")
+    variants = [(f"gzip (level {GZIP_LEVEL}, served)", lambda b: compress(b, "gzip"))]
+    variants.append(("gzip (level 1)", lambda b: gzip.compress(b, compresslevel=1, mtime=0)))
+    if BROTLI_AVAILABLE:
+        import brotli
+
+        variants.insert(0, (f"br (quality {BROTLI_QUALITY}, served)", lambda b: compress(b, "br")))
+        variants.append(("br (quality 11)", lambda b: brotli.compress(b, quality=11)))
+    for label, fn in variants:
+        us, out = timed(fn, bodies[: min(len(bodies), 200)])
+        kb = sum(map(len, out)) / len(out) / 1024
+        print(f"{label:<34}{us:>12.1f}{kb:>8.1f}{raw_kb / kb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
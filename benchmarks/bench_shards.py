@@ -0,0 +1,104 @@
+"""Memory of a worker serving per-county shards versus one monolithic export.
+
+Builds a synthetic corpus of ``--counties`` counties (``--chunks`` chunks
+each) both as one export and as a sharded snapshot, then runs queries for
+only ``--active`` of the counties in a fresh process per layout and reports
+resident memory (RSS, PSS), shards mapped and latency. With shards, memory
+follows the active counties; the monolithic export scans the whole matrix on
+every query.
+
+Usage (from the repo root, Linux):
+    python benchmarks/bench_shards.py --counties 60 --chunks 1000 --active 3
+"""
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from bench_workers import memory_kb  # noqa: E402
+from dense_index import normalize_rows, write_dense_index  # noqa: E402
+from node_store import write_node_store  # noqa: E402
+from shards import ShardSet  # noqa: E402
+from snapshots import SHARDS_DIR, write_shards_manifest  # noqa: E402
+
+
+def build(root: Path, counties: int, chunks: int, dims: int, quantization: str) -> None:
+    rng = np.random.default_rng(0)
+    texts = ["recycling rules " * 40] * chunks
+    shards = {}
+    everything = []
+    for c in range(counties):
+        name = f"county{c}"
+        vectors = normalize_rows(rng.standard_normal((chunks, dims)).astype(np.float32))
+        everything.append(vectors)
+        ids = [f"{name}-{i}" for i in range(chunks)]
+        out = root / "sharded" / SHARDS_DIR / name
+        meta = write_dense_index(out, ids, vectors, quantization)
+        write_node_store(out, texts, [{"county": name}] * chunks)
+        shards[name] = {"count": meta["count"]}
+    write_shards_manifest(root / "sharded", shards, None)
+
+    vectors = np.concatenate(everything)
+    ids = [str(i) for i in range(len(vectors))]
+    write_dense_index(root / "monolithic", ids, vectors, quantization)
+    metadata = [{"county": f"county{c}"} for c in range(counties) for _ in range(chunks)]
+    write_node_store(root / "monolithic", texts * counties, metadata)
+
+
+def worker(path: str, active: int, queries: int, budget_mb: float, results) -> None:
+    shard_set = ShardSet(Path(path), budget_bytes=int(budget_mb * 1e6))
+    dims = None
+    rng = np.random.default_rng(1)
+    start = time.perf_counter()
+    for i in range(queries):
+        county = f"county{i % active}"
+        for name in shard_set.for_county(county):
+            shard = shard_set.get(name)
+            dims = dims or shard.dense_index.vectors_full.shape[1]
+            for row, score in shard.dense_index.search(rng.standard_normal(dims).astype(np.float32), 15):
+                shard.node_store.chunk(row, score)
+    elapsed = time.perf_counter() - start
+    results.put((elapsed / queries * 1e3, memory_kb(), shard_set.stats()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counties", type=int, default=60)
+    parser.add_argument("--chunks", type=int, default=1000, help="per county")
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--quantize", default="int8")
+    parser.add_argument("--active", type=int, default=3, help="counties receiving queries")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--budget-mb", type=float, default=256)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        build(root, args.counties, args.chunks, args.dims, args.quantize)
+        print(f"{'layout':<12}{'ms/query':>10}{'RSS MB':>10}{'PSS MB':>10}{'mapped':>8}{'loads':>7}")
+        for layout in ("monolithic", "sharded"):
+            results = ctx.Queue()
+            proc = ctx.Process(
+                target=worker, args=(str(root / layout), args.active, args.queries, args.budget_mb, results)
+            )
+            proc.start()
+            ms, mem, stats = results.get()
+            proc.join()
+            rss = (mem.get("RssAnon", 0) + mem.get("RssFile", 0)) / 1024
+            print(
+                f"{layout:<12}{ms:>10.2f}{rss:>10.1f}{mem.get('Pss', 0) / 1024:>10.1f}"
+                f"{len(stats['loaded']):>8}{stats['loads']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Startup time and baseline memory of the RAG service process.
+
+Measures, in a fresh interpreter per run, the time to ``import app`` (all
+module-level imports of the service), the time to map the serving index
+when it exists, peak RSS and the number of loaded modules. ``--compare-ref``
+repeats the measurement on ``rag_service/`` as of another git revision
+(e.g. the llama_index-based service) for a before/after comparison.
+
+Usage (from the repo root):
+    python benchmarks/bench_startup.py --compare-ref 0bf5ab2 --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+loaded = imported
+load = getattr(app, "load_serving_index", None)
+if load is not None:
+    try:
+        load()
+        loaded = time.perf_counter()
+    except Exception:
+        pass
+print(json.dumps({
+    "import_s": imported - start,
+    "load_s": loaded - imported,
+    # KiB on Linux, bytes on macOS
+    "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def measure(service_dir: Path, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD],
+            cwd=service_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+def checkout_service(ref: str, dest: Path) -> Path:
+    archive = subprocess.run(
+        ["git", "archive", ref, "rag_service"], cwd=ROOT, capture_output=True, check=True
+    ).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(dest)
+    return dest / "rag_service"
+
+
+def report(label: str, result: dict) -> None:
+    print(
+        f"{label:<24}{result['import_s'] * 1e3:>12.0f}{result['load_s'] * 1e3:>10.1f}"
+        f"{result['maxrss_mb']:>12.1f}{result['modules']:>10.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--compare-ref", help="git revision to measure as 'before'")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'service':<24}{'import ms':>12}{'load ms':>10}{'peak RSS MB':>12}{'modules':>10}")
+    if args.compare_ref:
+        with tempfile.TemporaryDirectory() as tmp:
+            report(args.compare_ref, measure(checkout_service(args.compare_ref, Path(tmp)), args.runs))
+    report("working tree", measure(ROOT / "rag_service", args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Micro-benchmark: request-time link stripping vs build-time normalization.
+
+Simulates the per-request text assembly of ``query_rag`` over the markdown
+corpus: ``--chunks`` chunks of ~``--chunk-chars`` characters are joined and
+cleaned the old way (five ``re.sub`` passes over the joined text), with the
+per-chunk normalization, and by concatenating precomputed display text.
+
+Usage (from the repo root):
+    python benchmarks/bench_text_normalize.py --chunks 15 --requests 2000
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+
+from text_normalize import CHUNK_SEPARATOR, normalize_display_text  # noqa: E402
+
+
+def strip_links(text: str) -> str:
+    """The request-time cleanup ``app.py`` used before the normalization stage."""
+    if not text:
+        return ""
+    text = re.sub(r"\(\s*\[[^\]]+\]\((https?:\/\/[^\s)]+)\)\s*\)", "", text)
+    text = re.sub(r"\[[^\]]+\]\((https?:\/\/[^\s)]+)\)", "", text)
+    text = re.sub(r"https?:\/\/\S+", "", text)
+    text = re.sub(r"\s+([.,;:])", r"\1", text)
+    text = re.sub(r"\s{2,}", " ", text)
+    return text.strip()
+
+
+def load_chunks(docs_dir: Path, chunk_chars: int) -> list[str]:
+    chunks: list[str] = []
+    for path in sorted(docs_dir.glob("*.md")):
+        text = path.read_text(encoding="utf-8")
+        for start in range(0, len(text), chunk_chars):
+            chunk = text[start : start + chunk_chars]
+            if chunk.strip():
+                chunks.append(chunk)
+    return chunks
+
+
+def bench(label: str, fn, batches: list, baseline_us: float | None = None) -> float:
+    start = time.perf_counter()
+    for batch in batches:
+        fn(batch)
+    per_request_us = (time.perf_counter() - start) / len(batches) * 1e6
+    saved = ""
+    if baseline_us:
+        saved = f"  ({baseline_us - per_request_us:8.1f} us saved, {baseline_us / per_request_us:5.1f}x)"
+    print(f"{label:<40} {per_request_us:10.1f} us/request{saved}")
+    return per_request_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=Path, default=ROOT / "rag" / "rag_docs")
+    parser.add_argument("--chunks", type=int, default=15, help="chunks per request")
+    parser.add_argument("--chunk-chars", type=int, default=3200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.docs, args.chunk_chars)
+    rng = random.Random(args.seed)
+    batches = [rng.sample(range(len(chunks)), args.chunks) for _ in range(args.requests)]
+
+    raw_batches = [[chunks[i] for i in batch] for batch in batches]
+    build_start = time.perf_counter()
+    display = [normalize_display_text(c) for c in chunks]
+    build_s = time.perf_counter() - build_start
+    display_batches = [[display[i] for i in batch] for batch in batches]
+
+    print(
+        f"{len(chunks)} chunks, {args.chunks} chunks/request, {args.requests} requests; "
+        f"build-time normalization of the corpus took {build_s * 1e3:.1f} ms"
+    )
+    baseline = bench(
+        "old: strip_links(join)", lambda b: strip_links("\n\n".join(b)), raw_batches
+    )
+    bench(
+        "fallback: normalize_display_text per chunk",
+        lambda b: CHUNK_SEPARATOR.join(normalize_display_text(c) for c in b),
+        raw_batches,
+        baseline,
+    )
+    bench(
+        "new: join precomputed display text",
+        lambda b: CHUNK_SEPARATOR.join(b),
+        display_batches,
+        baseline,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Per-worker memory and throughput of the serving index across processes.
+
+Starts 1, 2, 4, ... worker processes (like ``uvicorn --workers N``), each of
+which opens the serving export and runs searches with random query vectors,
+materializing the returned chunks. Reports throughput and per-worker memory:
+anonymous (private) RSS, file-backed RSS and PSS, which splits shared pages
+between the processes mapping them.
+
+``--mode private`` loads every array and the chunk blob into process memory
+instead of mapping them, which approximates the old per-worker copy.
+
+Usage (from the repo root, Linux):
+    python benchmarks/bench_workers.py --synthetic 20000 --workers 1 2 4
+    python benchmarks/bench_workers.py --serving-dir rag_service/rag_index_morechunked/serving
+"""
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "rag_service"))
+
+from dense_index import DenseIndex, normalize_rows, write_dense_index  # noqa: E402
+from node_store import NodeStore, write_node_store  # noqa: E402
+
+
+def memory_kb() -> dict:
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                out[key] = int(value.split()[0])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    out["Pss"] = int(line.split()[1])
+    except OSError:
+        out["Pss"] = 0
+    return out
+
+
+def worker(serving_dir: str, mode: str, queries: int, top_k: int, barrier, results) -> None:
+    index = DenseIndex(Path(serving_dir))
+    store = NodeStore(Path(serving_dir))
+    if mode == "private":
+        index.vectors_q = np.array(index.vectors_q)
+        index.vectors_full = np.array(index.vectors_full)
+        store._blob = bytes(store._blob)
+    dims = index.vectors_full.shape[1]
+    rng = np.random.default_rng()
+    barrier.wait()
+    start = time.perf_counter()
+    for _ in range(queries):
+        hits = index.search(rng.standard_normal(dims).astype(np.float32), top_k)
+        " ".join(store.chunk(row, score).text for row, score in hits)
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, memory_kb()))
+
+
+def synthetic_export(out_dir: Path, n: int, dims: int, quantization: str) -> None:
+    rng = np.random.default_rng(0)
+    vectors = normalize_rows(rng.standard_normal((n, dims)).astype(np.float32))
+    write_dense_index(out_dir, [str(i) for i in range(n)], vectors, quantization)
+    words = "recycling batteries plastic containers accepted curbside drop-off county".split()
+    texts = [" ".join(rng.choice(words, 500)) for _ in range(n)]
+    metadata = [{"source_url": f"https://example.gov/{i}", "county": "albany"} for i in range(n)]
+    write_node_store(out_dir, texts, metadata)
+
+
+def run(serving_dir: Path, workers: int, mode: str, queries: int, top_k: int) -> None:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers + 1)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(str(serving_dir), mode, queries, top_k, barrier, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    stats = [results.get() for _ in procs]
+    wall = time.perf_counter() - start
+    for p in procs:
+        p.join()
+
+    mem = {key: np.mean([m.get(key, 0) for _, m in stats]) / 1024 for key in ("RssAnon", "RssFile", "Pss")}
+    print(
+        f"{mode:<8}{workers:>8}{workers * queries / wall:>12.0f}"
+        f"{mem['RssAnon']:>12.1f}{mem['RssFile']:>12.1f}{mem['Pss']:>10.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--serving-dir", type=Path)
+    source.add_argument("--synthetic", type=int, metavar="N")
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--quantize", default="int8")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--mode", choices=("mmap", "private", "both"), default="both")
+    parser.add_argument("--queries", type=int, default=200, help="per worker")
+    parser.add_argument("--top-k", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        serving_dir = args.serving_dir
+        if serving_dir is None:
+            serving_dir = Path(tmp)
+            synthetic_export(serving_dir, args.synthetic, args.dims, args.quantize)
+
+        print(f"{'mode':<8}{'workers':>8}{'queries/s':>12}{'anon MB':>12}{'file MB':>12}{'PSS MB':>10}")
+        modes = ("mmap", "private") if args.mode == "both" else (args.mode,)
+        for mode in modes:
+            for workers in args.workers:
+                run(serving_dir, workers, mode, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
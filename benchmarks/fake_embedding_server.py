@@ -0,0 +1,142 @@
+"""Local stand-in for the OpenAI embeddings endpoint.
+
+Serves ``POST /v1/embeddings`` with deterministic hashed bag-of-words
+vectors (texts sharing words get similar vectors), and can inject latency,
+a slow tail and errors, so the service's embedding client (timeouts,
+hedging, circuit breaker) can be exercised without network access:
+
+    python benchmarks/fake_embedding_server.py --port 8009 --tail-prob 0.05 --tail-ms 2000
+    OPENAI_BASE_URL=http://127.0.0.1:8009/v1 OPENAI_API_KEY=fake uvicorn app:app
+
+Standard library plus NumPy only.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def fake_embedding(text: str, dims: int) -> np.ndarray:
+    """Unit vector hashing each word to a signed dimension."""
+    vector = np.zeros(dims, dtype=np.float32)
+    for token in _TOKEN.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dims
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+@dataclass
+class Behaviour:
+    dims: int = 1536
+    latency_ms: float = 20.0
+    tail_prob: float = 0.0
+    tail_ms: float = 1000.0
+    error_rate: float = 0.0
+    error_status: int = 503
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+    disable_nagle_algorithm = True
+    behaviour = Behaviour()
+    requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with Handler._lock:
+            Handler.requests += 1
+        if self.path.rstrip("/") not in ("/v1/embeddings", "/embeddings"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+
+        b = self.behaviour
+        delay = b.latency_ms
+        if random.random() < b.tail_prob:
+            delay = b.tail_ms
+        time.sleep(delay / 1000)
+        if random.random() < b.error_rate:
+            self._send(b.error_status, {"error": {"message": "injected failure"}})
+            return
+
+        texts = request.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(t, b.dims).tolist()}
+            for i, t in enumerate(texts)
+        ]
+        self._send(200, {"object": "list", "data": data, "model": request.get("model")})
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients that hang up on slow responses (timeouts, hedge losers) are expected
+        pass
+
+
+def start_server(port: int = 0, **behaviour) -> tuple[Server, str]:
+    """Start the server in a daemon thread; returns it and its ``/v1`` base URL."""
+    Handler.behaviour = Behaviour(**behaviour)
+    server = Server(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8009)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="share of slow responses")
+    parser.add_argument("--tail-ms", type=float, default=1000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server, url = start_server(
+        args.port,
+        dims=args.dims,
+        latency_ms=args.latency_ms,
+        tail_prob=args.tail_prob,
+        tail_ms=args.tail_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    print(f"Fake embeddings endpoint at {url}/embeddings (Ctrl-C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
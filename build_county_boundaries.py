@@ -0,0 +1,107 @@
+"""Build rag_service/county_boundaries.json.gz from Census county boundaries.
+
+Reads a Census cartographic boundary county file, either the shapefile
+(``cb_<year>_us_county_500k.shp``; needs ``pyshp``) or its GeoJSON
+conversion, keeps the counties of one state and writes their rings as
+delta-encoded integer coordinates (1e-5 degrees, about a metre). Each county
+is keyed by its shard name, looked up in ``rag_service/counties.yaml``, so
+the service's point-in-polygon lookups (``rag_service/county_geo.py``)
+return the same keys as its location text detector.
+
+The 500k files are clipped to the shoreline, so points a little off the coast
+are outside every county; the service snaps those to the nearest boundary
+within ``RAG_GEO_SNAP_KM``.
+
+Usage:
+    python build_county_boundaries.py cb_2016_us_county_500k.shp
+    python build_county_boundaries.py counties.geojson --state 36
+"""
+import argparse
+import gzip
+import json
+from pathlib import Path
+
+from rag_service.counties import COUNTIES_PATH, CountyDetector
+from rag_service.county_geo import BOUNDARIES_PATH, COORDINATE_SCALE
+
+NEW_YORK_FIPS = "36"
+
+
+def read_counties(path: Path, state: str) -> list[tuple[str, list[list[tuple[float, float]]]]]:
+    """``(county name, rings)`` of every county of ``state`` in a shapefile or GeoJSON file."""
+    counties = []
+    if path.suffix.lower() == ".shp":
+        import shapefile
+
+        with shapefile.Reader(str(path)) as reader:
+            for record in reader.iterShapeRecords():
+                if record.record["STATEFP"] != state:
+                    continue
+                points = record.shape.points
+                bounds = list(record.shape.parts) + [len(points)]
+                rings = [points[start:end] for start, end in zip(bounds, bounds[1:])]
+                counties.append((record.record["NAME"], rings))
+        return counties
+
+    with open(path, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    for feature in features:
+        props = feature["properties"]
+        if props.get("STATEFP") != state:
+            continue
+        geometry = feature["geometry"]
+        polygons = geometry["coordinates"]
+        if geometry["type"] == "Polygon":
+            polygons = [polygons]
+        counties.append((props["NAME"], [ring for polygon in polygons for ring in polygon]))
+    return counties
+
+
+def encode_ring(ring: list[tuple[float, float]]) -> list[int]:
+    """Flat ``[x0, y0, dx1, dy1, ...]`` in 1/COORDINATE_SCALE degrees, without repeated points."""
+    out: list[int] = []
+    last_x = last_y = 0
+    for lon, lat in ring:
+        x, y = round(lon * COORDINATE_SCALE), round(lat * COORDINATE_SCALE)
+        if out and x == last_x and y == last_y:
+            continue
+        out += [x - last_x, y - last_y]
+        last_x, last_y = x, y
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", type=Path, help="Census county .shp or .geojson")
+    parser.add_argument("--state", default=NEW_YORK_FIPS, help="state FIPS code")
+    parser.add_argument("--counties", type=Path, default=COUNTIES_PATH)
+    parser.add_argument("--out", type=Path, default=BOUNDARIES_PATH)
+    args = parser.parse_args()
+
+    detector = CountyDetector.from_file(args.counties)
+    boundaries: dict[str, list[list[int]]] = {}
+    points = 0
+    for name, rings in read_counties(args.source, args.state):
+        key = detector.detect(f"{name} County")
+        if key is None:
+            raise SystemExit(f"{name} County is not in {args.counties}")
+        encoded = [encode_ring(ring) for ring in rings if len(ring) >= 4]
+        boundaries.setdefault(key, []).extend(encoded)
+        points += sum(len(ring) // 2 for ring in encoded)
+
+    missing = sorted(detector.counties - boundaries.keys())
+    if missing:
+        print(f"warning: no boundary for {', '.join(missing)}")
+    data = {
+        "source": args.source.name,
+        "state": args.state,
+        "scale": COORDINATE_SCALE,
+        "counties": dict(sorted(boundaries.items())),
+    }
+    with gzip.open(args.out, "wt", encoding="utf-8", compresslevel=9) as f:
+        json.dump(data, f, separators=(",", ":"))
+    print(f"✓ Wrote {len(boundaries)} counties, {points} points to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
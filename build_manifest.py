@@ -0,0 +1,344 @@
+"""Build manifests: where the time, bytes and tokens of a scrape or index build go.
+
+``load_rag_urls.py`` and ``store_rag_index.py`` time their stages with a
+``BuildProfile`` and write one JSON manifest per run:
+
+- ``stages``: seconds and counters (documents, bytes, chunks, tokens) per
+  stage, e.g. ``fetch`` or ``embed``;
+- ``counties``: the same per county, with the seconds of each stage;
+- ``items``: one record per URL, PDF, embedding batch or shard export, with
+  its seconds, counters and error (if it failed);
+- ``totals``, ``outputs`` (final sizes on disk), ``peak_rss_mb`` and the wall
+  time, plus the git commit, configuration and a hash of the inputs, so two
+  runs can be told apart or compared.
+
+Manifests go to ``build_manifests/<kind>-<time>.json`` unless ``--manifest``
+says otherwise. Comparing two runs (or summarizing one):
+
+    python build_manifest.py build_manifests/index-20250101-120000.json build_manifests/index-20250201-120000.json
+"""
+import argparse
+import hashlib
+import json
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+MANIFEST_FORMAT = 1
+MANIFEST_DIR = Path("./build_manifests")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux but in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def dir_bytes(path: Path) -> int:
+    """Total size of the files under ``path`` (0 if it does not exist)."""
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) if path.is_dir() else 0
+
+
+def inputs_hash(sources: Iterable[str]) -> str:
+    """Short fingerprint of a build's inputs; equal hashes mean the same sources."""
+    digest = hashlib.sha256()
+    for source in sorted(sources):
+        digest.update(source.encode("utf-8") + b"\n")
+    return digest.hexdigest()[:16]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of ``text`` with the tokenizer the sentence splitter chunks by."""
+    from llama_index.core.utils import get_tokenizer
+
+    return len(get_tokenizer()(text))
+
+
+def _add(counters: dict, fields: dict) -> None:
+    for key, value in fields.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            counters[key] = counters.get(key, 0) + value
+
+
+class BuildProfile:
+    """Timings and counters of one build run, written out as its manifest."""
+
+    def __init__(self, kind: str, config: Optional[dict] = None):
+        self.kind = kind
+        self.config = config or {}
+        self.inputs: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc)
+        self.stages: dict[str, dict] = {}
+        self.counties: dict[str, dict] = {}
+        self.items: list[dict] = []
+        self.totals: dict = {}
+        self.outputs: dict = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def record(
+        self, stage: str, seconds: float, county: Optional[str] = None, item: Optional[dict] = None, **counters
+    ) -> None:
+        """
+        Add ``seconds`` and ``counters`` to ``stage`` (and ``county``). With
+        ``item`` (e.g. ``{"source": url}``), also keep a record of this one
+        piece of work.
+        """
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            _add(entry, counters)
+            if county is not None:
+                per_county = self.counties.setdefault(county, {"seconds": 0.0, "stages": {}})
+                per_county["seconds"] += seconds
+                per_county["stages"][stage] = per_county["stages"].get(stage, 0.0) + seconds
+                _add(per_county, counters)
+            if item is not None:
+                record = {"stage": stage, **({"county": county} if county else {}), **item}
+                self.items.append({**record, "seconds": round(seconds, 4), **counters})
+
+    def count(self, stage: str, county: Optional[str] = None, **counters) -> None:
+        """Add counters without time (e.g. chunks per county after one chunking pass)."""
+        with self._lock:
+            _add(self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0}), counters)
+            if county is not None:
+                _add(self.counties.setdefault(county, {"seconds": 0.0, "stages": {}}), counters)
+
+    @contextmanager
+    def stage(self, name: str, county: Optional[str] = None, **item) -> Iterator[dict]:
+        """
+        Time a block as ``name``. Counters put in the yielded dict are added
+        to the stage and county. Keyword arguments (e.g. ``source=url``) make
+        the block an item of the manifest; an exception is recorded on it and
+        re-raised.
+        """
+        counters: dict = {}
+        start = time.perf_counter()
+        try:
+            yield counters
+        except Exception as e:
+            if item:
+                item["error"] = repr(e)
+            counters["errors"] = counters.get("errors", 0) + 1
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, county, item or None, **counters)
+
+    def to_dict(self) -> dict:
+        def rounded(entry: dict) -> dict:
+            return {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+
+        return {
+            "format": MANIFEST_FORMAT,
+            "kind": self.kind,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(self.elapsed, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "inputs": self.inputs,
+            "config": self.config,
+            "totals": self.totals,
+            "outputs": self.outputs,
+            "stages": {name: rounded(entry) for name, entry in self.stages.items()},
+            "counties": {
+                name: {**rounded(entry), "stages": rounded(entry["stages"])}
+                for name, entry in sorted(self.counties.items())
+            },
+            "items": self.items,
+        }
+
+    def write(self, path: Optional[Path] = None) -> Path:
+        """Write the manifest (by default to ``build_manifests/<kind>-<time>.json``)."""
+        if path is None:
+            path = MANIFEST_DIR / f"{self.kind}-{self.started_at.strftime('%Y%m%d-%H%M%S')}.json"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=1, default=str) + "\n", encoding="utf-8")
+        return path
+
+
+@contextmanager
+def embedding_batches(profile: BuildProfile, stage: str = "embed") -> Iterator[None]:
+    """
+    Record every embedding request llama_index makes inside the block (one
+    per ``embed_batch_size`` chunks) as an item of ``stage``, with its texts
+    and tokens.
+    """
+    from llama_index.core.instrumentation import get_dispatcher
+    from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+    from llama_index.core.instrumentation.events.embedding import EmbeddingEndEvent, EmbeddingStartEvent
+
+    started: dict[int, float] = {}  # thread -> start of its current batch
+    batches = 0
+
+    class _BatchRecorder(BaseEventHandler):
+        @classmethod
+        def class_name(cls) -> str:
+            return "BuildProfileBatchRecorder"
+
+        def handle(self, event, **kwargs) -> None:
+            nonlocal batches
+            if isinstance(event, EmbeddingStartEvent):
+                started[threading.get_ident()] = time.perf_counter()
+            elif isinstance(event, EmbeddingEndEvent):
+                start = started.pop(threading.get_ident(), None)
+                if start is None:
+                    return
+                batches += 1
+                profile.record(
+                    stage,
+                    time.perf_counter() - start,
+                    item={"batch": batches},
+                    texts=len(event.chunks),
+                    tokens=sum(count_tokens(chunk) for chunk in event.chunks),
+                )
+
+    dispatcher = get_dispatcher()
+    recorder = _BatchRecorder()
+    dispatcher.add_event_handler(recorder)
+    try:
+        yield
+    finally:
+        dispatcher.event_handlers.remove(recorder)
+
+
+# --- Comparing manifests ---
+
+def _format(value) -> str:
+    if value is None:
+        return ""
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def _delta(old, new) -> str:
+    if old is None or new is None:
+        return ""
+    change = new - old
+    percent = f" ({change / old:+.0%})" if old else ""
+    return f"{'+' if change >= 0 else ''}{_format(change)}{percent}"
+
+
+def _rows(title: str, old: dict, new: dict, keys: list[str]) -> list[str]:
+    lines = [f"\n{title}", f"  {'':<28}{'old':>14}{'new':>14}  change"]
+    for key in keys:
+        a, b = old.get(key), new.get(key)
+        lines.append(f"  {key:<28}{_format(a):>14}{_format(b):>14}  {_delta(a, b)}")
+    return lines
+
+
+def _numbers(entry: dict) -> dict:
+    return {k: v for k, v in entry.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def _run_numbers(manifest: dict) -> dict:
+    return {
+        "wall_seconds": manifest["wall_seconds"],
+        "peak_rss_mb": manifest["peak_rss_mb"],
+        **_numbers(manifest["totals"]),
+        **_numbers(manifest["outputs"]),
+    }
+
+
+def summarize(manifest: dict, top: int = 10) -> str:
+    lines = [
+        f"{manifest['kind']} build of {manifest['started_at']} (commit {manifest.get('git_commit')}, "
+        f"inputs {manifest.get('inputs')}): {manifest['wall_seconds']:.1f} s, "
+        f"peak RSS {manifest['peak_rss_mb']:.0f} MB",
+        "totals: " + ", ".join(f"{k} {v}" for k, v in manifest["totals"].items()),
+        "outputs: " + ", ".join(f"{k} {v}" for k, v in manifest["outputs"].items()),
+        "\nstages:",
+    ]
+    for name, entry in manifest["stages"].items():
+        counters = ", ".join(f"{k} {v}" for k, v in entry.items() if k not in ("seconds", "calls"))
+        lines.append(f"  {name:<16}{entry['seconds']:>9.2f} s {entry['calls']:>6} calls  {counters}")
+    counties = sorted(manifest["counties"].items(), key=lambda kv: -kv[1]["seconds"])
+    if counties:
+        lines.append(f"\nslowest counties (of {len(counties)}):")
+        for name, entry in counties[:top]:
+            stages = ", ".join(f"{k} {v:.2f} s" for k, v in entry["stages"].items())
+            counters = ", ".join(f"{k} {v}" for k, v in entry.items() if k not in ("seconds", "stages"))
+            lines.append(f"  {name:<20}{entry['seconds']:>9.2f} s  ({stages}) {counters}".rstrip())
+    items = sorted(manifest["items"], key=lambda item: -item["seconds"])
+    if items:
+        lines.append(f"\nslowest items (of {len(items)}):")
+        for item in items[:top]:
+            label = item.get("source") or item.get("shard") or f"batch {item.get('batch')}"
+            error = f"  ERROR {item['error']}" if item.get("error") else ""
+            lines.append(f"  {item['stage']:<16}{item['seconds']:>9.2f} s  {label}{error}")
+    return "\n".join(lines)
+
+
+def compare(old: dict, new: dict, top: int = 10) -> str:
+    """Side-by-side table of two manifests of the same kind."""
+    if old["kind"] != new["kind"]:
+        raise ValueError(f"cannot compare a {old['kind']} build with a {new['kind']} build")
+    lines = [
+        f"{old['kind']} builds: {old['started_at']} ({old.get('git_commit')}) -> "
+        f"{new['started_at']} ({new.get('git_commit')})"
+    ]
+    if old.get("inputs") != new.get("inputs"):
+        lines.append("inputs differ between the runs")
+    changed = {
+        k for k in set(old.get("config", {})) | set(new.get("config", {}))
+        if old.get("config", {}).get(k) != new.get("config", {}).get(k)
+    }
+    for key in sorted(changed):
+        lines.append(f"config {key}: {old['config'].get(key)!r} -> {new['config'].get(key)!r}")
+    a, b = _run_numbers(old), _run_numbers(new)
+    lines += _rows("run", a, b, list(dict.fromkeys([*a, *b])))
+    a, b = ({name: entry["seconds"] for name, entry in m["stages"].items()} for m in (old, new))
+    lines += _rows("stage seconds", a, b, list(dict.fromkeys([*a, *b])))
+    a, b = ({name: entry["seconds"] for name, entry in m["counties"].items()} for m in (old, new))
+    # The counties whose time changed most
+    keys = sorted(set(a) | set(b), key=lambda k: -abs(b.get(k, 0.0) - a.get(k, 0.0)))[:top]
+    if keys:
+        lines += _rows(f"county seconds (top {len(keys)} changes)", a, b, keys)
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("manifests", type=Path, nargs="+", help="one manifest to summarize, or two to compare")
+    parser.add_argument("--top", type=int, default=10, help="counties and items to list (default: 10)")
+    args = parser.parse_args()
+    if len(args.manifests) > 2:
+        parser.error("give one or two manifests")
+    manifests = [json.loads(path.read_text(encoding="utf-8")) for path in args.manifests]
+    for path, manifest in zip(args.manifests, manifests):
+        if manifest.get("format") != MANIFEST_FORMAT:
+            sys.exit(f"{path}: unsupported manifest format {manifest.get('format')}")
+    if len(manifests) == 1:
+        print(summarize(manifests[0], args.top))
+    else:
+        print(compare(*manifests, top=args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,572 @@
+"""Build the serving index in one streaming pass: fetch -> clean -> chunk -> embed -> write.
+
+``load_rag_urls.py`` and ``store_rag_index.py`` run as two batches. Every page
+is scraped to disk first. Then the whole corpus is loaded into memory,
+chunked and embedded before anything is written. This command runs the same
+steps as concurrent stages connected by bounded queues:
+
+    sources -> fetch (threads) -> clean -> chunk -> embed (threads) -> write
+
+A full queue blocks the stage feeding it, so at most ``--queue-size`` items
+wait between two stages. The wall time approaches that of the slowest stage
+(usually embedding) instead of the sum of all of them. The write stage
+appends every chunk's vector and text to an on-disk spool per county shard,
+and accumulates the moments for a corpus-wide PCA. The shards are exported
+one at a time at the end, so peak memory follows the largest county rather
+than the corpus.
+
+Sources are either the county URLs and PDFs of ``load_rag_urls.py``
+(``--scrape``) or an already scraped corpus (``--docs``). The result is a
+serving snapshot in the same format as ``store_rag_index.py`` writes,
+published through the manifest. The llama_index storage is not written, so
+``store_rag_index.py --export-only`` has nothing to re-export from.
+
+``--save-docs`` keeps the scraped markdown in its own directory
+(``rag/pipeline_docs`` by default). Its file names differ from
+``load_rag_urls.py``'s, so saving into ``rag/rag_docs`` would index every
+page twice; that directory is refused.
+
+Usage:
+    python ingest_pipeline.py --scrape --save-docs
+    python ingest_pipeline.py --docs rag/pipeline_docs --embed-workers 4
+"""
+import argparse
+import hashlib
+import json
+import queue
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from build_manifest import peak_rss_mb
+from rag_service.dense_index import (
+    DEFAULT_EMBED_MODEL,
+    QUANTIZATIONS,
+    REDUCTIONS,
+    normalize_rows,
+    pca_projection,
+)
+from rag_service.node_store import COMPRESSIONS
+from rag_service.snapshots import (
+    SHARDS_DIR,
+    new_version,
+    publish_snapshot,
+    shard_key,
+    snapshot_dir,
+    write_shards_manifest,
+)
+from rag_service.text_normalize import DISPLAY_TEXT_KEY
+from store_rag_index import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    DOCS_DIR,
+    PERSIST_DIR,
+    _write_export,
+    build_nodes,
+    front_matter_metadata,
+    shard_manifest_entry,
+)
+
+PDF_DIR = Path("./rag_pdf_data")
+SAVED_DOCS_DIR = Path("./rag/pipeline_docs")
+
+# Chunk metadata the serving export keeps (see rag_service/node_store.py)
+STORED_METADATA = ("source_url", "source_file", "county", "topic")
+
+_DONE = object()
+# How often a blocked queue operation checks whether another stage failed
+_POLL_SECONDS = 0.1
+
+
+class PipelineAborted(Exception):
+    """Another stage failed; this one stops too."""
+
+
+@dataclass
+class StageStats:
+    """Seconds one worker spent working, waiting for input and waiting for room downstream."""
+
+    items_in: int = 0
+    items_out: int = 0
+    busy: float = 0.0
+    starved: float = 0.0
+    blocked: float = 0.0
+
+
+class Pipeline:
+    """Threaded stages connected by bounded queues."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.stages: dict[str, list[StageStats]] = {}
+        self._threads: list[threading.Thread] = []
+        self._failed = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def source(self, name: str, items: Iterable) -> queue.Queue:
+        """Feed ``items`` into the pipeline from a thread; returns the queue they go to."""
+        outbox: queue.Queue = queue.Queue(self.queue_size)
+
+        def run(stats: StageStats) -> None:
+            self._emit(lambda: items, outbox, stats)
+            self._put(outbox, _DONE, stats)
+
+        self._start(name, 1, run)
+        return outbox
+
+    def stage(
+        self,
+        name: str,
+        fn: Callable[[object], Iterable],
+        inbox: queue.Queue,
+        workers: int = 1,
+        flush: Optional[Callable[[], Iterable]] = None,
+    ) -> queue.Queue:
+        """
+        Run ``fn`` on every item of ``inbox`` in ``workers`` threads.
+
+        ``fn`` returns (or yields) the items for the next stage. ``flush`` is
+        called once after the last item, for stages that hold items back.
+        """
+        outbox: queue.Queue = queue.Queue(self.queue_size)
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def run(stats: StageStats) -> None:
+            while True:
+                item = self._get(inbox, stats)
+                if item is _DONE:
+                    # Leave it for the other workers of this stage
+                    self._put(inbox, _DONE, stats)
+                    break
+                stats.items_in += 1
+                self._emit(lambda: fn(item), outbox, stats)
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                if flush is not None:
+                    self._emit(flush, outbox, stats)
+                self._put(outbox, _DONE, stats)
+
+        self._start(name, workers, run)
+        return outbox
+
+    def run(self) -> None:
+        """Wait for every stage to finish; re-raises the first stage failure."""
+        try:
+            for thread in self._threads:
+                while thread.is_alive():
+                    thread.join(_POLL_SECONDS)
+        except KeyboardInterrupt:
+            self._failed.set()
+            raise
+        if self._error is not None:
+            raise self._error
+
+    def report(self, wall: float) -> str:
+        lines = [
+            f"{'stage':<10}{'workers':>8}{'in':>8}{'out':>8}{'busy s':>9}{'per worker':>12}"
+            f"{'starved s':>11}{'blocked s':>11}"
+        ]
+        for name, workers in self.stages.items():
+            total = StageStats(
+                sum(s.items_in for s in workers),
+                sum(s.items_out for s in workers),
+                sum(s.busy for s in workers),
+                sum(s.starved for s in workers),
+                sum(s.blocked for s in workers),
+            )
+            lines.append(
+                f"{name:<10}{len(workers):>8}{total.items_in:>8}{total.items_out:>8}{total.busy:>9.1f}"
+                f"{total.busy / len(workers):>12.1f}{total.starved / len(workers):>11.1f}"
+                f"{total.blocked / len(workers):>11.1f}"
+            )
+        lines.append(f"pipeline wall time {wall:.1f}s")
+        return "\n".join(lines)
+
+    def _start(self, name: str, workers: int, run: Callable[[StageStats], None]) -> None:
+        self.stages[name] = [StageStats() for _ in range(workers)]
+        for i, stats in enumerate(self.stages[name]):
+            thread = threading.Thread(
+                target=self._guard, args=(run, stats), name=f"{name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _guard(self, run: Callable[[StageStats], None], stats: StageStats) -> None:
+        try:
+            run(stats)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            if not self._failed.is_set():
+                self._error = e
+                self._failed.set()
+
+    def _emit(self, produce: Callable[[], Iterable], outbox: queue.Queue, stats: StageStats) -> None:
+        # Only the time spent producing counts as busy, not waiting to hand over
+        start = time.perf_counter()
+        outputs = iter(produce())
+        while True:
+            out = next(outputs, _DONE)
+            stats.busy += time.perf_counter() - start
+            if out is _DONE:
+                return
+            stats.items_out += 1
+            self._put(outbox, out, stats)
+            start = time.perf_counter()
+
+    def _put(self, q: queue.Queue, item, stats: StageStats) -> None:
+        start = time.perf_counter()
+        while True:
+            if self._failed.is_set():
+                raise PipelineAborted
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stats.blocked += time.perf_counter() - start
+
+    def _get(self, q: queue.Queue, stats: StageStats):
+        start = time.perf_counter()
+        while True:
+            if self._failed.is_set():
+                raise PipelineAborted
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        stats.starved += time.perf_counter() - start
+        return item
+
+
+@dataclass
+class SourceTask:
+    """One fetch: a county URL, a county PDF, or a scraped markdown file."""
+
+    index: int
+    county: Optional[str]
+    # "html", "pdf", or "markdown" (front matter already in the text)
+    content_type: str
+    location: str
+
+
+def scrape_sources(pdf_dir: Path = PDF_DIR) -> Iterator[SourceTask]:
+    """The PDFs and URLs ``load_rag_urls.py`` scrapes, county by county."""
+    from load_rag_urls import pdf_files, url_dict
+
+    index = 0
+    for county, urls in url_dict.items():
+        for path in pdf_files(county, str(pdf_dir)):
+            yield SourceTask(index, county, "pdf", path)
+            index += 1
+        for url in urls:
+            yield SourceTask(index, county, "html", url)
+            index += 1
+
+
+def docs_sources(docs_dir: Path) -> Iterator[SourceTask]:
+    """Every file of an already scraped corpus, like ``SimpleDirectoryReader(docs_dir)``."""
+    paths = sorted(p for p in Path(docs_dir).iterdir() if p.is_file() and not p.name.startswith("."))
+    for index, path in enumerate(paths):
+        yield SourceTask(index, None, "markdown", str(path.resolve()))
+
+
+def load_source(content_type: str, location: str) -> list:
+    """The documents of one URL, PDF or markdown file; raises if it cannot be read."""
+    if content_type == "html":
+        import load_rag_urls
+
+        return load_rag_urls.loader.load_data([location])
+    if content_type == "pdf":
+        import load_rag_urls
+
+        return SimpleDirectoryReader(
+            input_files=[location], file_extractor={".pdf": load_rag_urls.parser}
+        ).load_data()
+    return SimpleDirectoryReader(input_files=[location]).load_data()
+
+
+def fetch(task: SourceTask) -> list:
+    """``(task, document number, document)`` for every document of ``task``."""
+    try:
+        docs = load_source(task.content_type, task.location)
+    except Exception as e:
+        # One unreachable page must not fail the build
+        print(f"Skipping {task.location}: {e}")
+        return []
+    return [(task, i, doc) for i, doc in enumerate(docs)]
+
+
+def add_front_matter(doc, county: str, content_type: str, state: str = "NY") -> None:
+    """Prefix a scraped document with the front matter ``load_rag_urls.py`` writes."""
+    from load_rag_urls import front_matter, pdf_source_file
+
+    if content_type == "pdf":
+        header = front_matter(county, "pdf", "source_file", pdf_source_file(doc.metadata["file_path"]), state)
+    else:
+        header = front_matter(county, "html", "source_url", doc.metadata.get("URL"), state)
+    doc.set_content(header + doc.text)
+
+
+def doc_filename(county: str, content_type: str, location: str, doc_no: int) -> str:
+    """Stable markdown file name of a source's ``doc_no``-th document."""
+    digest = hashlib.sha1(f"{location}#{doc_no}".encode()).hexdigest()[:12]
+    return f"{county}-{content_type}-{digest}.md"
+
+
+class Cleaner:
+    """Scraped documents get the front matter ``load_rag_urls.py`` writes, then its metadata."""
+
+    def __init__(self, save_docs: Optional[Path] = None):
+        self.save_docs = save_docs
+        if save_docs is not None:
+            save_docs.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, fetched) -> list:
+        task, doc_no, doc = fetched
+        if task.content_type != "markdown":
+            add_front_matter(doc, task.county, task.content_type)
+            if self.save_docs is not None:
+                path = self.save_docs / doc_filename(task.county, task.content_type, task.location, doc_no)
+                path.write_text(doc.text, encoding="utf-8")
+        if not doc.text.strip():
+            return []
+        doc.metadata.update(front_matter_metadata(doc.text))
+        return [(task, doc_no, doc)]
+
+
+class Chunker:
+    """Splits documents into chunks and hands them on in embedding batches."""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        # (task index, document number, chunk number) -> node, in arrival order
+        self._pending: list[tuple[tuple[int, int, int], object]] = []
+
+    def __call__(self, cleaned) -> Iterator[list]:
+        task, doc_no, doc = cleaned
+        nodes = build_nodes([doc], self.splitter)
+        self._pending.extend(((task.index, doc_no, i), node) for i, node in enumerate(nodes))
+        while len(self._pending) >= self.batch_size:
+            batch = self._pending[: self.batch_size]
+            del self._pending[: self.batch_size]
+            yield batch
+
+    def flush(self) -> Iterator[list]:
+        if self._pending:
+            yield self._pending
+            self._pending = []
+
+
+class Embedder:
+    def __init__(self, embed_model: OpenAIEmbedding):
+        self.embed_model = embed_model
+
+    def __call__(self, batch: list) -> list:
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for _, node in batch]
+        vectors = self.embed_model.get_text_embedding_batch(texts)
+        return [(batch, np.asarray(vectors, dtype=np.float32))]
+
+
+class ShardSpool:
+    """The chunks of one shard, appended to disk as they arrive."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.mkdir(parents=True)
+        self._vectors = open(path / "vectors.f32", "wb")
+        self._chunks = open(path / "chunks.jsonl", "w", encoding="utf-8")
+        self.count = 0
+
+    def append(self, key: tuple[int, int, int], node, vector: np.ndarray) -> None:
+        self._vectors.write(vector.tobytes())
+        record = {
+            "key": key,
+            "id": node.node_id,
+            "text": node.metadata[DISPLAY_TEXT_KEY],
+            "metadata": {k: node.metadata.get(k) for k in STORED_METADATA},
+        }
+        self._chunks.write(json.dumps(record) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        self._vectors.close()
+        self._chunks.close()
+
+    def read(self, dims: int) -> tuple[list[str], np.ndarray, list[str], list[dict]]:
+        """Node ids, vectors, texts and metadata in source order."""
+        with open(self.path / "chunks.jsonl", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        vectors = np.fromfile(self.path / "vectors.f32", dtype=np.float32).reshape(-1, dims)
+        # Concurrent fetch and embed workers append out of order
+        order = sorted(range(len(records)), key=lambda i: records[i]["key"])
+        records = [records[i] for i in order]
+        return (
+            [r["id"] for r in records],
+            vectors[order],
+            [r["text"] for r in records],
+            [r["metadata"] for r in records],
+        )
+
+
+class SpoolWriter:
+    """Write stage: spools embedded chunks per shard and streams the PCA moments."""
+
+    def __init__(self, root: Path, shard: bool, pca: bool):
+        self.root = root
+        self.shard = shard
+        self.pca = pca
+        self.spools: dict[str, ShardSpool] = {}
+        self.count = 0
+        self.dims: Optional[int] = None
+        self._total: Optional[np.ndarray] = None
+        self._gram: Optional[np.ndarray] = None
+
+    def __call__(self, embedded) -> tuple:
+        batch, vectors = embedded
+        if self.dims is None:
+            self.dims = vectors.shape[1]
+            if self.pca:
+                self._total = np.zeros(self.dims)
+                self._gram = np.zeros((self.dims, self.dims))
+        if self.pca:
+            unit = normalize_rows(vectors).astype(np.float64)
+            self._total += unit.sum(axis=0)
+            self._gram += unit.T @ unit
+        for (key, node), vector in zip(batch, vectors):
+            name = shard_key(node.metadata.get("county")) if self.shard else ""
+            spool = self.spools.get(name)
+            if spool is None:
+                spool = self.spools[name] = ShardSpool(self.root / (name or "all"))
+            spool.append(key, node, vector)
+        self.count += len(batch)
+        return ()
+
+    def close(self) -> None:
+        for spool in self.spools.values():
+            spool.close()
+
+    def export(self, out_dir: Path, quantization, dims, reduction, embed_model, compression) -> dict:
+        """Write the serving export one shard at a time."""
+        if not self.count:
+            raise SystemExit("No chunks were produced; nothing to export")
+        projection = None
+        if dims and reduction == "pca" and dims < self.dims:
+            projection = pca_projection(self.count, self._total, self._gram, dims)
+
+        if not self.shard:
+            node_ids, vectors, texts, metadata = self.spools[""].read(self.dims)
+            meta, store_meta = _write_export(
+                out_dir, node_ids, vectors, texts, metadata,
+                quantization, dims, reduction, embed_model, compression, projection,
+            )
+            print(
+                f"Exported {meta['count']} vectors to {out_dir} "
+                f"({meta['quantization']}, {meta['scan_dims']}/{meta['dims']} dims; "
+                f"chunk texts {store_meta['compression'] or 'uncompressed'}, "
+                f"{len(store_meta['sources'])} distinct sources)"
+            )
+            return meta
+
+        shards = {}
+        for name, spool in sorted(self.spools.items()):
+            node_ids, vectors, texts, metadata = spool.read(self.dims)
+            meta, _ = _write_export(
+                Path(out_dir) / SHARDS_DIR / name, node_ids, vectors, texts, metadata,
+                quantization, dims, reduction, embed_model, compression, projection,
+            )
+            shards[name] = shard_manifest_entry(meta)
+        write_shards_manifest(out_dir, shards, embed_model)
+        print(
+            f"Exported {self.count} vectors to {out_dir} in {len(shards)} shards "
+            f"({meta['quantization']}, {meta['scan_dims']}/{meta['dims']} dims; "
+            f"largest shard {max(s['count'] for s in shards.values())} chunks)"
+        )
+        return {**meta, "count": self.count, "shards": len(shards)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sources = parser.add_mutually_exclusive_group()
+    sources.add_argument("--docs", type=Path, default=Path(DOCS_DIR), help="scraped corpus to index")
+    sources.add_argument(
+        "--scrape", action="store_true", help="fetch the URLs and PDFs of load_rag_urls.py instead"
+    )
+    parser.add_argument(
+        "--save-docs",
+        type=Path,
+        nargs="?",
+        const=SAVED_DOCS_DIR,
+        help=f"also write scraped documents here as markdown (default: {SAVED_DOCS_DIR})",
+    )
+    parser.add_argument("--persist-dir", type=Path, default=Path(PERSIST_DIR))
+    parser.add_argument(
+        "--quantize", choices=QUANTIZATIONS, help="scan matrix type (default: int8 with --dims, else float32)"
+    )
+    parser.add_argument("--dims", type=int, help="reduce serving vectors to this many dimensions")
+    parser.add_argument("--reduction", choices=REDUCTIONS, default="pca")
+    parser.add_argument("--embed-model", default=DEFAULT_EMBED_MODEL)
+    parser.add_argument("--compress-chunks", choices=[c or "none" for c in COMPRESSIONS], default="none")
+    parser.add_argument("--no-shards", action="store_true", help="write one monolithic export")
+    parser.add_argument("--keep", type=int, default=3, help="serving snapshots to keep (default: 3)")
+    parser.add_argument("--fetch-workers", type=int, default=8)
+    parser.add_argument("--embed-workers", type=int, default=4, help="concurrent embedding requests")
+    parser.add_argument("--embed-batch", type=int, default=64, help="chunks per embedding request")
+    parser.add_argument("--queue-size", type=int, default=16, help="items waiting between two stages")
+    args = parser.parse_args()
+    if args.save_docs is not None and args.save_docs.resolve() == Path(DOCS_DIR).resolve():
+        parser.error(f"--save-docs must not be {DOCS_DIR}: its pages would be indexed twice")
+
+    embed_model = OpenAIEmbedding(model=args.embed_model, embed_batch_size=args.embed_batch)
+    args.persist_dir.mkdir(parents=True, exist_ok=True)
+    chunker = Chunker(args.embed_batch)
+    pipeline = Pipeline(args.queue_size)
+    start = time.perf_counter()
+    # Spools live next to the snapshots: same disk, removed afterwards
+    with tempfile.TemporaryDirectory(prefix=".spool-", dir=args.persist_dir) as spool_dir:
+        writer = SpoolWriter(Path(spool_dir), shard=not args.no_shards, pca=bool(args.dims) and args.reduction == "pca")
+        try:
+            tasks = pipeline.source("sources", scrape_sources() if args.scrape else docs_sources(args.docs))
+            fetched = pipeline.stage("fetch", fetch, tasks, workers=args.fetch_workers)
+            cleaned = pipeline.stage("clean", Cleaner(args.save_docs), fetched)
+            batches = pipeline.stage("chunk", chunker, cleaned, flush=chunker.flush)
+            embedded = pipeline.stage("embed", Embedder(embed_model), batches, workers=args.embed_workers)
+            pipeline.stage("write", writer, embedded)
+            pipeline.run()
+        finally:
+            writer.close()
+        wall = time.perf_counter() - start
+        print(pipeline.report(wall))
+
+        export_start = time.perf_counter()
+        version = new_version(args.persist_dir)
+        meta = writer.export(
+            snapshot_dir(args.persist_dir, version),
+            args.quantize,
+            args.dims,
+            args.reduction,
+            args.embed_model,
+            None if args.compress_chunks == "none" else args.compress_chunks,
+        )
+    print(f"export {time.perf_counter() - export_start:.1f}s, peak RSS {peak_rss_mb():.0f} MB")
+    info = {k: meta[k] for k in ("count", "dims", "scan_dims", "quantization", "embed_model", "shards") if k in meta}
+    publish_snapshot(args.persist_dir, version, info, keep=args.keep)
+    print(f"Published serving snapshot {version}")
+
+
+if __name__ == "__main__":
+    main()
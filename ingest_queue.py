@@ -0,0 +1,755 @@
+"""Scrape county sources through a durable work queue that any number of workers drain.
+
+``load_rag_urls.py`` scrapes its hard-coded ``url_dict`` in one process. This
+command keeps one job per source (a URL or a PDF of a county) in a SQLite
+database instead:
+
+    seed    add jobs from the source list CSV (``County``, ``Links`` separated
+            by ``;``, optionally ``State``), a JSONL file of
+            ``{county, kind, location, state}``, ``url_dict`` (``--url-dict``)
+            and the PDFs under ``rag_pdf_data/<county>/``. Seeding is
+            idempotent: a source already in the queue is left as it is.
+    work    claim jobs and scrape them into ``--out`` as markdown with the
+            front matter of ``load_rag_urls.py``. Start as many workers as
+            you like (``--processes``, or more commands on other machines).
+    status  jobs per status, failures and totals.
+    requeue put finished (``--done``) and/or failed (``--failed``) jobs back,
+            e.g. for a full refresh.
+    recrawl put back only the finished jobs whose source is due (below).
+    changes the documents that changed since the last ``changes --ack``,
+            i.e. whether the index needs a rebuild.
+
+A worker claims a job with a lease of ``--lease`` seconds, renewed while it
+works. If the worker dies, the lease runs out and another worker takes the
+job over, so a crashed run resumes where it stopped. Processing a job again
+gives the same result: every document of a source has a stable file name
+(``<county>-<kind>-<hash>.md``, as ``ingest_pipeline.py --save-docs``
+writes), files are replaced atomically and files the source no longer
+produces are removed. A failed job is retried after an exponential backoff
+and marked failed after ``--max-attempts`` attempts.
+
+Each finished job records its documents, bytes, content hash, files,
+seconds and worker. Index the result with
+``python ingest_pipeline.py --docs rag/queue_docs`` or
+``python store_rag_index.py --docs rag/queue_docs``.
+
+Recrawls follow how often each source changes. Every fetch is kept in the
+source's history with a hash of its whitespace-normalized text. Changes are
+modelled as a Poisson process with a prior of one change per week: after
+``c`` changes seen over ``T`` seconds the rate is ``(c + 1) / (T + 1 week)``.
+The next fetch is due when the chance of a change since the last one reaches
+``--stale-probability`` (default 0.5), within 1 to 90 days. A weekly trash
+notice is refetched every few days, and a fee schedule that never changes
+drifts to the 90-day maximum. An unchanged fetch leaves the documents on
+disk untouched. A changed one rewrites them, and ``changes`` lists them for
+indexing.
+
+Workers are polite per host, across all workers and machines. A host gets
+at most one fetch per ``--host-delay`` seconds and ``--host-budget`` fetches
+per day. Due jobs of other hosts go first, and a worker waits only when
+nothing else is due.
+
+Workers on several machines need the database on a filesystem with working
+POSIX locks and ``--journal-mode delete`` (WAL only works on one machine),
+and the PDFs at the same relative paths. The queries need SQLite 3.35 or
+later (``RETURNING``; ``COUNT(*) FILTER`` needs 3.30), checked on connect.
+
+Usage:
+    python ingest_queue.py seed --url-dict
+    python ingest_queue.py work --processes 8
+    python ingest_queue.py status
+    python ingest_queue.py recrawl && python ingest_queue.py work  # e.g. daily
+    python ingest_queue.py changes --ack
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+from rag_service.snapshots import shard_key
+
+QUEUE_DB = Path("./rag/ingest_queue.sqlite")
+SOURCE_LIST = Path("./data/Recycling Source List.csv")
+PDF_DIR = Path("./rag_pdf_data")
+OUT_DIR = Path("./rag/queue_docs")
+
+DEFAULT_LEASE = 300.0
+DEFAULT_MAX_ATTEMPTS = 4
+MAX_BACKOFF = 3600.0
+
+DAY = 86400.0
+# Recrawl scheduling: prior change interval, bounds of the recrawl interval
+PRIOR_INTERVAL = 7 * DAY
+MIN_INTERVAL = DAY
+MAX_INTERVAL = 90 * DAY
+STALE_PROBABILITY = 0.5
+# Politeness per host: seconds between fetches, fetches per day
+HOST_DELAY = 5.0
+HOST_BUDGET = 200
+
+KINDS = ("html", "pdf")
+JOURNAL_MODES = ("wal", "delete")
+# UPDATE ... RETURNING in claim()
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    county TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'NY',
+    location TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    seeded_at REAL NOT NULL,
+    finished_at REAL,
+    worker TEXT,
+    seconds REAL,
+    documents INTEGER,
+    bytes INTEGER,
+    content_hash TEXT,
+    files TEXT,
+    error TEXT,
+    host TEXT NOT NULL DEFAULT '',
+    due_at REAL,
+    changed_at REAL,
+    UNIQUE (kind, county, location)
+);
+CREATE TABLE IF NOT EXISTS fetches (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    fetched_at REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    changed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    next_allowed REAL NOT NULL,
+    window_start REAL NOT NULL,
+    window_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (status, not_before);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, due_at);
+CREATE INDEX IF NOT EXISTS fetches_job ON fetches (job_id, fetched_at);
+"""
+
+# Columns added to jobs after the first queues were created
+_ADDED_COLUMNS = {"host": "TEXT NOT NULL DEFAULT ''", "due_at": "REAL", "changed_at": "REAL"}
+
+
+def connect(path: Path = QUEUE_DB, journal_mode: str = "wal") -> sqlite3.Connection:
+    """Open (and create) the queue; statements commit on their own."""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f"The ingest queue needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or later, "
+            f"this Python has {sqlite3.sqlite_version}"
+        )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    conn.executescript(INDEXES)
+    return conn
+
+
+def _missing_columns(conn: sqlite3.Connection) -> list[str]:
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    return [name for name in _ADDED_COLUMNS if name not in columns]
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    if not _missing_columns(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another worker may have migrated meanwhile
+        missing = _missing_columns(conn)
+        for name in missing:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {_ADDED_COLUMNS[name]}")
+        if "host" in missing:
+            for row in conn.execute("SELECT id, kind, location FROM jobs").fetchall():
+                host = source_host(row["kind"], row["location"])
+                conn.execute("UPDATE jobs SET host = ? WHERE id = ?", (host, row["id"]))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def source_host(kind: str, location: str) -> str:
+    """Host a job fetches from; empty for local files, which need no politeness."""
+    return urlsplit(location).netloc.lower() if kind == "html" else ""
+
+
+# --- Seeding ---
+
+_COUNTY_SUFFIX = re.compile(r"\s+county$", re.IGNORECASE)
+
+
+def county_key(name: str, state: str = "NY") -> str:
+    """Shard name of a county as the source list writes it ("St. Lawrence County" -> "stlawrence")."""
+    if state == "NY":
+        from rag_service.counties import get_county_detector
+
+        detected = get_county_detector().detect(name)
+        if detected is not None:
+            return detected
+    return shard_key(_COUNTY_SUFFIX.sub("", name.strip()))
+
+
+def csv_sources(path: Path, default_state: str = "NY") -> Iterator[tuple[str, str, str, str]]:
+    """``(kind, county, state, url)`` for every link of the source list."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            state = (row.get("State") or default_state).strip()
+            county = county_key(row["County"], state)
+            for url in (row.get("Links") or "").split(";"):
+                if url.strip():
+                    yield "html", county, state, url.strip()
+
+
+def jsonl_sources(path: Path, default_state: str = "NY") -> Iterator[tuple[str, str, str, str]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                job = json.loads(line)
+                if job.get("kind", "html") not in KINDS:
+                    raise ValueError(f"{path}: kind must be one of {KINDS}, not {job['kind']!r}")
+                state = job.get("state") or default_state
+                yield job.get("kind", "html"), county_key(job["county"], state), state, job["location"]
+
+
+def url_dict_sources(state: str = "NY") -> Iterator[tuple[str, str, str, str]]:
+    from load_rag_urls import url_dict
+
+    for county, urls in url_dict.items():
+        for url in urls:
+            yield "html", county, state, url
+
+
+def pdf_sources(pdf_dir: Path = PDF_DIR, state: str = "NY") -> Iterator[tuple[str, str, str, str]]:
+    """The PDFs of ``rag_pdf_data/<county>/``, as paths relative to the working directory."""
+    if not pdf_dir.is_dir():
+        return
+    for county_dir in sorted(p for p in pdf_dir.iterdir() if p.is_dir()):
+        for path in sorted(p for p in county_dir.iterdir() if p.is_file() and not p.name.startswith(".")):
+            yield "pdf", county_dir.name, state, str(path)
+
+
+def seed(conn: sqlite3.Connection, sources) -> tuple[int, int]:
+    """Add jobs for ``sources``; returns (added, already queued)."""
+    added = seen = 0
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for kind, county, state, location in sources:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, county, state, location, host, seeded_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, county, location) DO NOTHING",
+                (kind, county, state, location, source_host(kind, location), now),
+            )
+            added += cursor.rowcount
+            seen += 1
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added, seen - added
+
+
+# --- Claiming and finishing jobs ---
+
+def claim(
+    conn: sqlite3.Connection,
+    owner: str,
+    lease: float,
+    host_delay: float = HOST_DELAY,
+    host_budget: int = HOST_BUDGET,
+) -> Optional[sqlite3.Row]:
+    """
+    Lease the next due job: pending, or leased by a worker whose lease ran
+    out. Jobs of a host fetched less than ``host_delay`` seconds ago, or
+    ``host_budget`` times in the last day, wait. The most overdue job goes
+    first.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        job = conn.execute(
+            """
+            UPDATE jobs SET status = 'leased', lease_owner = :owner, lease_expires = :expires,
+                attempts = attempts + 1
+            WHERE id = (
+                SELECT j.id FROM jobs j LEFT JOIN hosts h ON h.host = j.host
+                WHERE ((j.status = 'pending' AND j.not_before <= :now)
+                       OR (j.status = 'leased' AND j.lease_expires < :now))
+                  AND (j.host = '' OR h.host IS NULL OR (
+                      h.next_allowed <= :now AND (h.window_start <= :day_ago OR h.window_count < :budget)))
+                ORDER BY j.not_before, j.id LIMIT 1
+            )
+            RETURNING *
+            """,
+            {"owner": owner, "expires": now + lease, "now": now, "day_ago": now - DAY, "budget": host_budget},
+        ).fetchone()
+        if job is not None and job["host"]:
+            conn.execute(
+                """
+                INSERT INTO hosts (host, next_allowed, window_start, window_count) VALUES (:host, :next, :now, 1)
+                ON CONFLICT (host) DO UPDATE SET
+                    next_allowed = :next,
+                    window_count = CASE WHEN window_start <= :day_ago THEN 1 ELSE window_count + 1 END,
+                    window_start = CASE WHEN window_start <= :day_ago THEN :now ELSE window_start END
+                """,
+                {"host": job["host"], "next": now + host_delay, "now": now, "day_ago": now - DAY},
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return job
+
+
+def host_wait(conn: sqlite3.Connection, host_budget: int = HOST_BUDGET) -> Optional[float]:
+    """Seconds until a due job's host may be fetched again; None if no due job waits for its host's delay."""
+    now = time.time()
+    (next_allowed,) = conn.execute(
+        """
+        SELECT MIN(h.next_allowed) FROM jobs j JOIN hosts h ON h.host = j.host
+        WHERE j.status = 'pending' AND j.not_before <= :now AND h.next_allowed > :now
+          AND (h.window_start <= :day_ago OR h.window_count < :budget)
+        """,
+        {"now": now, "day_ago": now - DAY, "budget": host_budget},
+    ).fetchone()
+    return None if next_allowed is None else max(next_allowed - now, 0.0)
+
+
+def renew(conn: sqlite3.Connection, job_id: int, owner: str, lease: float) -> bool:
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+        (time.time() + lease, job_id, owner),
+    )
+    return cursor.rowcount == 1
+
+
+def recrawl_interval(changes: int, observed: float, stale_probability: float = STALE_PROBABILITY) -> float:
+    """
+    Seconds until a source seen to change ``changes`` times over ``observed``
+    seconds has changed again with probability ``stale_probability``.
+    """
+    # Posterior mean of a Poisson change rate under a prior of one change per PRIOR_INTERVAL
+    rate = (changes + 1) / (observed + PRIOR_INTERVAL)
+    return min(max(-math.log(1 - stale_probability) / rate, MIN_INTERVAL), MAX_INTERVAL)
+
+
+def complete(
+    conn: sqlite3.Connection,
+    job: sqlite3.Row,
+    owner: str,
+    result: dict,
+    stale_probability: float = STALE_PROBABILITY,
+) -> bool:
+    """
+    Record a job's result and fetch and schedule its recrawl; False if its
+    lease was lost to another worker meanwhile.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        first, changes = conn.execute(
+            """
+            SELECT MIN(fetched_at), COUNT(*) FILTER (
+                WHERE changed AND fetched_at > (SELECT MIN(fetched_at) FROM fetches WHERE job_id = :id))
+            FROM fetches WHERE job_id = :id
+            """,
+            {"id": job["id"]},
+        ).fetchone()
+        # The first fetch has nothing to have changed from
+        if first is not None and result["changed"]:
+            changes += 1
+        interval = recrawl_interval(changes, now - first if first is not None else 0.0, stale_probability)
+        cursor = conn.execute(
+            """
+            UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, finished_at = :now,
+                worker = :owner, seconds = :seconds, documents = :documents, bytes = :bytes,
+                content_hash = :hash, files = :files, error = NULL, due_at = :due,
+                changed_at = CASE WHEN :changed THEN :now ELSE changed_at END
+            WHERE id = :id AND status = 'leased' AND lease_owner = :owner
+            """,
+            {
+                "now": now, "owner": owner, "seconds": result["seconds"], "documents": result["documents"],
+                "bytes": result["bytes"], "hash": result["content_hash"], "files": json.dumps(result["files"]),
+                "due": now + interval, "changed": result["changed"], "id": job["id"],
+            },
+        )
+        if cursor.rowcount == 1:
+            conn.execute(
+                "INSERT INTO fetches (job_id, fetched_at, content_hash, changed) VALUES (?, ?, ?, ?)",
+                (job["id"], now, result["content_hash"], result["changed"]),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.rowcount == 1
+
+
+def fail(conn: sqlite3.Connection, job: sqlite3.Row, owner: str, error: str, max_attempts: int) -> str:
+    """
+    Put a job back with a backoff, or mark it failed after ``max_attempts``
+    (``recrawl`` tries it again after ``PRIOR_INTERVAL``); returns its status.
+    """
+    now = time.time()
+    status = "failed" if job["attempts"] >= max_attempts else "pending"
+    backoff = min(30.0 * 2 ** (job["attempts"] - 1), MAX_BACKOFF)
+    conn.execute(
+        """
+        UPDATE jobs SET status = :status, lease_owner = NULL, lease_expires = NULL, not_before = :retry,
+            worker = :owner, error = :error,
+            finished_at = CASE WHEN :status = 'failed' THEN :now END,
+            due_at = CASE WHEN :status = 'failed' THEN :due ELSE due_at END
+        WHERE id = :id AND status = 'leased' AND lease_owner = :owner
+        """,
+        {
+            "status": status, "retry": now + backoff, "owner": owner, "error": error, "now": now,
+            "due": now + PRIOR_INTERVAL, "id": job["id"],
+        },
+    )
+    return status
+
+
+# --- Processing ---
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def content_hash(texts: list[str]) -> str:
+    """Hash of a source's documents; whitespace-only differences are not changes."""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(" ".join(text.split()).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def process(job: sqlite3.Row, out_dir: Path) -> dict:
+    """
+    Scrape one source into ``out_dir``; safe to repeat. The documents are
+    rewritten only when the content changed (or a file is missing).
+    """
+    from ingest_pipeline import add_front_matter, doc_filename, load_source
+
+    start = time.perf_counter()
+    docs = load_source(job["kind"], job["location"])
+    digest = content_hash([doc.text for doc in docs])
+    files = [doc_filename(job["county"], job["kind"], job["location"], n) for n in range(len(docs))]
+    changed = digest != job["content_hash"]
+    size = 0
+    for name, doc in zip(files, docs):
+        add_front_matter(doc, job["county"], job["kind"], job["state"])
+        size += len(doc.text.encode("utf-8"))
+        if changed or not (out_dir / name).exists():
+            _write_atomic(out_dir / name, doc.text)
+    # Documents an earlier run of this source wrote that it no longer has
+    for name in set(json.loads(job["files"] or "[]")) - set(files):
+        (out_dir / name).unlink(missing_ok=True)
+    return {
+        "seconds": time.perf_counter() - start,
+        "documents": len(docs),
+        "bytes": size,
+        "content_hash": digest,
+        "files": files,
+        "changed": changed,
+    }
+
+
+class _LeaseKeeper:
+    """Renews the lease of the job a worker is on until it is done."""
+
+    def __init__(self, db: Path, journal_mode: str, owner: str, lease: float):
+        self._conn = connect(db, journal_mode)
+        self.owner = owner
+        self.lease = lease
+        self.job_id: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name="lease-keeper", daemon=True).start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease / 3):
+            with self._lock:
+                if self.job_id is not None and not renew(self._conn, self.job_id, self.owner, self.lease):
+                    print(f"[{self.owner}] lost the lease of job {self.job_id}")
+
+    def hold(self, job_id: Optional[int]) -> None:
+        with self._lock:
+            self.job_id = job_id
+
+    def close(self) -> None:
+        self._stop.set()
+
+
+def work(
+    db: Path,
+    out_dir: Path,
+    lease: float = DEFAULT_LEASE,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    follow: bool = False,
+    journal_mode: str = "wal",
+    host_delay: float = HOST_DELAY,
+    host_budget: int = HOST_BUDGET,
+    stale_probability: float = STALE_PROBABILITY,
+) -> tuple[int, int]:
+    """
+    Process jobs until none is due (or forever with ``follow``); returns
+    (done, failed attempts). Jobs only held back by their host's delay are
+    waited for.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    conn = connect(db, journal_mode)
+    keeper = _LeaseKeeper(db, journal_mode, owner, lease)
+    done = failed = 0
+    try:
+        while True:
+            job = claim(conn, owner, lease, host_delay, host_budget)
+            if job is None:
+                wait = host_wait(conn, host_budget)
+                if wait is not None:
+                    time.sleep(min(wait, 5.0) + 0.01)
+                    continue
+                if not follow:
+                    break
+                time.sleep(5)
+                continue
+            keeper.hold(job["id"])
+            try:
+                result = process(job, out_dir)
+            except Exception as e:
+                status = fail(conn, job, owner, repr(e), max_attempts)
+                failed += 1
+                print(f"[{owner}] {job['location']}: {e} ({status}, attempt {job['attempts']})")
+                continue
+            finally:
+                keeper.hold(None)
+            if complete(conn, job, owner, result, stale_probability):
+                done += 1
+            else:
+                print(f"[{owner}] {job['location']}: lease lost, result left to the new owner")
+    finally:
+        keeper.close()
+        conn.close()
+    return done, failed
+
+
+def _work_process(kwargs: dict) -> None:
+    done, failed = work(**kwargs)
+    print(f"[{socket.gethostname()}:{os.getpid()}] {done} jobs done, {failed} failed attempts")
+
+
+def requeue(conn: sqlite3.Connection, statuses: list[str]) -> int:
+    marks = ",".join("?" * len(statuses))
+    cursor = conn.execute(
+        f"UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0, error = NULL "
+        f"WHERE status IN ({marks})",
+        statuses,
+    )
+    return cursor.rowcount
+
+
+def recrawl(conn: sqlite3.Connection, dry_run: bool = False) -> int:
+    """Put finished and failed jobs whose source is due back in the queue; returns how many."""
+    # Jobs finished before recrawls were scheduled are due at once
+    due = "status IN ('done', 'failed') AND COALESCE(due_at, 0) <= ?"
+    if dry_run:
+        return conn.execute(f"SELECT COUNT(*) FROM jobs WHERE {due}", (time.time(),)).fetchone()[0]
+    cursor = conn.execute(
+        f"UPDATE jobs SET status = 'pending', attempts = 0, not_before = COALESCE(due_at, 0), error = NULL "
+        f"WHERE {due}",
+        (time.time(),),
+    )
+    return cursor.rowcount
+
+
+_CHANGES_ACKED = "changes_acked_at"
+
+
+def changed_jobs(conn: sqlite3.Connection) -> list[sqlite3.Row]:
+    """Jobs whose documents changed since the last acknowledgement, oldest change first."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (_CHANGES_ACKED,)).fetchone()
+    return conn.execute(
+        "SELECT id, county, location, files, changed_at FROM jobs WHERE changed_at > ? ORDER BY changed_at",
+        (float(row["value"]) if row else 0.0,),
+    ).fetchall()
+
+
+def ack_changes(conn: sqlite3.Connection, jobs: list[sqlite3.Row]) -> None:
+    """Mark the changes of ``jobs`` as indexed; later changes stay listed."""
+    if jobs:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (_CHANGES_ACKED, repr(max(job["changed_at"] for job in jobs))),
+        )
+
+
+def status_report(conn: sqlite3.Connection, failures: int = 10) -> str:
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    totals = conn.execute(
+        "SELECT COUNT(DISTINCT county), SUM(documents), SUM(bytes), SUM(seconds) FROM jobs WHERE status = 'done'"
+    ).fetchone()
+    lines = [
+        ", ".join(f"{s} {counts.get(s, 0)}" for s in ("pending", "leased", "done", "failed")),
+        f"done: {totals[0]} counties, {totals[1] or 0} documents, {(totals[2] or 0) / 2**20:.1f} MB, "
+        f"{totals[3] or 0:.0f} s of fetching",
+    ]
+    now = time.time()
+    due, next_due = conn.execute(
+        "SELECT COUNT(*) FILTER (WHERE COALESCE(due_at, 0) <= :now), MIN(due_at) FILTER (WHERE due_at > :now) "
+        "FROM jobs WHERE status IN ('done', 'failed')",
+        {"now": now},
+    ).fetchone()
+    fetches, changed = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(changed), 0) FROM fetches WHERE fetched_at > ?", (now - 30 * DAY,)
+    ).fetchone()
+    lines.append(
+        f"recrawl: {due} due"
+        + (f", next in {(next_due - now) / 3600:.1f} h" if next_due is not None else "")
+        + f"; last 30 days: {fetches} fetches, {changed} changed; {len(changed_jobs(conn))} changes unindexed"
+    )
+    rows = conn.execute(
+        "SELECT county, location, attempts, error FROM jobs WHERE status = 'failed' ORDER BY county LIMIT ?",
+        (failures,),
+    ).fetchall()
+    if rows:
+        lines.append(f"failed (first {len(rows)}):")
+        lines += [f"  {r['county']} {r['location']} after {r['attempts']} attempts: {r['error']}" for r in rows]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", type=Path, default=QUEUE_DB, help=f"queue database (default: {QUEUE_DB})")
+    parser.add_argument(
+        "--journal-mode", choices=JOURNAL_MODES, default="wal",
+        help="wal for workers on one machine, delete for a database on a shared filesystem",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="add jobs")
+    seed_parser.add_argument(
+        "sources", type=Path, nargs="*", help=f"source list CSVs or JSONL job files (default: {SOURCE_LIST})"
+    )
+    seed_parser.add_argument("--url-dict", action="store_true", help="also the URLs of load_rag_urls.py")
+    seed_parser.add_argument("--pdf-dir", type=Path, default=PDF_DIR, help="county PDF folders ('' for none)")
+    seed_parser.add_argument("--state", default="NY", help="state of sources that do not name one")
+
+    work_parser = commands.add_parser("work", help="process jobs")
+    work_parser.add_argument("--out", type=Path, default=OUT_DIR, help=f"markdown output (default: {OUT_DIR})")
+    work_parser.add_argument("--processes", type=int, default=1)
+    work_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="seconds a claim lasts unrenewed")
+    work_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work_parser.add_argument("--follow", action="store_true", help="keep waiting for new jobs")
+    work_parser.add_argument(
+        "--host-delay", type=float, default=HOST_DELAY, help=f"seconds between fetches of a host (default: {HOST_DELAY})"
+    )
+    work_parser.add_argument(
+        "--host-budget", type=int, default=HOST_BUDGET, help=f"fetches of a host per day (default: {HOST_BUDGET})"
+    )
+    work_parser.add_argument(
+        "--stale-probability", type=float, default=STALE_PROBABILITY,
+        help=f"chance of a missed change at which a source is due again (default: {STALE_PROBABILITY})",
+    )
+
+    commands.add_parser("status", help="summarize the queue")
+
+    requeue_parser = commands.add_parser("requeue", help="put jobs back")
+    requeue_parser.add_argument("--done", action="store_true")
+    requeue_parser.add_argument("--failed", action="store_true")
+
+    recrawl_parser = commands.add_parser("recrawl", help="put back the jobs whose source is due")
+    recrawl_parser.add_argument("--dry-run", action="store_true", help="only count them")
+
+    changes_parser = commands.add_parser("changes", help="list documents changed since the last --ack")
+    changes_parser.add_argument("--ack", action="store_true", help="mark the listed changes as indexed")
+    args = parser.parse_args()
+    if args.command == "work" and not 0 < args.stale_probability < 1:
+        parser.error("--stale-probability must be between 0 and 1")
+
+    conn = connect(args.db, args.journal_mode)
+    if args.command == "seed":
+        sources = []
+        for path in args.sources or [SOURCE_LIST]:
+            reader = jsonl_sources if path.suffix.lower() == ".jsonl" else csv_sources
+            sources.extend(reader(path, args.state))
+        if args.url_dict:
+            sources.extend(url_dict_sources(args.state))
+        if str(args.pdf_dir) not in ("", "."):
+            sources.extend(pdf_sources(args.pdf_dir, args.state))
+        added, existing = seed(conn, sources)
+        print(f"Seeded {added} jobs ({existing} already queued)")
+    elif args.command == "work":
+        conn.close()
+        kwargs = {
+            "db": args.db, "out_dir": args.out, "lease": args.lease,
+            "max_attempts": args.max_attempts, "follow": args.follow, "journal_mode": args.journal_mode,
+            "host_delay": args.host_delay, "host_budget": args.host_budget,
+            "stale_probability": args.stale_probability,
+        }
+        if args.processes == 1:
+            _work_process(kwargs)
+        else:
+            workers = [multiprocessing.Process(target=_work_process, args=(kwargs,)) for _ in range(args.processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        print(status_report(connect(args.db, args.journal_mode)))
+    elif args.command == "status":
+        print(status_report(conn))
+    elif args.command == "recrawl":
+        if args.dry_run:
+            print(f"{recrawl(conn, dry_run=True)} jobs due")
+        else:
+            print(f"Requeued {recrawl(conn)} due jobs")
+    elif args.command == "changes":
+        jobs = changed_jobs(conn)
+        for job in jobs:
+            changed = time.strftime("%Y-%m-%d %H:%M", time.localtime(job["changed_at"]))
+            print(f"{changed} {job['county']} {job['location']}")
+            for name in json.loads(job["files"] or "[]"):
+                print(f"    {name}")
+        print(f"{len(jobs)} sources changed", file=sys.stderr)
+        if args.ack:
+            ack_changes(conn, jobs)
+        # Like grep: exit 1 when there is nothing to rebuild for
+        sys.exit(0 if jobs else 1)
+    else:
+        statuses = [s for s, flag in (("done", args.done), ("failed", args.failed)) if flag]
+        if not statuses:
+            parser.error("requeue needs --done and/or --failed")
+        print(f"Requeued {requeue(conn, statuses)} jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import argparse
 import dotenv
 import os
+from pathlib import Path
 from llama_index.core import SimpleDirectoryReader
 from llama_index.readers.web import BeautifulSoupWebReader
 from llama_index.readers.file import PDFReader
@@ -7,6 +9,8 @@ from llama_index.readers.file import PDFReader
 
 from IPython.display import Markdown
 
+from build_manifest import BuildProfile, inputs_hash
+
 dotenv.load_dotenv()
 
 loader = BeautifulSoupWebReader()
@@ -386,51 +390,117 @@ url_dict = {
 }
 
 
+def front_matter(county: str, content_type: str, source_key: str, source: str, state: str = "NY") -> str:
+    """YAML header of a scraped document (read back by store_rag_index.py)."""
+    return f"""---
+county: {county}
+state: {state}
+content_type: {content_type}
+{source_key}: {source}
+---
+
+"""
+
+
+def pdf_source_file(file_path: str) -> str:
+    """Path of a PDF relative to rag_pdf_data ("/albany/guide.pdf")."""
+    return file_path.split('rag_pdf_data')[1]
+
+
+def _write_markdown(path: str, text: str) -> int:
+    """Write one scraped document; returns the bytes written (0 on error)."""
+    data = text.encode("utf-8")
+    try:
+        with open(path, "wb") as f:
+            f.write(data)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return 0
+    return len(data)
+
+
+def pdf_files(county: str, pdf_dir: str = "rag_pdf_data") -> list[str]:
+    """The county's PDFs, in the order SimpleDirectoryReader reads the directory."""
+    county_dir = os.path.join(pdf_dir, county)
+    if not os.path.isdir(county_dir):
+        return []
+    names = sorted(n for n in os.listdir(county_dir) if not n.startswith("."))
+    return [os.path.join(county_dir, n) for n in names if os.path.isfile(os.path.join(county_dir, n))]
+
+
 # dictionary will store the counties. rag_pdf_data will have subfolders with county names, and then the pdf inside that.
-for name, url_list in url_dict.items():
-    # if the county has pdf data, load it. Only counties with actual pdf files should have a directory
-    if (os.path.isdir('rag_pdf_data/'+name)):
-        file_extractor = {".pdf": parser}
-        pdf_documents = SimpleDirectoryReader(
-            "./rag_pdf_data/"+name, file_extractor=file_extractor
-        ).load_data()
-        pdf_readmes = [(Markdown(f"{doc.text}")) for doc in pdf_documents]
-  
-        for i,readme_data in enumerate(pdf_readmes):        
-            output_dir = "rag/rag_docs/" + name + "pdf" + str(i) +".md"
-            header = f"""---
-county: {name}
-state: NY
-content_type: pdf
-source_file: {pdf_documents[i].metadata.get('file_path').split('rag_pdf_data')[1]}
----\n
-            """
+def main():
+    arg_parser = argparse.ArgumentParser(description="Scrape the county URLs and PDFs into rag/rag_docs.")
+    arg_parser.add_argument(
+        "--manifest", type=Path, help="build manifest to write (default: build_manifests/scrape-<time>.json)"
+    )
+    args = arg_parser.parse_args()
+
+    profile = BuildProfile("scrape", {"counties": len(url_dict)})
+    sources = [url for urls in url_dict.values() for url in urls]
+    for name in url_dict:
+        # if the county has pdf data, load it. Only counties with actual pdf files should have a directory
+        for path in pdf_files(name):
+            sources.append(f"{path}:{os.path.getsize(path)}")
+    profile.inputs = inputs_hash(sources)
+
+    for name, url_list in url_dict.items():
+        # Loaded one file at a time to time each; a PDF yields a document per page
+        pdf_documents = []
+        for path in pdf_files(name):
+            with profile.stage("fetch", county=name, source=path) as counters:
+                docs = SimpleDirectoryReader(input_files=[path], file_extractor={".pdf": parser}).load_data()
+                counters.update(documents=len(docs), bytes=os.path.getsize(path))
+            pdf_documents.extend(docs)
+
+        with profile.stage("write", county=name) as counters:
+            pdf_readmes = [(Markdown(f"{doc.text}")) for doc in pdf_documents]
+            for i,readme_data in enumerate(pdf_readmes):
+                output_dir = "rag/rag_docs/" + name + "pdf" + str(i) +".md"
+                header = front_matter(
+                    name, "pdf", "source_file", pdf_source_file(pdf_documents[i].metadata.get('file_path'))
+                )
+                counters["bytes_written"] = counters.get("bytes_written", 0) + _write_markdown(
+                    output_dir, header + readme_data.data
+                )
+
+        # One page at a time, so an unreachable page skips only itself. The
+        # reader does not expose response sizes; bytes are the page's text
+        documents = []
+        for url in url_list:
             try:
-                with open(output_dir, "w", encoding="utf-8") as f:
-                    f.write(header + readme_data.data)
-                
+                with profile.stage("fetch", county=name, source=url) as counters:
+                    docs = loader.load_data([url])
+                    counters.update(documents=len(docs), bytes=sum(len(d.text.encode("utf-8")) for d in docs))
             except Exception as e:
-                print(f"An error occurred: {e}")
-    
+                print(f"An error occurred fetching {url}: {e}")
+                continue
+            documents.extend(docs)
 
-    documents = loader.load_data(url_list)
+        with profile.stage("write", county=name) as counters:
+            readmes = [(Markdown(f"{doc.text}")) for doc in documents]
+            for i,readme_data in enumerate(readmes):
+                output_dir = "rag/rag_docs/" + name + str(i)+".md"
+                header = front_matter(name, "html", "source_url", documents[i].metadata.get('URL'))
+                counters["bytes_written"] = counters.get("bytes_written", 0) + _write_markdown(
+                    output_dir, header + readme_data.data
+                )
 
-    readmes = [(Markdown(f"{doc.text}")) for doc in documents]
+    fetch = profile.stages.get("fetch", {})
+    profile.totals = {
+        "sources": len(sources),
+        "failed_sources": fetch.get("errors", 0),
+        "documents": fetch.get("documents", 0),
+        "bytes_fetched": fetch.get("bytes", 0),
+    }
+    profile.outputs = {"docs_bytes": profile.stages.get("write", {}).get("bytes_written", 0)}
+    path = profile.write(args.manifest)
+    print(
+        f"Scraped {profile.totals['documents']} documents from {len(sources)} sources "
+        f"({profile.totals['failed_sources']} failed) in {profile.elapsed:.0f} s; "
+        f"build manifest {path}"
+    )
 
-    
-  
-    for i,readme_data in enumerate(readmes):
-        output_dir = "rag/rag_docs/" + name + str(i)+".md"
-        header = f"""---
-county: {name}
-state: NY
-content_type: html
-source_url: {documents[i].metadata.get('URL')}
----\n
-            """
-        try:
-            with open(output_dir, "w", encoding="utf-8") as f:
-                f.write(header + readme_data.data)
-            
-        except Exception as e:
-            print(f"An error occurred: {e}")
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Mine candidate material terms for rag_service/material_taxonomy.yaml.
+
+Counts 1-3 word phrases from the scraped regulation pages that appear near
+disposal vocabulary ("recycle", "accepted", "drop off", ...) and are not yet
+triggers in the taxonomy. Candidates are grouped under the category of any
+trigger they contain (e.g. "plastic clamshells" under "plastic") so they can
+be reviewed and copied into the taxonomy by hand.
+
+Usage:
+    python mine_material_terms.py --min-count 5 --top 40 > candidates.yaml
+"""
+import argparse
+import re
+from collections import Counter
+from pathlib import Path
+
+import yaml
+
+from rag_service.material_synonyms import (
+    TAXONOMY_PATH,
+    MaterialExpander,
+    normalize_phrase,
+)
+
+DOCS_DIR = Path("./rag/rag_docs")
+
+CONTEXT_WORDS = {
+    "recycle", "recycled", "recycling", "recyclable", "recyclables", "accepted",
+    "accept", "accepts", "dispose", "disposal", "drop", "bin", "bins", "curbside",
+    "hazardous", "collection", "collected", "landfill", "trash", "banned",
+    "prohibited", "compost", "donate",
+}
+
+STOPWORDS = {
+    "a", "an", "and", "or", "the", "of", "to", "in", "on", "for", "with", "at",
+    "by", "from", "as", "is", "are", "be", "can", "not", "no", "all", "any",
+    "your", "you", "our", "we", "it", "its", "this", "that", "these", "those",
+    "will", "may", "must", "should", "please", "if", "do", "does", "other",
+    "only", "such", "more", "info", "information", "click", "here", "page",
+    "county", "ny", "new", "york", "city", "town", "call", "am", "pm", "per",
+    "each", "also", "than", "into", "out", "up", "off", "about", "which", "who",
+    "what", "when", "where", "how", "they", "their", "there", "has", "have",
+    "been", "was", "were", "but", "so", "like", "etc", "including", "include",
+    "items", "item", "material", "materials", "waste", "search", "home", "solid",
+    "transfer", "station", "stations", "facility", "facilities", "site", "sites",
+} | CONTEXT_WORDS
+
+_TOKEN = re.compile(r"[a-z][a-z0-9#'-]*|#\d")
+
+
+def read_body(path: Path) -> str:
+    """Return the document text without its YAML front matter."""
+    text = path.read_text(encoding="utf-8", errors="ignore")
+    if text.startswith("---"):
+        parts = text.split("---", 2)
+        if len(parts) == 3:
+            return parts[2]
+    return text
+
+
+def mine(docs_dir: Path, window: int, max_ngram: int) -> Counter:
+    counts: Counter = Counter()
+    for path in sorted(docs_dir.glob("*.md")):
+        tokens = _TOKEN.findall(read_body(path).lower())
+        anchors = [i for i, tok in enumerate(tokens) if tok in CONTEXT_WORDS]
+        near: set[int] = set()
+        for i in anchors:
+            near.update(range(max(0, i - window), min(len(tokens), i + window + 1)))
+        for i in sorted(near):
+            for n in range(1, max_ngram + 1):
+                gram = tokens[i : i + n]
+                if len(gram) < n or (i + n - 1) not in near:
+                    break
+                if gram[0] in STOPWORDS or gram[-1] in STOPWORDS:
+                    continue
+                if any(len(tok) < 3 and not tok.startswith("#") for tok in gram):
+                    continue
+                counts[" ".join(gram)] += 1
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=Path, default=DOCS_DIR)
+    parser.add_argument("--taxonomy", type=Path, default=TAXONOMY_PATH)
+    parser.add_argument("--min-count", type=int, default=5)
+    parser.add_argument("--top", type=int, default=30, help="candidates per category")
+    parser.add_argument("--window", type=int, default=6)
+    parser.add_argument("--max-ngram", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.taxonomy, encoding="utf-8") as f:
+        taxonomy = yaml.safe_load(f) or {}
+    expander = MaterialExpander.from_dict(taxonomy)
+
+    grouped: dict[str, list[tuple[str, int]]] = {}
+    for phrase, count in mine(args.docs, args.window, args.max_ngram).most_common():
+        if count < args.min_count or normalize_phrase(phrase) in expander.triggers:
+            continue
+        matched = expander.match_categories(phrase)
+        category = matched[0].name if matched else "_uncategorized"
+        bucket = grouped.setdefault(category, [])
+        if len(bucket) < args.top:
+            bucket.append((phrase, count))
+
+    out = {
+        category: [{"trigger": phrase, "count": count} for phrase, count in items]
+        for category, items in sorted(grouped.items())
+    }
+    print(yaml.safe_dump({"candidates": out}, sort_keys=False, allow_unicode=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Admission control for retrievals: bounded concurrency, bounded queue.
+
+At most ``RAG_MAX_INFLIGHT_QUERIES`` retrievals run at once per worker.
+Further requests wait in a queue of at most ``RAG_MAX_QUEUED_QUERIES``.
+Beyond that, ``Overloaded`` is raised and the caller answers 503 right away.
+The same happens when the request could not finish before its deadline
+anyway (expected queue wait plus the recent average retrieval time), or when
+the deadline passes while it is queued.
+
+Retrieval is partly CPU-bound (scoring runs under the GIL between NumPy
+calls), so more concurrent retrievals per worker make each one slower
+rather than raising throughput. Under overload the admitted requests keep
+their normal latency and the rest fail fast, instead of every request
+queueing until the client times out.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+MAX_INFLIGHT = int(os.getenv("RAG_MAX_INFLIGHT_QUERIES", "4"))
+MAX_QUEUED = int(os.getenv("RAG_MAX_QUEUED_QUERIES", "16"))
+
+# Weight of the latest retrieval in the moving average of retrieval time
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """No capacity for the request; retry later."""
+
+
+class AdmissionControl:
+    """Limits concurrent retrievals of one worker (one event loop)."""
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, max_queued: int = MAX_QUEUED):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(max_inflight)
+        # Moving average of how long a retrieval holds its slot
+        self.service_time: Optional[float] = None
+        self.inflight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+    @asynccontextmanager
+    async def slot(self, timeout: float) -> AsyncIterator[None]:
+        """Hold a retrieval slot, waiting at most ``timeout`` seconds in the queue."""
+        if self._slots.locked():
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise Overloaded("retrieval queue is full")
+            if self.expected_wait() + (self.service_time or 0.0) >= timeout:
+                self.rejected += 1
+                raise Overloaded("retrieval would not finish before the deadline")
+            self.queued += 1
+            try:
+                await asyncio.wait_for(
+                    self._slots.acquire(), None if timeout == float("inf") else timeout
+                )
+            except asyncio.TimeoutError:
+                self.expired += 1
+                raise Overloaded("deadline passed while queued") from None
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+        self.admitted += 1
+        self.inflight += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._slots.release()
+            elapsed = time.monotonic() - start
+            self.service_time = (
+                elapsed
+                if self.service_time is None
+                else self.service_time + _SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            )
+
+    def expected_wait(self) -> float:
+        """Seconds a request joining the queue now can expect to wait for a slot."""
+        if self.service_time is None:
+            return 0.0
+        return self.service_time * (self.queued + 1) / self.max_inflight
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queued": self.max_queued,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired_in_queue": self.expired,
+            "service_time_ms": round(self.service_time * 1e3, 1) if self.service_time is not None else None,
+        }
@@ -1,36 +1,93 @@
 """FastAPI HTTP service for RAG queries."""
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel, Field, model_validator
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+import asyncio
+import hmac
 import os
+import time
 from pathlib import Path
-from llama_index.core import Settings
-from rag_query import query_rag, RAG_INDEX_PATH
-import re
-
-app = FastAPI(title="RecycLens RAG Service", version="1.0.0")
-
-
-def strip_links(text: str) -> str:
-    if not text:
-        return ""
+import rag_query
+from rag_query import get_index_manager, load_serving_index, query_key, query_rag, RAG_INDEX_PATH
+from admission import AdmissionControl, Overloaded
+from capture import QueryCapture, capture_entry
+from county_geo import get_county_grid
+from deadline import DEADLINE_HEADER, MIN_TERM_BUDGET, Deadline
+from responses import CompressionMiddleware, FastJSONResponse
+import embedding_client
+from material_synonyms import get_material_expander
+from sessions import Retrieval, Session, SessionStore
+from singleflight import SingleFlight
+import profiler
+from snapshots import resolve_current, set_current, snapshot_entry
+from text_normalize import CHUNK_SEPARATOR
+from tracing import TracingMiddleware
+
+app = FastAPI(
+    title="RecycLens RAG Service", version="1.0.0", default_response_class=FastJSONResponse
+)
 
-    # Remove markdown citations like: ([label](https://...))
-    text = re.sub(r"\(\s*\[[^\]]+\]\((https?:\/\/[^\s)]+)\)\s*\)", "", text)
+# Identical concurrent /query requests share one retrieval
+_query_flight = SingleFlight()
+# Bounded concurrency and queue for retrievals; beyond it /query answers 503
+_admission = AdmissionControl()
+# Retrievals of chat conversations, reused by their later turns (sessions.py)
+_sessions = SessionStore()
+get_index_manager().add_swap_listener(lambda old, new: _sessions.clear())
+# Sampled /query requests logged for shadow replay (capture.py); off by default
+_capture = QueryCapture()
+
+# How often a waiting /query checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.1
+# /query requests whose client hung up before the answer was ready
+client_disconnects = 0
+
+
+@app.on_event("startup")
+async def compile_material_taxonomy():
+    """Compile the material synonym automaton before the first request."""
+    expander = get_material_expander()
+    print(f"✓ Compiled material taxonomy ({len(expander.triggers)} triggers)")
+
+
+@app.on_event("startup")
+async def index_county_boundaries():
+    """Build the county point-in-polygon grid before the first request."""
+    grid = get_county_grid()
+    if grid is None:
+        print("County boundaries not found; coordinates will be ignored")
+    else:
+        print(f"✓ Indexed county boundaries ({grid.stats()['counties']} counties)")
+
+
+@app.on_event("startup")
+async def map_serving_index():
+    """Attach this worker to the shared, memory-mapped serving index."""
+    try:
+        load_serving_index()
+    except Exception as e:
+        print(f"Serving index not loaded at startup: {e}")
+    get_index_manager().start_watcher()
 
-    # Remove markdown links like: [label](https://...)
-    text = re.sub(r"\[[^\]]+\]\((https?:\/\/[^\s)]+)\)", "", text)
 
-    # Remove any bare URLs that might appear
-    text = re.sub(r"https?:\/\/\S+", "", text)
+@app.on_event("shutdown")
+async def stop_index_watcher():
+    get_index_manager().stop_watcher()
+    for client in embedding_client.embedding_clients():
+        client.close()
 
-    # Clean up leftover whitespace/punctuation spacing
-    text = re.sub(r"\s+([.,;:])", r"\1", text)
-    text = re.sub(r"\s{2,}", " ", text)
 
-    return text.strip()
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Admin endpoints need RAG_ADMIN_TOKEN; without it they do not exist."""
+    expected = os.getenv("RAG_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
 
 
 # CORS middleware to allow requests from backend
@@ -41,6 +98,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli for responses above RAG_COMPRESS_MIN_BYTES (see responses.py)
+app.add_middleware(CompressionMiddleware)
+# W3C trace context for /query; spans go to RAG_TRACE_EXPORTER (see tracing.py)
+app.add_middleware(TracingMiddleware)
 
 
 class RAGQueryRequest(BaseModel):
@@ -50,6 +111,27 @@ class RAGQueryRequest(BaseModel):
     location: str
     condition: Optional[str] = ""
     context: Optional[str] = ""
+    # Geocoded address; when inside a county it decides the county instead
+    # of the location text
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    # Chat conversation: later turns reuse its first retrieval, and materials
+    # the user's ``message`` names are retrieved once each on top of it
+    session_id: Optional[str] = Field(default=None, max_length=128)
+    message: Optional[str] = None
+
+    @model_validator(mode="after")
+    def both_coordinates(self) -> "RAGQueryRequest":
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude and longitude go together")
+        return self
+
+    @property
+    def coordinates(self) -> Optional[tuple[float, float]]:
+        """(longitude, latitude), or None without coordinates."""
+        if self.latitude is None:
+            return None
+        return self.longitude, self.latitude
 
 
 class RAGQueryResponse(BaseModel):
@@ -57,6 +139,25 @@ class RAGQueryResponse(BaseModel):
 
     regulations: str
     sources: list[str]
+    # True when the deadline cut retrieval short and later terms were skipped
+    partial: bool = False
+
+
+class ProfileRequest(BaseModel):
+    """Profile the next ``requests`` queries or ``seconds`` seconds, whichever ends first."""
+
+    requests: Optional[int] = None
+    seconds: Optional[float] = None
+    mode: str = "wall"  # "wall" or "cpu"
+    interval_ms: float = 5.0
+    allocations: bool = False
+    format: str = "json"  # "json" or "collapsed"
+
+
+class ReloadRequest(BaseModel):
+    """Snapshot to activate; defaults to the manifest's current snapshot."""
+
+    version: Optional[str] = None
 
 
 @app.get("/health")
@@ -66,6 +167,7 @@ async def health_check():
         "status": "ok",
         "service": "rag-service",
         "rag_index_path": str(RAG_INDEX_PATH),
+        "index_version": get_index_manager().version,
     }
 
 
@@ -73,46 +175,288 @@ async def health_check():
 async def debug_info():
     """Debug endpoint to verify RAG service configuration."""
     openai_key_set = bool(os.getenv("OPENAI_API_KEY"))
-    index_exists = RAG_INDEX_PATH.exists()
+    resolved = resolve_current(get_index_manager().root)
+    index_exists = resolved is not None
 
-    # Check if embedding model is initialized
-    embedding_model_info = None
-    if hasattr(Settings, "embed_model") and Settings.embed_model is not None:
-        embedding_model_info = str(type(Settings.embed_model).__name__)
+    # Models of the embedding clients created so far
+    embedding_models = [client.model for client in embedding_client.embedding_clients()]
 
     return {
         "status": "ok",
         "openai_api_key_set": openai_key_set,
         "rag_index_exists": index_exists,
-        "rag_index_path": str(RAG_INDEX_PATH),
-        "embedding_model": embedding_model_info,
+        "rag_index_path": str(resolved[1] if resolved else RAG_INDEX_PATH),
+        "index_version": get_index_manager().version,
+        "index_swaps": get_index_manager().swaps,
+        "embedding_models": embedding_models,
         "cwd": os.getcwd(),
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Request coalescing, embedding client and cache counters for this worker."""
+    current = get_index_manager().snapshot
+    return {
+        "index_version": get_index_manager().version,
+        "query_coalescing": _query_flight.stats(),
+        "embedding": [client.stats() for client in embedding_client.embedding_clients()],
+        "lexical_fallbacks": rag_query.lexical_fallbacks,
+        "topic_routing": {
+            "enabled": rag_query.TOPIC_ROUTING,
+            "ranked": rag_query.topic_routed,
+            "direct": rag_query.topic_direct,
+        },
+        "county_from_coordinates": {
+            "resolved": rag_query.geo_resolved,
+            "unresolved": rag_query.geo_unresolved,
+        },
+        "semantic_cache": rag_query.get_semantic_cache().stats(),
+        "sessions": _sessions.stats(),
+        "capture": _capture.stats(),
+        "shards": current.shards.stats() if current is not None else None,
+        "admission": _admission.stats(),
+        "deadlines": {
+            "partial_results": rag_query.partial_results,
+            "cancelled_queries": rag_query.cancelled_queries,
+            "client_disconnects": client_disconnects,
+        },
+    }
+
+
+@app.post("/debug/profile", dependencies=[Depends(require_admin)])
+async def profile_queries(request: ProfileRequest):
+    """
+    Sample the /query hot path and return the profile.
+
+    Waits until the session ends. ``format=collapsed`` returns folded stacks
+    as plain text for flamegraph.pl / speedscope; the JSON form carries them
+    in ``collapsed`` next to the allocation report.
+    """
+    if request.format not in ("json", "collapsed"):
+        raise HTTPException(status_code=422, detail="format must be 'json' or 'collapsed'")
+    try:
+        session = profiler.start_session(
+            mode=request.mode,
+            interval=max(request.interval_ms, 1.0) / 1000,
+            max_requests=request.requests,
+            max_seconds=request.seconds or (None if request.requests else 30.0),
+            allocations=request.allocations,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        while not session.finished:
+            await asyncio.sleep(0.05)
+    finally:
+        # Client gone or server stopping: end the session with it
+        session.stop()
+    if request.format == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    return session.report()
+
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_index(request: Optional[ReloadRequest] = None):
+    """
+    Load a serving-index snapshot in the background and swap it in.
+
+    With a version, the manifest is pointed at it once it has loaded, so
+    the file watcher of every other worker follows. A snapshot that fails
+    to load leaves the manifest and the served snapshot as they were.
+    """
+    manager = get_index_manager()
+    old_version = manager.version
+    version = request.version if request else None
+    try:
+        if version:
+            snapshot_entry(manager.root, version)
+        snapshot = await run_in_threadpool(manager.reload, version)
+        if version:
+            set_current(manager.root, version)
+    except (KeyError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (OSError, ValueError) as e:
+        # Truncated arrays, corrupt metadata or mismatched dims
+        raise HTTPException(status_code=422, detail=f"Snapshot failed to load: {e}")
+    return {"status": "ok", "previous_version": old_version, "version": snapshot.version}
+
+
+async def _until_disconnected(http_request: Request) -> None:
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _retrieve(
+    request: RAGQueryRequest, condition: str, deadline: Deadline, material: Optional[str] = None
+):
+    """Run one retrieval under admission control; cancelling it cancels the deadline."""
+    try:
+        async with _admission.slot(deadline.remaining()):
+            regulations, sources = await run_in_threadpool(
+                profiler.run_profiled,
+                query_rag,
+                material=material or request.material,
+                location=request.location,
+                condition=condition,
+                context=request.context or "",
+                deadline=deadline,
+                coordinates=request.coordinates,
+            )
+    except asyncio.CancelledError:
+        # Every client of this retrieval is gone: stop the worker thread too
+        deadline.cancel()
+        raise
+    return regulations, sources, deadline.partial
+
+
+async def _coalesced(request: RAGQueryRequest, condition: str, deadline: Deadline, material: str):
+    """
+    Retrieval for ``material``, shared with identical concurrent requests.
+
+    A shared retrieval runs under its leader's deadline. When that cut it
+    short, a follower with time left retrieves again instead of returning
+    the leader's partial result.
+    """
+    key = query_key(material, request.location, condition, request.coordinates)
+    while True:
+        led = False
+
+        def lead():
+            nonlocal led
+            led = True
+            return _retrieve(request, condition, deadline, material)
+
+        regulations, sources, partial = await _query_flight.do(key, lead)
+        if not partial or led or deadline.remaining() <= MIN_TERM_BUDGET:
+            return regulations, sources, partial
+
+
+async def _session_answer(
+    session: Session, request: RAGQueryRequest, condition: str, deadline: Deadline
+):
+    """The session's retrieval plus those of the new materials in ``request.message``."""
+    regulations, sources = session.base.regulations, list(session.base.sources)
+    partial = False
+    seen = set(session.categories)
+    for category in get_material_expander().primary_categories(request.message or ""):
+        if category.name in seen:
+            continue
+        seen.add(category.name)
+        retrieval = _sessions.term(session, category.name)
+        if retrieval is None:
+            material = category.terms[0] if category.terms else category.name.replace("_", " ")
+            try:
+                text, found, cut_short = await _coalesced(request, condition, deadline, material)
+            except Overloaded as e:
+                # The conversation's own retrieval is still worth returning
+                print(f"RAG follow-up retrieval shed: {e}")
+                partial = True
+                break
+            retrieval = Retrieval(text, found)
+            if cut_short:
+                partial = True
+            else:
+                _sessions.add_term(session, category.name, retrieval)
+        if retrieval.regulations:
+            regulations = CHUNK_SEPARATOR.join(t for t in (regulations, retrieval.regulations) if t)
+            sources += retrieval.sources
+    return regulations, sources, partial
+
+
+async def _answer(request: RAGQueryRequest, condition: str, deadline: Deadline):
+    """
+    Retrieval for a /query request. With a ``session_id``, a later turn of
+    the same conversation is answered from its session instead.
+    """
+    session = None
+    if request.session_id:
+        key = query_key(request.material, request.location, condition, request.coordinates)
+        session = _sessions.get(request.session_id, key)
+        if session is None:
+            regulations, sources, partial = await _coalesced(request, condition, deadline, request.material)
+            if partial:
+                return regulations, sources, partial
+            categories = get_material_expander().match_categories(request.material)
+            session = _sessions.start(
+                request.session_id,
+                key,
+                Retrieval(regulations, sources),
+                frozenset(c.name for c in categories),
+            )
+    if session is None:
+        return await _coalesced(request, condition, deadline, request.material)
+    return await _session_answer(session, request, condition, deadline)
+
+
 @app.post("/query", response_model=RAGQueryResponse)
-async def query_regulations(request: RAGQueryRequest):
+async def query_regulations(
+    request: RAGQueryRequest,
+    http_request: Request,
+    timeout_ms: Optional[str] = Header(default=None, alias=DEADLINE_HEADER),
+):
     """
     Query RAG for recycling regulations.
 
     Args:
-        request: RAG query request with material, location, condition, and context
+        request: RAG query request with material, location, condition, and
+            context; chat turns add their ``session_id`` and ``message``
+        timeout_ms: ``X-Request-Timeout-Ms``, how long the client will wait
 
     Returns:
-        RAG query response with regulations text and sources
+        RAG query response with regulations text and sources; ``partial`` when
+        the deadline cut retrieval short. 503 with ``Retry-After`` when the
+        worker is saturated.
     """
-    try:
-        regulations, sources = query_rag(
-            material=request.material,
-            location=request.location,
-            condition=request.condition or "",
-            context=request.context or "",
-        )
+    global client_disconnects
+    captured = _capture.sample()
+    start = time.perf_counter()
+
+    def capture(status: int, body_bytes: int = 0, sources: int = 0, partial: bool = False) -> None:
+        if captured:
+            latency_ms = (time.perf_counter() - start) * 1e3
+            version = get_index_manager().version
+            _capture.record(
+                capture_entry(request, timeout_ms, version, status, latency_ms, body_bytes, sources, partial)
+            )
 
-        return RAGQueryResponse(
-            regulations=strip_links(regulations), sources=sources or []
+    try:
+        condition = request.condition or ""
+        deadline = Deadline.from_header(timeout_ms)
+        # Requests with the same retrieval queries attach to one computation,
+        # bounded by the deadline of the request that started it
+        work = asyncio.ensure_future(_answer(request, condition, deadline))
+        watcher = asyncio.ensure_future(_until_disconnected(http_request))
+        try:
+            await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            abandoned = not work.done()
+            if abandoned:
+                work.cancel()
+        if abandoned:
+            client_disconnects += 1
+            print("RAG query abandoned: client disconnected")
+            capture(499)
+            # Nobody reads this; 499 is what proxies log for it
+            return Response(status_code=499)
+        regulations, sources, partial = work.result()
+
+        # Chunk text is link-free already (normalized at index build time).
+        # Rendered straight from a dict: the fields are plain str/list/bool,
+        # so Pydantic validation and jsonable_encoder would only copy them.
+        response = FastJSONResponse(
+            {"regulations": regulations, "sources": sources or [], "partial": partial}
         )
+        capture(200, len(response.body), len(sources or []), partial)
+        return response
 
+    except Overloaded as e:
+        print(f"RAG query shed: {e}")
+        capture(503)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except FileNotFoundError as e:
         # RAG index not found - return empty response instead of error
         # This allows the main flow to continue without RAG
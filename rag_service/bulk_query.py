@@ -0,0 +1,234 @@
+"""Answer many (material, location) pairs offline with ``query_rag``.
+
+For audits ("what does every county say about X") and for pre-warming, one
+``/query`` call at a time is too slow. This runs the same retrieval in a pool
+of worker processes:
+
+- every worker maps the serving snapshot once, when it starts, and keeps it
+  for all the pairs it is given;
+- pairs go to the workers in batches of ``--batch``. A worker first embeds
+  the batch's retrieval queries in one embeddings request
+  (``EmbeddingClient.prefetch``), so its ``query_rag`` calls find them
+  cached;
+- results are written as they arrive, one record per input pair, to JSONL
+  or Parquet (needs ``pyarrow``). ``index`` is the pair's 0-based position in
+  the input, since completion order differs from input order.
+
+Input is a CSV with a header or a JSONL file, with fields ``material`` and
+``location`` and optionally ``condition``, ``latitude`` and ``longitude``.
+
+Usage (from rag_service/):
+    python bulk_query.py pairs.csv -o answers.jsonl --workers 4
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from embedding_client import get_embedding_client
+from rag_query import load_serving_index, plan_queries, query_rag, resolve_county
+
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+DEFAULT_BATCH = 32
+FORMATS = ("jsonl", "parquet")
+
+
+def _coordinates(row: dict) -> Optional[tuple[float, float]]:
+    lat, lon = row.get("latitude"), row.get("longitude")
+    if lat in (None, "") or lon in (None, ""):
+        return None
+    return float(lon), float(lat)
+
+
+def read_pairs(path: Path) -> Iterator[dict]:
+    """Yield ``{index, material, location, condition, coordinates}`` per input row."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for index, row in enumerate(rows):
+            if not row.get("material") or not row.get("location"):
+                raise ValueError(f"{path}: row {index + 1} needs a material and a location")
+            yield {
+                "index": index,
+                "material": row["material"],
+                "location": row["location"],
+                "condition": row.get("condition") or "",
+                "coordinates": _coordinates(row),
+            }
+
+
+def _init_worker(quiet: bool) -> None:
+    if quiet:
+        # query_rag logs every term it tries
+        sys.stdout = open(os.devnull, "w")
+    load_serving_index()
+
+
+def _run_batch(pairs: list[dict]) -> tuple[list[dict], int, float]:
+    """
+    Answer one batch in a worker. Returns the records, the embeddings
+    requests made and the seconds spent embedding the batch up front (not
+    part of any record's ``latency_ms``).
+    """
+    client = None
+    requests = 0
+    start = time.perf_counter()
+    try:
+        client = get_embedding_client(load_serving_index().shards.embed_model)
+        before = client.requests
+        # The first planned query of each pair is the one query_rag embeds
+        # (later terms are only tried when it finds nothing)
+        queries = []
+        for pair in pairs:
+            plan = plan_queries(pair["material"], pair["location"], pair["condition"], pair["coordinates"])
+            if plan:
+                queries.append(plan[0][1])
+        client.prefetch(queries)
+    except Exception as e:
+        # query_rag embeds per query or falls back to keyword search
+        print(f"Batch embedding failed: {e}")
+    prefetch_seconds = time.perf_counter() - start
+    records = []
+    for pair in pairs:
+        start = time.perf_counter()
+        text, sources = query_rag(
+            pair["material"], pair["location"], pair["condition"], coordinates=pair["coordinates"]
+        )
+        records.append({
+            "index": pair["index"],
+            "material": pair["material"],
+            "location": pair["location"],
+            "condition": pair["condition"],
+            "county": resolve_county(pair["location"], pair["coordinates"]),
+            "regulations": text,
+            "sources": sources,
+            "latency_ms": (time.perf_counter() - start) * 1e3,
+        })
+    if client is not None:
+        requests = client.requests - before
+    return records, requests, prefetch_seconds
+
+
+class JsonlWriter:
+    def __init__(self, path: Path):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, records: list[dict]) -> None:
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetWriter:
+    """One row group per batch of records."""
+
+    def __init__(self, path: Path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("index", pa.int64()),
+            ("material", pa.string()),
+            ("location", pa.string()),
+            ("condition", pa.string()),
+            ("county", pa.string()),
+            ("regulations", pa.string()),
+            ("sources", pa.list_(pa.string())),
+            ("latency_ms", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, records: list[dict]) -> None:
+        self._writer.write_table(self._pa.Table.from_pylist(records, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _batches(pairs: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    while batch := list(islice(pairs, size)):
+        yield batch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", type=Path, help="CSV (with header) or JSONL of material/location pairs")
+    parser.add_argument("-o", "--output", type=Path, required=True)
+    parser.add_argument("--format", choices=FORMATS, help="default: from the output's suffix")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--batch", type=int, default=DEFAULT_BATCH,
+        help=f"pairs per task, embedded in one request (default: {DEFAULT_BATCH})",
+    )
+    parser.add_argument("--verbose", action="store_true", help="keep the workers' retrieval logs")
+    args = parser.parse_args()
+
+    fmt = args.format or ("parquet" if args.output.suffix.lower() == ".parquet" else "jsonl")
+    if fmt == "parquet" and not PYARROW_AVAILABLE:
+        raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); use a .jsonl output instead")
+    writer = ParquetWriter(args.output) if fmt == "parquet" else JsonlWriter(args.output)
+
+    latencies: list[float] = []
+    answered = 0
+    embed_requests = 0
+    prefetch_seconds = 0.0
+
+    def collect(future) -> None:
+        nonlocal answered, embed_requests, prefetch_seconds
+        records, requests, seconds = future.result()
+        writer.write(records)
+        latencies.extend(r["latency_ms"] for r in records)
+        answered += sum(1 for r in records if r["sources"])
+        embed_requests += requests
+        prefetch_seconds += seconds
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(not args.verbose,)
+        ) as pool:
+            pending = set()
+            for batch in _batches(read_pairs(args.input), args.batch):
+                pending.add(pool.submit(_run_batch, batch))
+                # A few batches queued per worker: input is read as it is needed
+                if len(pending) >= 2 * args.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+            for future in pending:
+                collect(future)
+    finally:
+        writer.close()
+    wall = time.perf_counter() - start
+
+    if not latencies:
+        print("No pairs in the input", file=sys.stderr)
+        return
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(
+        f"{len(latencies)} pairs in {wall:.1f} s with {args.workers} workers "
+        f"({len(latencies) / wall:.1f} pairs/s), {answered} with sources -> {args.output}\n"
+        f"per pair: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, max {max(latencies):.1f} ms; "
+        f"{embed_requests} embeddings requests, {prefetch_seconds:.1f} s of batch embedding",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Sampled capture of ``/query`` traffic for shadow replay.
+
+With ``RAG_CAPTURE_FILE`` set, a share ``RAG_CAPTURE_SAMPLE_RATE`` (default
+0.05) of ``/query`` requests is appended to that file, one compact JSON line
+each: the retrieval inputs (material, location, condition, coordinates, chat
+session and message, deadline) and what was served (snapshot version,
+latency, response bytes, source count, status). Empty fields are left out.
+``shadow_replay.py`` replays the log against two snapshots, and
+``bulk_query.py`` reads it as input as well.
+
+Lines are written by a background thread, so a request never waits for the
+disk. When the writer falls behind, lines are dropped. Every line is one
+``O_APPEND`` write, so the workers of a service can share the file. Capture
+stops once the file reaches ``RAG_CAPTURE_MAX_MB`` (default 256). Locations
+and chat messages are stored as users sent them, so treat the file like
+other logs with user input.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+CAPTURE_FILE = os.getenv("RAG_CAPTURE_FILE", "")
+SAMPLE_RATE = float(os.getenv("RAG_CAPTURE_SAMPLE_RATE", "0.05"))
+MAX_BYTES = int(float(os.getenv("RAG_CAPTURE_MAX_MB", "256")) * 2**20)
+
+_QUEUE_SIZE = 1024
+
+
+class QueryCapture:
+    def __init__(
+        self, path: Optional[str] = CAPTURE_FILE, sample_rate: float = SAMPLE_RATE, max_bytes: int = MAX_BYTES
+    ):
+        self.path = Path(path) if path else None
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._queue: queue.Queue = queue.Queue(_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.captured = 0
+        self.dropped = 0
+        self.over_limit = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None and self.sample_rate > 0
+
+    def sample(self) -> bool:
+        """Whether to capture the request being started."""
+        return self.enabled and random.random() < self.sample_rate
+
+    def record(self, entry: dict) -> None:
+        """Queue one request's line; never blocks."""
+        if self._writer is None:
+            with self._start_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="rag-capture", daemon=True)
+                    self._writer.start()
+        line = json.dumps(
+            {k: v for k, v in entry.items() if v is not None and v != "" and v is not False},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        try:
+            self._queue.put_nowait(line.encode("utf-8") + b"\n")
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            while True:
+                data = self._queue.get()
+                try:
+                    if os.fstat(fd).st_size + len(data) > self.max_bytes:
+                        self.over_limit += 1
+                        continue
+                    os.write(fd, data)
+                    self.captured += 1
+                except OSError as e:
+                    self.dropped += 1
+                    print(f"Query capture write failed: {e}")
+        finally:
+            os.close(fd)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "over_limit": self.over_limit,
+        }
+
+
+def capture_entry(
+    request,
+    timeout_ms: Optional[str],
+    version: Optional[str],
+    status: int,
+    latency_ms: float,
+    body_bytes: int = 0,
+    sources: int = 0,
+    partial: bool = False,
+) -> dict:
+    """The captured line of one ``/query`` request."""
+    return {
+        "ts": round(time.time(), 3),
+        "material": request.material,
+        "location": request.location,
+        "condition": request.condition,
+        "latitude": request.latitude,
+        "longitude": request.longitude,
+        "session_id": request.session_id,
+        "message": request.message,
+        "timeout_ms": timeout_ms,
+        "version": version,
+        "status": status,
+        "latency_ms": round(latency_ms, 2),
+        "bytes": body_bytes,
+        "source_count": sources,
+        "partial": partial,
+    }
@@ -0,0 +1,112 @@
+"""County detection for request locations.
+
+``counties.yaml`` lists every county of the state with its spellings and the
+places that identify it. The detector looks for, in order of precedence,
+"<county> County" and a place name, as whole words of the normalized
+location, and then a bare county name. A bare name only counts as a whole
+comma-separated part of the location (a trailing state, ZIP code or country
+dropped), so "123 Madison Ave, New York, NY" is not read as Madison County.
+The result is the county's shard name.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+COUNTIES_PATH = Path(os.getenv("RAG_COUNTIES", Path(__file__).parent / "counties.yaml"))
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_ZIP = re.compile(r"\b\d{5}(?: \d{4})?\b")
+# Parts of a location after the place itself
+_STATE_NAMES = ("ny", "new york")
+_COUNTRIES = ("us", "usa", "united states", "united states of america")
+
+
+def normalize_location(text: str) -> str:
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _alternation(phrases: dict[str, str]) -> Optional[re.Pattern]:
+    if not phrases:
+        return None
+    # Longest first, so "saratoga springs" wins over "saratoga"
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(p) for p in ordered) + r")\b")
+
+
+def _place_parts(location: str) -> list[str]:
+    """The normalized comma-separated parts of ``location`` that may name a place, in order."""
+    parts = [" ".join(_ZIP.sub(" ", normalize_location(p)).split()) for p in location.split(",")]
+    parts = [p for p in parts if p]
+    while len(parts) > 1 and parts[-1] in _COUNTRIES:
+        parts.pop()
+    # Only one: in "New York, NY" the first is the city
+    if len(parts) > 1 and parts[-1] in _STATE_NAMES:
+        parts.pop()
+    # "Albany NY" without a comma
+    for state in _STATE_NAMES:
+        parts = [p[: -len(state) - 1] if p.endswith(f" {state}") else p for p in parts]
+    return parts
+
+
+class CountyDetector:
+    def __init__(self, counties: dict[str, dict]):
+        with_suffix: dict[str, str] = {}
+        places: dict[str, str] = {}
+        bare: dict[str, str] = {}
+        for key, entry in counties.items():
+            for name in entry.get("names", []):
+                name = normalize_location(name)
+                if name.endswith(" county"):
+                    with_suffix[name] = key
+                else:
+                    with_suffix[f"{name} county"] = key
+                    bare[name] = key
+            for place in entry.get("places", []):
+                places[normalize_location(place)] = key
+        self.counties = frozenset(counties)
+        self._display = {}
+        for key, entry in counties.items():
+            name = (entry.get("names") or [key])[0]
+            self._display[key] = name if name.lower().endswith(" county") else f"{name} County"
+        self._tiers = [
+            (pattern, table)
+            for table in (with_suffix, places)
+            if (pattern := _alternation(table)) is not None
+        ]
+        self._bare = bare
+
+    @classmethod
+    def from_file(cls, path: Path = COUNTIES_PATH) -> "CountyDetector":
+        with open(path, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return cls(data.get("counties") or {})
+
+    def detect(self, location: str) -> Optional[str]:
+        """Return the county key for ``location``, or None if none is recognized."""
+        text = normalize_location(location)
+        for pattern, table in self._tiers:
+            match = pattern.search(text)
+            if match:
+                return table[match.group(0)]
+        for part in _place_parts(location):
+            if part in self._bare:
+                return self._bare[part]
+        return None
+
+    def display_name(self, county: str) -> str:
+        """How retrieval queries spell the county ("St. Lawrence County")."""
+        return self._display.get(county) or f"{county.capitalize()} County"
+
+
+_detector: Optional[CountyDetector] = None
+
+
+def get_county_detector() -> CountyDetector:
+    """Return the detector compiled from the gazetteer file (cached singleton)."""
+    global _detector
+    if _detector is None:
+        _detector = CountyDetector.from_file()
+    return _detector
@@ -0,0 +1,220 @@
+"""County resolution from coordinates: point-in-polygon over a uniform grid.
+
+``county_boundaries.json.gz`` holds the county polygons of the state (Census
+cartographic boundaries, written by ``build_county_boundaries.py``). At load
+they are indexed in a grid of ``RAG_GEO_CELL_DEGREES`` cells:
+
+- a cell no boundary passes through lies wholly inside one county (or none),
+  so the lookup is one list index;
+- a cell a boundary crosses keeps, for each county with edges in it, whether
+  the cell's centre is inside that county and the edges within the cell. The
+  point is inside when that parity, flipped once per edge crossed by the
+  segment from the centre to the point, says so. Only the few edges of one
+  cell are tested, never a whole polygon.
+
+Points outside every polygon (water just off the clipped shoreline, piers)
+take the county of the nearest boundary within ``RAG_GEO_SNAP_KM``.
+"""
+import gzip
+import json
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+BOUNDARIES_PATH = Path(
+    os.getenv("RAG_COUNTY_BOUNDARIES", Path(__file__).parent / "county_boundaries.json.gz")
+)
+GRID_CELL_DEGREES = float(os.getenv("RAG_GEO_CELL_DEGREES", "0.02"))
+SNAP_KM = float(os.getenv("RAG_GEO_SNAP_KM", "0.5"))
+
+# Boundary coordinates are stored as integers in 1e-5 degrees
+COORDINATE_SCALE = 100_000
+
+_KM_PER_DEGREE_LAT = 110.57
+_KM_PER_DEGREE_LON = 111.32
+
+
+def load_boundaries(path: Path = BOUNDARIES_PATH) -> dict[str, list[np.ndarray]]:
+    """County key -> rings, each an ``(n, 2)`` array of (longitude, latitude)."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    scale = data.get("scale", COORDINATE_SCALE)
+    counties = {}
+    for key, rings in data["counties"].items():
+        counties[key] = [
+            np.cumsum(np.asarray(ring, dtype=np.int64).reshape(-1, 2), axis=0) / scale
+            for ring in rings
+        ]
+    return counties
+
+
+def _edges(rings: list[np.ndarray]) -> np.ndarray:
+    """``(n, 4)`` array of the (ax, ay, bx, by) edges of closed rings."""
+    parts = []
+    for ring in rings:
+        if len(ring) < 3:
+            continue
+        if (ring[0] == ring[-1]).all():
+            ring = ring[:-1]
+        parts.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+    return np.vstack(parts) if parts else np.empty((0, 4))
+
+
+class CountyGrid:
+    """Point-in-polygon lookups of one state's counties."""
+
+    def __init__(self, counties: dict[str, list[np.ndarray]], cell: float = GRID_CELL_DEGREES):
+        self.keys = list(counties)
+        self.cell = cell
+        edges = [_edges(rings) for rings in counties.values()]
+        every = np.vstack(edges)
+        self.x0 = float(min(every[:, 0].min(), every[:, 2].min()))
+        self.y0 = float(min(every[:, 1].min(), every[:, 3].min()))
+        self.nx = int(math.floor((max(every[:, 0].max(), every[:, 2].max()) - self.x0) / cell)) + 1
+        self.ny = int(math.floor((max(every[:, 1].max(), every[:, 3].max()) - self.y0) / cell)) + 1
+        self.edge_count = len(every)
+
+        owner = np.full((self.ny, self.nx), -1, dtype=np.int64)
+        for index, county_edges in enumerate(edges):
+            owner[self._centres_inside(county_edges)] = index
+
+        # cell -> {county: [edge, ...]} for the cells boundaries pass through
+        crossed: dict[int, dict[int, list[tuple[float, float, float, float]]]] = {}
+        for index, county_edges in enumerate(edges):
+            lo_x = np.floor((np.minimum(county_edges[:, 0], county_edges[:, 2]) - self.x0) / cell)
+            hi_x = np.floor((np.maximum(county_edges[:, 0], county_edges[:, 2]) - self.x0) / cell)
+            lo_y = np.floor((np.minimum(county_edges[:, 1], county_edges[:, 3]) - self.y0) / cell)
+            hi_y = np.floor((np.maximum(county_edges[:, 1], county_edges[:, 3]) - self.y0) / cell)
+            # Every cell of the edge's bounding box: a superset of the cells it
+            # crosses, which only costs a few extra tests
+            for edge, i0, i1, j0, j1 in zip(
+                county_edges.tolist(), lo_x.astype(int), hi_x.astype(int), lo_y.astype(int), hi_y.astype(int)
+            ):
+                for j in range(j0, min(j1, self.ny - 1) + 1):
+                    for i in range(i0, min(i1, self.nx - 1) + 1):
+                        crossed.setdefault(j * self.nx + i, {}).setdefault(index, []).append(tuple(edge))
+
+        # int: the county (or -1) of the whole cell; tuple: (centre x, centre y,
+        # [(county, centre inside, edges), ...]) for a cell a boundary crosses
+        self._cells: list = owner.ravel().tolist()
+        for cell_id, by_county in crossed.items():
+            j, i = divmod(cell_id, self.nx)
+            centre_owner = int(owner[j, i])
+            candidates = [
+                (county, county == centre_owner, tuple(county_edges))
+                for county, county_edges in by_county.items()
+            ]
+            if centre_owner >= 0 and centre_owner not in by_county:
+                candidates.append((centre_owner, True, ()))
+            # The county around the centre first: the likeliest answer
+            candidates.sort(key=lambda c: not c[1])
+            self._cells[cell_id] = (self.x0 + (i + 0.5) * cell, self.y0 + (j + 0.5) * cell, candidates)
+        self.crossed_cells = len(crossed)
+
+    @classmethod
+    def from_file(cls, path: Path = BOUNDARIES_PATH, cell: float = GRID_CELL_DEGREES) -> "CountyGrid":
+        return cls(load_boundaries(path), cell)
+
+    def _centres_inside(self, edges: np.ndarray) -> np.ndarray:
+        """Boolean ``(ny, nx)`` mask of the cell centres inside the rings of ``edges``.
+
+        Scanline crossing count: for every cell row, the x where each edge
+        crosses the row's centre line; a centre with an odd number of
+        crossings to its right is inside.
+        """
+        ax, ay, bx, by = edges.T
+        low, high = np.minimum(ay, by), np.maximum(ay, by)
+        # Rows whose centre line y satisfies low <= y < high (half-open, so a
+        # vertex on the line is counted once)
+        first = np.ceil((low - self.y0) / self.cell - 0.5).astype(np.int64)
+        last = np.ceil((high - self.y0) / self.cell - 0.5).astype(np.int64)
+        counts = np.maximum(last - first, 0)
+        rows = np.repeat(first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        edge = np.repeat(np.arange(len(edges)), counts)
+        y = self.y0 + (rows + 0.5) * self.cell
+        x = ax[edge] + (y - ay[edge]) * (bx[edge] - ax[edge]) / (by[edge] - ay[edge])
+        # Centres left of x (cx < x) are those with column < ceil((x - x0) / cell - 0.5)
+        stop = np.clip(np.ceil((x - self.x0) / self.cell - 0.5), 0, self.nx).astype(np.int64)
+        flips = np.zeros((self.ny, self.nx + 1), dtype=np.int64)
+        np.add.at(flips, (rows, 0), 1)
+        np.add.at(flips, (rows, stop), -1)
+        return (np.cumsum(flips, axis=1)[:, : self.nx] % 2).astype(bool)
+
+    def locate(self, lon: float, lat: float) -> Optional[str]:
+        """County key containing (``lon``, ``lat``), or None outside every county."""
+        i = math.floor((lon - self.x0) / self.cell)
+        j = math.floor((lat - self.y0) / self.cell)
+        if 0 <= i < self.nx and 0 <= j < self.ny:
+            entry = self._cells[j * self.nx + i]
+            if type(entry) is int:
+                if entry >= 0:
+                    return self.keys[entry]
+            else:
+                cx, cy, candidates = entry
+                dx, dy = lon - cx, lat - cy
+                for county, inside, edges in candidates:
+                    for ax, ay, bx, by in edges:
+                        # Edge endpoints on opposite sides of the centre-point
+                        # line (half-open: a vertex on the line counts once) ...
+                        if (dx * (ay - cy) - dy * (ax - cx) > 0) == (dx * (by - cy) - dy * (bx - cx) > 0):
+                            continue
+                        # ... and centre and point on opposite sides of the edge
+                        ex, ey = bx - ax, by - ay
+                        if (ex * (cy - ay) - ey * (cx - ax) > 0) != (ex * (lat - ay) - ey * (lon - ax) > 0):
+                            inside = not inside
+                    if inside:
+                        return self.keys[county]
+        return self.nearest(lon, lat, SNAP_KM)
+
+    def nearest(self, lon: float, lat: float, max_km: float) -> Optional[str]:
+        """County of the nearest boundary edge within ``max_km``, if any."""
+        if max_km <= 0:
+            return None
+        kx = _KM_PER_DEGREE_LON * math.cos(math.radians(lat))
+        ky = _KM_PER_DEGREE_LAT
+        reach_x = math.ceil(max_km / kx / self.cell)
+        reach_y = math.ceil(max_km / ky / self.cell)
+        i0 = math.floor((lon - self.x0) / self.cell)
+        j0 = math.floor((lat - self.y0) / self.cell)
+        best, best_km = None, max_km
+        for j in range(max(j0 - reach_y, 0), min(j0 + reach_y, self.ny - 1) + 1):
+            for i in range(max(i0 - reach_x, 0), min(i0 + reach_x, self.nx - 1) + 1):
+                entry = self._cells[j * self.nx + i]
+                if type(entry) is int:
+                    continue
+                for county, _, edges in entry[2]:
+                    for ax, ay, bx, by in edges:
+                        # Distance to the segment, in km on a local flat projection
+                        px, py = (lon - ax) * kx, (lat - ay) * ky
+                        ex, ey = (bx - ax) * kx, (by - ay) * ky
+                        length = ex * ex + ey * ey
+                        t = min(max((px * ex + py * ey) / length, 0.0), 1.0) if length else 0.0
+                        km = math.hypot(px - t * ex, py - t * ey)
+                        if km <= best_km:
+                            best, best_km = county, km
+        return self.keys[best] if best is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "counties": len(self.keys),
+            "edges": self.edge_count,
+            "grid": [self.nx, self.ny],
+            "cell_degrees": self.cell,
+            "boundary_cells": self.crossed_cells,
+        }
+
+
+_grid: Optional[CountyGrid] = None
+
+
+def get_county_grid() -> Optional[CountyGrid]:
+    """Return the grid built from the boundaries file (cached singleton); None without the file."""
+    global _grid
+    if _grid is None:
+        if not BOUNDARIES_PATH.exists():
+            return None
+        _grid = CountyGrid.from_file()
+    return _grid
@@ -0,0 +1,77 @@
+"""Request deadlines and cooperative cancellation for the query path.
+
+The Node backend gives up on ``/query`` after ``RAG_TIMEOUT_MS`` and sends
+the time it is still willing to wait in the ``X-Request-Timeout-Ms`` header
+(relative, so the two hosts' clocks do not need to agree). ``query_rag``
+checks the deadline between retrieval terms and the retriever checks it
+between stages (embed, search). Once it has passed, the terms retrieved so
+far are returned as a partial result instead of running the rest for a
+client that is no longer listening.
+
+A deadline is also cancelled outright when every client waiting on the
+request has disconnected; the retrieval thread notices at its next check.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# Deadline of requests that do not send the header (0 = none)
+DEFAULT_TIMEOUT = float(os.getenv("RAG_QUERY_TIMEOUT_SECONDS", "30"))
+# Do not start another retrieval term with less time than this left
+MIN_TERM_BUDGET = float(os.getenv("RAG_MIN_TERM_BUDGET_MS", "100")) / 1000
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time, or was cancelled, before ``stage``."""
+
+    def __init__(self, stage: str, cancelled: bool = False):
+        super().__init__(f"{'cancelled' if cancelled else 'deadline exceeded'} before {stage}")
+        self.stage = stage
+        self.cancelled = cancelled
+
+
+class Deadline:
+    """Point in time by which a request must be answered, plus a cancel flag."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+        # Set by query_rag when it returned fewer terms than it planned
+        self.partial = False
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "Deadline":
+        """Deadline from the header value in ms; missing or malformed values get the default."""
+        try:
+            return cls(max(0.0, float(value) / 1000))
+        except (TypeError, ValueError):
+            return cls(DEFAULT_TIMEOUT or None)
+
+    def remaining(self) -> float:
+        """Seconds left (``inf`` without a deadline, 0 once cancelled)."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str, budget: float = 0.0) -> None:
+        """Raise ``DeadlineExceeded`` unless more than ``budget`` seconds are left."""
+        if self.cancelled:
+            raise DeadlineExceeded(stage, cancelled=True)
+        if self.remaining() <= budget:
+            raise DeadlineExceeded(stage)
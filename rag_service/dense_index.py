@@ -0,0 +1,267 @@
+"""Compact dense-vector index for the RAG service.
+
+``store_rag_index.py`` exports the chunk embeddings next to the llama_index
+storage as a small set of ``.npy`` files:
+
+    meta.json           format, quantization, dimensions, embed model, node ids
+    vectors.f32.npy     full-precision, L2-normalized vectors (n, dims)
+    vectors.q.npy       scan matrix: float16 or int8 (n, scan_dims); not written
+                        for an unreduced float32 scan, which uses vectors.f32.npy
+    scales.npy          per-vector int8 scale (int8 only)
+    projection.npy      (dims, scan_dims) reduction matrix (optional)
+
+The service scans the quantized matrix and rescores the best candidates
+against the full-precision rows. Every file is memory-mapped read-only: the
+scan matrix stays in the page cache shared by all worker processes, and of
+the full-precision file only the candidate rows are ever read.
+"""
+import json
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+FORMAT_VERSION = 1
+# llama_index's OpenAIEmbedding default, used to build the index
+DEFAULT_EMBED_MODEL = "text-embedding-ada-002"
+QUANTIZATIONS = ("float32", "float16", "int8")
+REDUCTIONS = ("pca", "truncate")
+
+# Candidates rescored in full precision, as a multiple of top_k
+RESCORE_FACTOR = 4
+# Rows converted to float32 at a time while scanning a quantized matrix
+SCAN_BLOCK_ROWS = 2048
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def reduce_dims(
+    vectors: np.ndarray, dims: int, method: str = "pca"
+) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Reduce ``vectors`` to ``dims`` columns.
+
+    Returns the reduced, re-normalized vectors and the projection matrix to
+    apply to queries (None for truncation, where queries are just sliced).
+    """
+    if method not in REDUCTIONS:
+        raise ValueError(f"Unknown reduction {method!r}, expected one of {REDUCTIONS}")
+    if dims >= vectors.shape[1]:
+        return vectors, None
+    if method == "truncate":
+        return normalize_rows(vectors[:, :dims]), None
+    centered = vectors - vectors.mean(axis=0, keepdims=True)
+    # Principal directions of the corpus; projection keeps the uncentered
+    # vectors so that query and chunk stay in the same space.
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    projection = np.ascontiguousarray(vt[:dims].T, dtype=np.float32)
+    return normalize_rows(vectors @ projection), projection
+
+
+def pca_projection(count: int, total: np.ndarray, gram: np.ndarray, dims: int) -> np.ndarray:
+    """
+    The PCA projection ``reduce_dims`` would fit, from streamed moments.
+
+    ``total`` is the sum of the normalized rows and ``gram`` the sum of their
+    outer products, so a corpus can be fitted without holding all of it.
+    """
+    mean = total / count
+    covariance = gram / count - np.outer(mean, mean)
+    # eigh sorts eigenvalues ascending: the principal directions come last
+    _, vectors = np.linalg.eigh(covariance)
+    return np.ascontiguousarray(vectors[:, ::-1][:, :dims], dtype=np.float32)
+
+
+def quantize(
+    vectors: np.ndarray, quantization: str
+) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Return the scan matrix and, for int8, the per-vector scales."""
+    if quantization == "float32":
+        return np.ascontiguousarray(vectors, dtype=np.float32), None
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.round(vectors / scales[:, None]).astype(np.int8)
+        return q, scales.astype(np.float32)
+    raise ValueError(
+        f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}"
+    )
+
+
+def default_quantization(dims: Optional[int]) -> str:
+    """
+    Scan matrix type when none is chosen: int8 with a dimension reduction,
+    float32 otherwise. At full dimension the int8 scan converts every block
+    to float32 and is slower than scanning float32 directly (5000 x 1536:
+    8.3 ms vs 3.2 ms; int8 at 256 dims takes 1.0 ms).
+    """
+    return "int8" if dims else "float32"
+
+
+def write_dense_index(
+    out_dir: Path,
+    node_ids: list[str],
+    vectors: np.ndarray,
+    quantization: Optional[str] = None,
+    dims: Optional[int] = None,
+    reduction: str = "pca",
+    embed_model: Optional[str] = None,
+    projection: Optional[np.ndarray] = None,
+) -> dict:
+    """
+    Write the serving export for ``vectors`` (one row per node id).
+
+    ``projection`` reuses a reduction fitted elsewhere (e.g. on the whole
+    corpus when writing one export per shard) instead of fitting one here.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if quantization is None:
+        quantization = default_quantization(projection.shape[1] if projection is not None else dims)
+    full = normalize_rows(vectors)
+    scan = full
+    if projection is not None:
+        scan = normalize_rows(full @ projection)
+    elif dims:
+        scan, projection = reduce_dims(full, dims, reduction)
+    q, scales = quantize(scan, quantization)
+
+    np.save(out_dir / "vectors.f32.npy", full)
+    # An unreduced float32 scan matrix would be a copy of the full vectors
+    if scan is full and quantization == "float32":
+        q_array = None
+    else:
+        q_array = q
+    for name, array in (("vectors.q.npy", q_array), ("scales.npy", scales), ("projection.npy", projection)):
+        path = out_dir / name
+        if array is not None:
+            np.save(path, array)
+        elif path.exists():
+            path.unlink()
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "count": int(full.shape[0]),
+        "dims": int(full.shape[1]),
+        "scan_dims": int(q.shape[1]),
+        "quantization": quantization,
+        "reduction": reduction if q.shape[1] < full.shape[1] else None,
+        "embed_model": embed_model,
+        "node_ids": list(node_ids),
+    }
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class DenseIndex:
+    """Quantized scan with full-precision rescoring over an exported index."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported dense index format {meta.get('format_version')} "
+                f"in {self.path}"
+            )
+        self.meta = meta
+        self.node_ids: list[str] = meta["node_ids"]
+        self.quantization: str = meta["quantization"]
+        self.scan_dims: int = meta["scan_dims"]
+        self.vectors_full = np.load(self.path / "vectors.f32.npy", mmap_mode="r")
+        self.scales = self._load_optional("scales.npy")
+        self.projection = self._load_optional("projection.npy")
+        if self.quantization == "float32" and self.projection is None and self.scan_dims == meta["dims"]:
+            # Scans the full vectors (write_dense_index does not copy them)
+            self.vectors_q = self.vectors_full
+        else:
+            self.vectors_q = np.load(self.path / "vectors.q.npy", mmap_mode="r")
+
+    def _load_optional(self, name: str) -> Optional[np.ndarray]:
+        path = self.path / name
+        return np.load(path, mmap_mode="r") if path.exists() else None
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def resident_bytes(self) -> int:
+        """Bytes every scan touches (the full-precision rows stay on disk)."""
+        total = self.vectors_q.nbytes
+        for array in (self.scales, self.projection):
+            if array is not None:
+                total += array.nbytes
+        return total
+
+    def _scan_query(self, query: np.ndarray) -> np.ndarray:
+        if self.projection is not None:
+            query = query @ self.projection
+        elif query.shape[0] > self.scan_dims:
+            query = query[: self.scan_dims]
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def scan(self, query: np.ndarray) -> np.ndarray:
+        """Approximate scores of every row against a normalized query."""
+        q = self._scan_query(query).astype(np.float32)
+        if self.quantization == "float32":
+            return self.vectors_q @ q
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_BLOCK_ROWS):
+            block = self.vectors_q[start : start + SCAN_BLOCK_ROWS]
+            scores[start : start + len(block)] = block.astype(np.float32) @ q
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search(
+        self, query: np.ndarray, top_k: int, rescore: Optional[int] = None
+    ) -> list[tuple[int, float]]:
+        """
+        Return ``(row, score)`` for the ``top_k`` rows most similar to ``query``.
+
+        The quantized scan picks ``rescore`` candidates (RESCORE_FACTOR * top_k
+        by default) which are ranked by exact cosine similarity.
+        """
+        if not len(self):
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.scan(query)
+
+        exact = self.quantization == "float32" and self.projection is None
+        n_candidates = top_k if exact else (rescore or RESCORE_FACTOR * top_k)
+        n_candidates = min(n_candidates, len(self))
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        if not exact:
+            candidates = np.sort(candidates)  # sequential reads from the mmap
+            scores = np.asarray(self.vectors_full[candidates] @ query)
+        else:
+            scores = scores[candidates]
+
+        order = np.argsort(-scores)[:top_k]
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+    def search_rows(self, query: np.ndarray, rows: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """Rank only ``rows`` (a candidate set known in advance) by exact cosine similarity."""
+        rows = np.sort(np.asarray(rows, dtype=np.int64))
+        if not len(rows):
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = np.asarray(self.vectors_full[rows] @ query)
+        order = np.argsort(-scores)[:top_k]
+        return [(int(rows[i]), float(scores[i])) for i in order]
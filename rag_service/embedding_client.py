@@ -0,0 +1,280 @@
+"""Minimal OpenAI embeddings client for the serving path.
+
+The service only needs query embeddings, so instead of llama_index's
+``OpenAIEmbedding`` it calls the embeddings endpoint directly over one
+persistent ``httpx`` connection pool (HTTP/2 when the ``h2`` package is
+installed).
+
+Every call has its own deadline (``RAG_EMBED_TIMEOUT_SECONDS``). A call that
+is still running after the hedge delay gets a duplicate request on another
+pooled connection and the first answer wins, which cuts the provider's tail
+latency. Provider failures (timeouts, 429, 5xx, connection errors) feed a
+circuit breaker; while it is open calls fail immediately with
+``EmbeddingUnavailable`` and the retriever falls back to cached embeddings
+or lexical search. Point ``OPENAI_BASE_URL`` at
+``benchmarks/fake_embedding_server.py`` to exercise all of this locally.
+"""
+import importlib.util
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Optional
+
+import httpx
+import numpy as np
+
+from circuit_breaker import CircuitBreaker
+from dense_index import DEFAULT_EMBED_MODEL
+from tracing import TRACEPARENT_HEADER, current_traceparent
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Deadline for one embed call, hedges included
+EMBED_TIMEOUT = float(os.getenv("RAG_EMBED_TIMEOUT_SECONDS", "5"))
+# Hedge delay in ms; unset = p90 of recent latencies, 0 = never hedge
+HEDGE_MS = os.getenv("RAG_EMBED_HEDGE_MS")
+BREAKER_FAILURES = int(os.getenv("RAG_EMBED_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("RAG_EMBED_BREAKER_RESET_SECONDS", "30"))
+# Query embeddings kept for reuse and as a fallback while the breaker is open
+CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "2048"))
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Latency samples needed before the adaptive hedge delay kicks in
+_MIN_HEDGE_SAMPLES = 20
+_MIN_HEDGE_DELAY = 0.05
+
+
+class EmbeddingUnavailable(RuntimeError):
+    """The provider failed, timed out, or the circuit breaker is open."""
+
+
+def _is_provider_failure(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class EmbeddingClient:
+    """Embeds text with the OpenAI embeddings API."""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = DEFAULT_EMBED_MODEL,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: float = EMBED_TIMEOUT,
+        hedge_after: Optional[float] = None if HEDGE_MS is None else float(HEDGE_MS) / 1000,
+        breaker: Optional[CircuitBreaker] = None,
+        cache_size: int = CACHE_SIZE,
+        http2: bool = HTTP2_AVAILABLE,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.http2 = http2
+        self.breaker = breaker or CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+        self._client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 2.0)),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120),
+            http2=http2,
+        )
+        # Hedged calls run the primary and the duplicate here
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="embed")
+        self._latencies: deque[float] = deque(maxlen=200)
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        # Counters exposed by /metrics
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _post(self, texts: list[str], timeout: float, traceparent: Optional[str] = None) -> np.ndarray:
+        start = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+        response = self._client.post(
+            "/embeddings",
+            json={"model": self.model, "input": texts},
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 2.0)),
+            headers={TRACEPARENT_HEADER: traceparent} if traceparent else None,
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        self._latencies.append(time.perf_counter() - start)
+        return np.array([item["embedding"] for item in data], dtype=np.float32)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedge_after is not None:
+            return self.hedge_after or None
+        if len(self._latencies) < _MIN_HEDGE_SAMPLES:
+            return None
+        return max(_MIN_HEDGE_DELAY, float(np.percentile(self._latencies, 90)))
+
+    def _post_hedged(
+        self, texts: list[str], delay: float, timeout: float, traceparent: Optional[str] = None
+    ) -> np.ndarray:
+        deadline = time.monotonic() + timeout
+        primary = self._executor.submit(self._post, texts, timeout, traceparent)
+        pending: set[Future] = {primary}
+        done, _ = wait(pending, timeout=min(delay, timeout))
+        if not done and delay < timeout:
+            with self._lock:
+                self.hedges += 1
+            pending.add(
+                self._executor.submit(self._post, texts, max(0.001, deadline - time.monotonic()), traceparent)
+            )
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(
+                pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        # Losers finish in the background; their connections return to the pool
+        raise error or httpx.ReadTimeout("embedding deadline exceeded")
+
+    def embed(self, texts: list[str], timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Return one float32 row per input text.
+
+        ``timeout`` shortens the call's deadline (e.g. to what is left of the
+        request's); a call that only ran out of that shorter time does not
+        count against the provider.
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise EmbeddingUnavailable("embedding circuit breaker is open")
+        shortened = timeout is not None and timeout < self.timeout
+        timeout = timeout if shortened else self.timeout
+        delay = self._hedge_delay()
+        # Read here: the hedging threads do not see the caller's trace context
+        traceparent = current_traceparent()
+        try:
+            if delay:
+                vectors = self._post_hedged(texts, delay, timeout, traceparent)
+            else:
+                vectors = self._post(texts, timeout, traceparent)
+        except Exception as e:
+            if shortened and isinstance(e, httpx.TimeoutException):
+                # Out of the caller's time, not the provider's
+                self.breaker.record_inconclusive()
+                raise EmbeddingUnavailable(f"embedding did not finish within {timeout:.3f}s") from e
+            if not _is_provider_failure(e):
+                # Bad request or credentials: says nothing about an outage,
+                # so a half-open breaker stays half-open
+                self.breaker.record_inconclusive()
+                raise
+            with self._lock:
+                self.failures += 1
+            self.breaker.record_failure()
+            raise EmbeddingUnavailable(f"embedding request failed: {e!r}") from e
+        self.breaker.record_success()
+        return vectors
+
+    def embed_query(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                self.cache_hits += 1
+                return cached
+        vector = self.embed([text], timeout)[0]
+        with self._lock:
+            self._cache[text] = vector
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def prefetch(self, texts: list[str], timeout: Optional[float] = None) -> int:
+        """
+        Embed the uncached ``texts`` in one request and cache them, so that
+        the ``embed_query`` calls that follow are cache hits. Returns the
+        number of texts embedded.
+        """
+        with self._lock:
+            missing = list(dict.fromkeys(t for t in texts if t not in self._cache))
+        if not missing:
+            return 0
+        vectors = self.embed(missing, timeout)
+        with self._lock:
+            for text, vector in zip(missing, vectors):
+                self._cache[text] = vector
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return len(missing)
+
+    def stats(self) -> dict:
+        latencies = list(self._latencies)
+        return {
+            "model": self.model,
+            "http2": self.http2,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "latency_p50_ms": float(np.percentile(latencies, 50)) * 1e3 if latencies else None,
+            "latency_p95_ms": float(np.percentile(latencies, 95)) * 1e3 if latencies else None,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self._client.close()
+
+
+# One client (connection pool, breaker, query cache) per embedding model
+_clients: dict[str, EmbeddingClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_embedding_client(model: Optional[str] = None) -> EmbeddingClient:
+    """
+    Return the shared client for ``model`` (default: ``RAG_EMBED_MODEL`` or
+    the build's default model). Snapshots embedded with different models get
+    different clients, so their query vectors are never mixed.
+    """
+    model = model or os.getenv("RAG_EMBED_MODEL") or DEFAULT_EMBED_MODEL
+    client = _clients.get(model)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if model not in _clients:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError(
+                    "OPENAI_API_KEY environment variable is required for RAG service. "
+                    "Please set it in your Railway environment variables."
+                )
+            _clients[model] = EmbeddingClient(
+                api_key=api_key,
+                model=model,
+                base_url=os.getenv("OPENAI_BASE_URL") or DEFAULT_BASE_URL,
+            )
+        return _clients[model]
+
+
+def embedding_clients() -> list[EmbeddingClient]:
+    """The clients created so far, one per model."""
+    return list(_clients.values())
@@ -0,0 +1,157 @@
+"""Zero-downtime hot-swap of serving-index snapshots.
+
+``IndexManager`` holds the snapshot currently being served. A reload maps the
+new snapshot, warms it (one full scan pages the matrix in; for a sharded
+snapshot only the statewide shard, see shards.py) and then swaps a
+single reference under a lock. Requests take that reference once when they
+start, so in-flight requests finish on the old snapshot. Its memory maps are
+released when the last of them drops its reference.
+
+Reloads are triggered by a watcher thread polling the manifest's mtime
+(``RAG_INDEX_WATCH_SECONDS``, default 10), or through the admin endpoint in
+``app.py``. The endpoint reaches one worker; the others follow the manifest
+through their watchers.
+Caches tied to a snapshot register a swap listener and are cleared when the
+version changes.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from node_store import NodeStore
+from shards import ShardSet
+from snapshots import is_sharded, manifest_mtime, resolve_current, snapshot_dir
+
+# Seconds between manifest checks; 0 disables the watcher. Keep it well below
+# snapshots.PRUNE_GRACE_SECONDS: the files of a snapshot are pruned that long
+# after it stopped being current
+WATCH_INTERVAL = float(os.getenv("RAG_INDEX_WATCH_SECONDS", "10"))
+
+
+@dataclass
+class IndexSnapshot:
+    """One loaded, immutable version of the serving index."""
+
+    version: str
+    path: Path
+    shards: ShardSet
+    loaded_at: float
+
+    @classmethod
+    def load(cls, version: str, path: Path) -> "IndexSnapshot":
+        if not is_sharded(path) and (not (path / "meta.json").exists() or not NodeStore.exists(path)):
+            raise FileNotFoundError(f"Incomplete serving index snapshot at {path}")
+        return cls(version, path, ShardSet(path), time.time())
+
+    def warm(self) -> None:
+        self.shards.warm()
+
+
+SwapListener = Callable[[Optional[str], str], None]
+
+
+class IndexManager:
+    """Owns the current snapshot and swaps in new ones atomically."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._current: Optional[IndexSnapshot] = None
+        self._lock = threading.Lock()  # guards _current
+        self._reload_lock = threading.Lock()  # one reload at a time
+        self._listeners: list[SwapListener] = []
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._manifest_mtime: Optional[float] = None
+        self.swaps = 0
+
+    def add_swap_listener(self, listener: SwapListener) -> None:
+        """Call ``listener(old_version, new_version)`` after every swap."""
+        self._listeners.append(listener)
+
+    @property
+    def version(self) -> Optional[str]:
+        current = self._current
+        return current.version if current else None
+
+    @property
+    def snapshot(self) -> Optional[IndexSnapshot]:
+        """The current snapshot, or None before the first load."""
+        return self._current
+
+    def current(self) -> IndexSnapshot:
+        """The snapshot to serve this request from (loaded on first use)."""
+        current = self._current
+        if current is None:
+            self.reload()
+            current = self._current
+        return current
+
+    def reload(self, version: Optional[str] = None) -> IndexSnapshot:
+        """
+        Load ``version`` (default: the manifest's current snapshot), warm it
+        and make it current. A no-op if that version is already served.
+        """
+        with self._reload_lock:
+            self._manifest_mtime = manifest_mtime(self.root)
+            if version is None:
+                resolved = resolve_current(self.root)
+                if resolved is None:
+                    raise FileNotFoundError(
+                        f"RAG serving index not found under {self.root}. "
+                        f"Build it with `python store_rag_index.py` (or `--export-only`). "
+                        f"Current working directory: {os.getcwd()}"
+                    )
+                version, path = resolved
+            else:
+                path = snapshot_dir(self.root, version)
+
+            current = self._current
+            if current is not None and current.version == version:
+                return current
+
+            snapshot = IndexSnapshot.load(version, path)
+            snapshot.warm()
+            with self._lock:
+                old, self._current = self._current, snapshot
+            self.swaps += 1
+            old_version = old.version if old else None
+            print(
+                f"✓ RAG serving index {version} active ({snapshot.shards.describe()})"
+                + (f", replaced {old_version}" if old_version else "")
+            )
+            for listener in self._listeners:
+                try:
+                    listener(old_version, version)
+                except Exception as e:
+                    print(f"Index swap listener failed: {e}")
+            return snapshot
+
+    def start_watcher(self, interval: float = WATCH_INTERVAL) -> None:
+        """Reload in the background whenever the manifest changes."""
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(interval,), name="rag-index-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            mtime = manifest_mtime(self.root)
+            if mtime is None or mtime == self._manifest_mtime:
+                continue
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep serving the old snapshot; retry on the next change
+                print(f"RAG index reload failed: {e}")
@@ -0,0 +1,71 @@
+"""BM25 keyword search over the chunk store.
+
+Used only when query embeddings are unavailable (provider outage, circuit
+breaker open): ranking by keyword overlap is worse than dense retrieval but
+still returns the county's regulations instead of nothing. The postings are
+built from the memory-mapped chunk texts the first time a snapshot needs
+them.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from node_store import NodeStore
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Words every generated query carries; they carry no signal for ranking
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the to with "
+    "recycling county new york".split()
+)
+
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    def __init__(self, postings: dict[str, tuple[np.ndarray, np.ndarray]], doc_lengths: np.ndarray):
+        self._postings = postings
+        self._doc_lengths = doc_lengths
+        self._avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, store: NodeStore) -> "LexicalIndex":
+        rows: dict[str, list[int]] = defaultdict(list)
+        freqs: dict[str, list[int]] = defaultdict(list)
+        doc_lengths = np.zeros(len(store), dtype=np.float32)
+        for row in range(len(store)):
+            counts = Counter(tokenize(store.text(row)))
+            doc_lengths[row] = sum(counts.values())
+            for token, count in counts.items():
+                rows[token].append(row)
+                freqs[token].append(count)
+        postings = {
+            token: (np.array(rows[token], dtype=np.int32), np.array(freqs[token], dtype=np.float32))
+            for token in rows
+        }
+        return cls(postings, doc_lengths)
+
+    def search(self, query: str, top_k: int) -> list[tuple[int, float]]:
+        """Return ``(row, bm25 score)`` pairs, best first."""
+        n = len(self._doc_lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            rows, tf = posting
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = K1 * (1 - B + B * self._doc_lengths[rows] / self._avg_length)
+            scores[rows] += idf * tf * (K1 + 1) / (tf + norm)
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        top = hits[np.argsort(-scores[hits], kind="stable")[:top_k]]
+        return [(int(row), float(scores[row])) for row in top]
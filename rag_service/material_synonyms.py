@@ -0,0 +1,221 @@
+"""Data-driven material synonym expansion for RAG queries.
+
+The taxonomy in ``material_taxonomy.yaml`` maps trigger phrases (brand names,
+plurals, resin codes, e-waste, hazardous items, ...) to categories with ranked
+search terms. At startup every trigger is compiled into one Aho-Corasick
+automaton, so expanding a material is a single pass over its normalized text
+no matter how many materials the taxonomy covers.
+"""
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+TAXONOMY_PATH = Path(
+    os.getenv(
+        "RAG_MATERIAL_TAXONOMY", Path(__file__).parent / "material_taxonomy.yaml"
+    )
+)
+
+# Expanded terms returned in addition to the original material
+DEFAULT_MAX_TERMS = 3
+
+_NON_WORD = re.compile(r"[^a-z0-9#]+")
+
+
+def normalize_phrase(text: str) -> str:
+    """Lowercase and reduce to words separated by single spaces."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def plural_forms(phrase: str) -> list[str]:
+    """Regular plurals of the last word of ``phrase`` (battery -> batteries)."""
+    head, _, last = phrase.rpartition(" ")
+    if not last.isalpha() or len(last) < 3:
+        return []
+    if last.endswith("y") and last[-2] not in "aeiou":
+        plurals = [last[:-1] + "ies"]
+    elif last.endswith(("s", "x", "z", "ch", "sh")):
+        plurals = [last + "es"]
+    else:
+        plurals = [last + "s"]
+    prefix = f"{head} " if head else ""
+    return [prefix + p for p in plurals]
+
+
+@dataclass(frozen=True)
+class Category:
+    name: str
+    terms: tuple[str, ...]
+    rank: int  # position in the taxonomy file
+
+
+class _Automaton:
+    """Aho-Corasick automaton over characters with word-boundary matches."""
+
+    def __init__(self) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # (pattern length, payload) for every pattern ending at a state
+        self._out: list[list[tuple[int, int]]] = [[]]
+
+    def add(self, pattern: str, payload: int) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), payload))
+
+    def build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def matches(self, text: str) -> list[tuple[int, int, int]]:
+        """Return (start, length, payload) for whole-word matches in ``text``."""
+        found: list[tuple[int, int, int]] = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if not self._out[state]:
+                continue
+            # Word boundary after the match
+            if i + 1 < len(text) and text[i + 1] != " ":
+                continue
+            for length, payload in self._out[state]:
+                start = i - length + 1
+                if start == 0 or text[start - 1] == " ":
+                    found.append((start, length, payload))
+        return found
+
+
+class MaterialExpander:
+    """Expands a material name into a small, ranked set of search terms."""
+
+    def __init__(self, categories: list[Category], triggers: dict[str, int]):
+        self.categories = categories
+        self._automaton = _Automaton()
+        for phrase, category_index in triggers.items():
+            self._automaton.add(phrase, category_index)
+        self._automaton.build()
+        self.triggers = frozenset(triggers)
+
+    @classmethod
+    def from_file(cls, path: Path = TAXONOMY_PATH) -> "MaterialExpander":
+        with open(path, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return cls.from_dict(data)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MaterialExpander":
+        categories: list[Category] = []
+        triggers: dict[str, int] = {}
+        for rank, (name, spec) in enumerate((data.get("categories") or {}).items()):
+            categories.append(Category(name, tuple(spec.get("terms") or ()), rank))
+            for raw in spec.get("triggers") or ():
+                phrase = normalize_phrase(str(raw))
+                if not phrase:
+                    continue
+                # First category listing a phrase owns it
+                for variant in [phrase] + plural_forms(phrase):
+                    triggers.setdefault(variant, rank)
+        return cls(categories, triggers)
+
+    def _uncovered_matches(self, text: str) -> list[tuple[int, int, int]]:
+        """``(start, length, category)`` of the phrases in ``text`` not inside a longer match."""
+        found = self._automaton.matches(normalize_phrase(text))
+        return [
+            (start, length, index)
+            for start, length, index in found
+            if not any(
+                other_start <= start and start + length <= other_start + other_length
+                and other_length > length
+                for other_start, other_length, _ in found
+            )
+        ]
+
+    def match_categories(self, material: str, covered: bool = False) -> list[Category]:
+        """
+        Categories matched by ``material``, most specific first. A phrase
+        inside a longer match does not count ("car battery" is
+        lead_acid_batteries only, not also batteries) unless ``covered``.
+        """
+        if covered:
+            found = self._automaton.matches(normalize_phrase(material))
+        else:
+            found = self._uncovered_matches(material)
+        best: dict[int, int] = {}
+        for _, length, index in found:
+            best[index] = max(best.get(index, 0), length)
+        ranked = sorted(best, key=lambda i: (-best[i], self.categories[i].rank))
+        return [self.categories[i] for i in ranked]
+
+    def primary_categories(self, text: str) -> list[Category]:
+        """
+        Categories of the phrases in ``text`` that are not part of a longer
+        match, in order of appearance: "metal glass plastic cartons" has four,
+        "plastic bags" only plastic_bags_film (not plastic).
+        """
+        first: dict[int, int] = {}
+        for start, _, index in self._uncovered_matches(text):
+            first.setdefault(index, start)
+        return [self.categories[i] for i in sorted(first, key=first.get)]
+
+    def expand(self, material: str, max_terms: int = DEFAULT_MAX_TERMS) -> list[str]:
+        """
+        Return ``material`` followed by up to ``max_terms`` expanded terms.
+
+        Matched categories contribute their terms round-robin (every
+        category's best term before any second term), in rank order;
+        duplicates are removed case-insensitively. A term equal to
+        ``material`` is dropped first, so it does not use up its category's
+        turn.
+        """
+        terms = [material]
+        seen = {material.lower().strip()}
+        ranked = [
+            [t for t in category.terms if t.lower() not in seen]
+            for category in self.match_categories(material)
+        ]
+        depth = max((len(t) for t in ranked), default=0)
+        for level in range(depth):
+            for category_terms in ranked:
+                if len(terms) > max_terms:
+                    return terms
+                if level < len(category_terms):
+                    term = category_terms[level]
+                    if term.lower() not in seen:
+                        seen.add(term.lower())
+                        terms.append(term)
+        return terms
+
+
+_expander: Optional[MaterialExpander] = None
+
+
+def get_material_expander() -> MaterialExpander:
+    """Return the expander compiled from the taxonomy file (cached singleton)."""
+    global _expander
+    if _expander is None:
+        _expander = MaterialExpander.from_file()
+    return _expander
@@ -0,0 +1,217 @@
+"""Read-only chunk store for the serving export.
+
+Chunk display texts are written back to back into one UTF-8 blob with an
+offsets array, and opened with ``mmap``. Every uvicorn worker maps the same
+file, so the texts live once in the page cache no matter how many workers
+run. Per-chunk metadata is interned: each distinct source, county and topic
+is stored once in a small table, and a memory-mapped ``int32`` array holds
+every row's indices into those tables.
+
+    chunks.bin          UTF-8 display texts, concatenated (or zstd blocks)
+    chunk_offsets.npy   int64 byte offsets into the uncompressed texts, n + 1 entries
+    chunk_fields.npy    int32 (n, 3) indices into the source/county/topic tables, -1 = none
+    chunk_meta.json     {"format": 2, "sources": [...], "counties": [...], "topics": [...],
+                         "compression": null | "zstd"}
+
+With ``compression="zstd"`` consecutive chunks are grouped into blocks of
+about ``BLOCK_BYTES`` and every block is compressed on its own
+(``block_offsets.npy``: compressed byte offsets; ``block_rows.npy``: first
+row of each block). Reading a chunk decompresses only its block, and
+recently used blocks are kept decompressed. This needs the ``zstandard``
+package in the service. Stores written before interning (per-row lists in
+``chunk_meta.json``) are still read.
+"""
+import json
+import mmap
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+FORMAT_VERSION = 2
+COMPRESSIONS = (None, "zstd")
+# Uncompressed bytes per zstd block: one block holds a few chunks, so a
+# query touches about one block per returned chunk
+BLOCK_BYTES = 32 * 1024
+ZSTD_LEVEL = 9
+# Decompressed blocks kept per process
+BLOCK_CACHE_SIZE = 64
+
+FIELDS = ("sources", "counties", "topics")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """A retrieved chunk, materialized only for the rows a query returns."""
+
+    text: str
+    source: Optional[str]
+    county: Optional[str] = None
+    topic: Optional[str] = None
+    score: float = 0.0
+
+
+def _intern(values: list[Optional[str]]) -> tuple[list[str], np.ndarray]:
+    table: dict[str, int] = {}
+    codes = np.array(
+        [-1 if v is None else table.setdefault(v, len(table)) for v in values], dtype=np.int32
+    )
+    return list(table), codes
+
+
+def write_node_store(
+    out_dir: Path, texts: list[str], metadata: list[dict], compression: Optional[str] = None
+) -> dict:
+    """Write ``texts`` (display text) and their metadata in row order."""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {COMPRESSIONS}")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    np.save(out_dir / "chunk_offsets.npy", offsets)
+
+    if compression is None:
+        with open(out_dir / "chunks.bin", "wb") as f:
+            for data in encoded:
+                f.write(data)
+    else:
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        block_rows, block_offsets = [0], [0]
+        with open(out_dir / "chunks.bin", "wb") as f:
+            start = 0
+            while start < len(encoded):
+                end, size = start, 0
+                while end < len(encoded) and (end == start or size + len(encoded[end]) <= BLOCK_BYTES):
+                    size += len(encoded[end])
+                    end += 1
+                block = compressor.compress(b"".join(encoded[start:end]))
+                f.write(block)
+                block_rows.append(end)
+                block_offsets.append(block_offsets[-1] + len(block))
+                start = end
+        np.save(out_dir / "block_rows.npy", np.array(block_rows, dtype=np.int64))
+        np.save(out_dir / "block_offsets.npy", np.array(block_offsets, dtype=np.int64))
+
+    columns = {
+        "sources": [md.get("source_url") or md.get("source_file") for md in metadata],
+        "counties": [md.get("county") for md in metadata],
+        "topics": [md.get("topic") for md in metadata],
+    }
+    meta = {"format": FORMAT_VERSION, "count": len(texts), "compression": compression}
+    fields = np.full((len(texts), len(FIELDS)), -1, dtype=np.int32)
+    for i, name in enumerate(FIELDS):
+        meta[name], fields[:, i] = _intern(columns[name])
+    np.save(out_dir / "chunk_fields.npy", fields)
+    with open(out_dir / "chunk_meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class NodeStore:
+    """Memory-mapped chunk texts plus interned per-chunk metadata."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._offsets = np.load(self.path / "chunk_offsets.npy", mmap_mode="r")
+        with open(self.path / "chunks.bin", "rb") as f:
+            size = self.path.joinpath("chunks.bin").stat().st_size
+            # mmap of an empty file is not allowed
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        with open(self.path / "chunk_meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if meta.get("format", 1) >= 2:
+            self._tables: list[list[str]] = [meta[name] for name in FIELDS]
+            self._fields = np.load(self.path / "chunk_fields.npy", mmap_mode="r")
+        else:
+            # Per-row lists: intern them on load
+            self._tables, columns = [], []
+            for name in FIELDS:
+                table, codes = _intern(meta[name])
+                self._tables.append(table)
+                columns.append(codes)
+            self._fields = np.stack(columns, axis=1) if columns[0].size else np.zeros((0, 3), np.int32)
+
+        self.compression: Optional[str] = meta.get("compression")
+        if self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError(
+                    f"{self.path} holds zstd-compressed chunks; install `zstandard` to serve it"
+                ) from e
+            self._decompressor = zstandard.ZstdDecompressor()
+            self._block_rows = np.load(self.path / "block_rows.npy")
+            self._block_offsets = np.load(self.path / "block_offsets.npy")
+            self._blocks: OrderedDict[int, bytes] = OrderedDict()
+            self._blocks_lock = threading.Lock()
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        return (Path(path) / "chunk_meta.json").exists()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _block(self, block: int) -> bytes:
+        with self._blocks_lock:
+            data = self._blocks.get(block)
+            if data is not None:
+                self._blocks.move_to_end(block)
+                return data
+        start, end = int(self._block_offsets[block]), int(self._block_offsets[block + 1])
+        data = self._decompressor.decompress(self._blob[start:end])
+        with self._blocks_lock:
+            self._blocks[block] = data
+            if len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return data
+
+    def text(self, row: int) -> str:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        if self.compression is None:
+            return self._blob[start:end].decode("utf-8")
+        block = int(np.searchsorted(self._block_rows, row, side="right")) - 1
+        base = int(self._offsets[self._block_rows[block]])
+        return self._block(block)[start - base:end - base].decode("utf-8")
+
+    def _field(self, row: int, column: int) -> Optional[str]:
+        code = int(self._fields[row, column])
+        return self._tables[column][code] if code >= 0 else None
+
+    def source(self, row: int) -> Optional[str]:
+        return self._field(row, 0)
+
+    def county(self, row: int) -> Optional[str]:
+        return self._field(row, 1)
+
+    def topic(self, row: int) -> Optional[str]:
+        return self._field(row, 2)
+
+    def field_table(self, name: str) -> list[str]:
+        """Distinct values of ``name`` ("sources", "counties" or "topics")."""
+        return self._tables[FIELDS.index(name)]
+
+    def field_codes(self, name: str) -> np.ndarray:
+        """Every row's index into ``field_table(name)``, -1 = none."""
+        return self._fields[:, FIELDS.index(name)]
+
+    def chunk(self, row: int, score: float = 0.0) -> Chunk:
+        return Chunk(
+            text=self.text(row),
+            source=self.source(row),
+            county=self.county(row),
+            topic=self.topic(row),
+            score=score,
+        )
+
+    @property
+    def blob_bytes(self) -> int:
+        return len(self._blob)
@@ -0,0 +1,223 @@
+"""On-demand sampling profiler for the query hot path.
+
+A profile session samples the threads that are running ``/query`` work for
+the next N requests or T seconds. A sampler thread reads their Python
+stacks (``sys._current_frames``) every ``interval`` seconds:
+
+wall  every sample counts, so time blocked on embedding I/O shows up
+cpu   a sample counts only if the thread's CPU clock advanced since the
+      previous one (per-thread clocks, ``time.pthread_getcpuclockid``)
+
+Samples are aggregated into collapsed stacks ("frame;frame;frame count"),
+the input format of flamegraph.pl, inferno and speedscope. With
+``allocations`` on, tracemalloc runs for the session: each profiled request
+reports its net and peak traced memory, and the session reports the top
+allocation sites. Allocation counters are process-wide, so concurrent
+requests show up in each other's numbers.
+
+No overhead outside a session beyond one global check per request.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+MODES = ("wall", "cpu")
+MAX_SECONDS = 300.0
+_TRACEMALLOC_FRAMES = 25
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _thread_cpu_clock(ident: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+class ProfileSession:
+    def __init__(
+        self,
+        mode: str = "wall",
+        interval: float = 0.005,
+        max_requests: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        allocations: bool = False,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.mode = mode
+        self.interval = interval
+        self.max_requests = max_requests
+        self.max_seconds = min(max_seconds or MAX_SECONDS, MAX_SECONDS)
+        self.allocations = allocations
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.requests_started = 0
+        self.requests_done = 0
+        self.request_allocations: list[dict] = []
+        self.top_allocation_sites: list[dict] = []
+        self._threads: dict[int, tuple[Optional[int], float]] = {}  # ident -> (cpu clock, last cpu time)
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._started_at = 0.0
+        self._ended_at = 0.0
+        self._owns_tracemalloc = False
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    def start(self) -> None:
+        if self.allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(_TRACEMALLOC_FRAMES)
+                self._owns_tracemalloc = True
+            self._baseline = tracemalloc.take_snapshot()
+        self._started_at = time.perf_counter()
+        threading.Thread(target=self._sample_loop, name="rag-profiler", daemon=True).start()
+
+    def accepting(self) -> bool:
+        return not self.finished and (
+            self.max_requests is None or self.requests_started < self.max_requests
+        )
+
+    def _enter(self) -> None:
+        ident = threading.get_ident()
+        clock = _thread_cpu_clock(ident) if self.mode == "cpu" else None
+        with self._lock:
+            self.requests_started += 1
+            self._threads[ident] = (clock, time.clock_gettime(clock) if clock is not None else 0.0)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+            self.requests_done += 1
+            if self.max_requests is not None and self.requests_done >= self.max_requests:
+                self._finish()
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run one request's work with this thread being sampled."""
+        self._enter()
+        start = time.perf_counter()
+        if self.allocations:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if self.allocations:
+                after, peak = tracemalloc.get_traced_memory()
+                self.request_allocations.append({
+                    "duration_ms": round((time.perf_counter() - start) * 1e3, 2),
+                    "net_kb": round((after - before) / 1024, 1),
+                    "peak_kb": round((peak - before) / 1024, 1),
+                })
+            self._exit()
+
+    def _sample_loop(self) -> None:
+        while not self._finished.wait(self.interval):
+            if time.perf_counter() - self._started_at >= self.max_seconds:
+                with self._lock:
+                    self._finish()
+                break
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, (clock, last_cpu) in list(self._threads.items()):
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    if clock is not None:
+                        try:
+                            cpu = time.clock_gettime(clock)
+                        except OSError:
+                            continue
+                        self._threads[ident] = (clock, cpu)
+                        if cpu <= last_cpu:
+                            continue  # off CPU (waiting on I/O or a lock)
+                    self.stacks[_collapse(frame)] += 1
+                    self.samples += 1
+
+    def _finish(self) -> None:
+        # Called with self._lock held
+        if self._finished.is_set():
+            return
+        self._ended_at = time.perf_counter()
+        if self.allocations and self._baseline is not None:
+            # Leave out the profiler's own bookkeeping
+            ignore = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+            diff = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(
+                self._baseline.filter_traces(ignore), "lineno"
+            )
+            self.top_allocation_sites = [
+                {
+                    "site": str(stat.traceback[0]),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count_diff": stat.count_diff,
+                }
+                for stat in diff[:25]
+            ]
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+        self._finished.set()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._finish()
+
+    def collapsed(self) -> str:
+        """Folded stacks, one ``stack count`` line each (flamegraph.pl input)."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self) -> dict:
+        return {
+            "mode": self.mode,
+            "interval_ms": self.interval * 1e3,
+            "duration_s": round((self._ended_at or time.perf_counter()) - self._started_at, 3),
+            "requests_profiled": self.requests_done,
+            "samples": self.samples,
+            "collapsed": self.collapsed(),
+            "request_allocations": self.request_allocations if self.allocations else None,
+            "top_allocation_sites": self.top_allocation_sites if self.allocations else None,
+        }
+
+
+_session: Optional[ProfileSession] = None
+_session_lock = threading.Lock()
+
+
+def start_session(**kwargs) -> ProfileSession:
+    """Start a session; raises RuntimeError if one is already running."""
+    global _session
+    with _session_lock:
+        if _session is not None and not _session.finished:
+            raise RuntimeError("A profile session is already running")
+        session = ProfileSession(**kwargs)
+        session.start()
+        _session = session
+        return session
+
+
+def run_profiled(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Call ``fn``; sampled if a profile session is accepting requests."""
+    session = _session
+    if session is None or not session.accepting():
+        return fn(*args, **kwargs)
+    return session.run(fn, *args, **kwargs)
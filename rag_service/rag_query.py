@@ -1,76 +1,238 @@
-"""RAG query logic for querying recycling regulations."""
+"""RAG query logic for querying recycling regulations.
+
+Serving only needs NumPy and the embeddings API: the index is the
+self-contained export written by ``store_rag_index.py`` (quantized vectors
+plus chunk store), and llama_index is a build-time dependency only. Exports
+are versioned snapshots that can be swapped in without a restart
+(index_manager.py).
+"""
 import os
 from pathlib import Path
-from typing import Optional, Any
-from llama_index.core import StorageContext, load_index_from_storage, Settings
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
+from typing import Optional
 import dotenv
+import numpy as np
+from counties import get_county_detector
+from county_geo import get_county_grid
+from deadline import MIN_TERM_BUDGET, Deadline, DeadlineExceeded
+from embedding_client import EmbeddingUnavailable, get_embedding_client
+from index_manager import IndexManager, IndexSnapshot
+from shards import IndexShard
+from material_synonyms import get_material_expander
+from node_store import Chunk
+from semantic_cache import SemanticCache
+from text_normalize import CHUNK_SEPARATOR
+from tracing import span
 
 dotenv.load_dotenv()
 
-# Path to the vector store
+# Path to the index
 # For Railway deployment: Index is copied into rag_service/rag_index_morechunked/
 # For local development: Index is also available at ../rag/rag_index_morechunked/
 RAG_INDEX_PATH = Path(__file__).parent / "rag_index_morechunked"
 
-# Global cache for the query engine and index
-_query_engine: Optional[RetrieverQueryEngine] = None
-_index = None
+# Versioned serving snapshots written by `store_rag_index.py` (see snapshots.py).
+# Every file is memory-mapped read-only, so all uvicorn workers share one copy
+# through the page cache.
+_index_manager = IndexManager(RAG_INDEX_PATH)
 
+# Chunks returned per retrieval (and the topic-page size returned whole)
+SIMILARITY_TOP_K = int(os.getenv("RAG_SIMILARITY_TOP_K", "15"))
 
-def get_rag_query_engine() -> RetrieverQueryEngine:
-    """Load the RAG index and return a query engine (cached singleton)."""
-    global _query_engine, _index
-    
-    if _query_engine is not None:
-        return _query_engine
-    
-    # Initialize OpenAI embedding model and LLM
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        raise ValueError(
-            "OPENAI_API_KEY environment variable is required for RAG service. "
-            "Please set it in your Railway environment variables."
-        )
-    
-    Settings.embed_model = OpenAIEmbedding(api_key=openai_api_key)
-    # Use a valid, supported OpenAI chat model for LlamaIndex metadata/synthesis
-    Settings.llm = OpenAI(api_key=openai_api_key, model="gpt-4.1")
-    print(f"✓ Initialized OpenAI embeddings and LLM for RAG queries")
-    
-    if not RAG_INDEX_PATH.exists():
-        raise FileNotFoundError(
-            f"RAG index not found at {RAG_INDEX_PATH}. "
-            f"Current working directory: {os.getcwd()}"
-        )
-    
-    try:
-        storage_context = StorageContext.from_defaults(persist_dir=str(RAG_INDEX_PATH))
-        _index = load_index_from_storage(storage_context)
-        # Increase similarity_top_k to retrieve more relevant chunks
-        _query_engine = _index.as_query_engine(similarity_top_k=10)
-        print(f"✓ RAG query engine loaded successfully from {RAG_INDEX_PATH}")
-        return _query_engine
-    except Exception as e:
-        raise RuntimeError(f"Failed to load RAG index: {str(e)}")
+# Retrievals answered by keyword search because embeddings were unavailable
+lexical_fallbacks = 0
+# Queries cut short by their deadline, and those whose clients all went away
+partial_results = 0
+cancelled_queries = 0
 
+# Answer from the county's topic page for the material when there is one
+# (topic_index.py); "0" always scans the index
+TOPIC_ROUTING = os.getenv("RAG_TOPIC_ROUTING", "1") != "0"
+# Queries answered from a topic page: ranked within it / returned whole
+topic_routed = 0
+topic_direct = 0
+# Requests with coordinates: county found by point-in-polygon / outside every
+# county (the location text decides then)
+geo_resolved = 0
+geo_unresolved = 0
 
-def get_rag_retriever() -> Any:
-    """Get a retriever for direct chunk retrieval (bypasses LLM synthesis)."""
-    global _index
-    
-    # Ensure index is loaded
-    if _index is None:
-        get_rag_query_engine()
-    
-    if _index is None:
-        raise RuntimeError("Failed to load RAG index")
-    
-    # Create retriever with higher top_k for better coverage
-    retriever = _index.as_retriever(similarity_top_k=15)
-    return retriever
+# Rankings of recent queries, reused for near-identical queries (semantic_cache.py).
+# Row numbers belong to one snapshot, so a swap empties it.
+_semantic_cache = SemanticCache()
+_index_manager.add_swap_listener(lambda old, new: _semantic_cache.clear(new))
+
+
+class DenseRetriever:
+    """Retriever over one serving-index snapshot.
+
+    Scores the query against the quantized matrix of each shard that covers
+    the county (shards.py), rescores the best candidates in full precision,
+    merges them by score and materializes only the returned chunks from the
+    memory-mapped chunk stores. When the query cannot be embedded (provider
+    down, circuit breaker open) it falls back to BM25 keyword search over
+    the same shards. Rankings of near-identical queries in the same county
+    come from the semantic cache. With a deadline, each stage checks it
+    first and raises ``DeadlineExceeded`` once it has passed.
+
+    ``retrieve_topic`` answers from the county's topic pages for a material
+    instead, without scanning.
+    """
+
+    def __init__(self, snapshot: IndexSnapshot, similarity_top_k: int):
+        self.snapshot = snapshot
+        self._similarity_top_k = similarity_top_k
+        # Shards this retriever touched; kept so that materializing the hits
+        # does not remap a shard the LRU budget evicted meanwhile
+        self._shards: dict[str, IndexShard] = {}
+
+    def _shard(self, name: str) -> IndexShard:
+        shard = self._shards.get(name)
+        if shard is None:
+            shard = self._shards[name] = self.snapshot.shards.get(name)
+        return shard
+
+    def _merge(
+        self, county: Optional[str], search, deadline: Optional[Deadline] = None
+    ) -> list[tuple[str, int, float]]:
+        hits = []
+        for name in self.snapshot.shards.for_county(county):
+            if deadline is not None:
+                deadline.check(f"searching shard {name}")
+            hits += [(name, row, score) for row, score in search(self._shard(name))]
+        hits.sort(key=lambda hit: -hit[2])
+        return hits[: self._similarity_top_k]
+
+    def _search(
+        self, embedding, county: Optional[str], deadline: Optional[Deadline] = None
+    ) -> list[tuple[str, int, float]]:
+        version = self.snapshot.version
+        cached = _semantic_cache.lookup(version, county, embedding)
+        if cached is not None and not _semantic_cache.should_audit():
+            with span("rag.scan", county=county, semantic_cache="hit"):
+                return cached
+        with span("rag.scan", county=county, shards=len(self.snapshot.shards.for_county(county))):
+            hits = self._merge(
+                county, lambda shard: shard.dense_index.search(embedding, self._similarity_top_k), deadline
+            )
+        if cached is not None:
+            overlap = _semantic_cache.record_audit(cached, hits)
+            print(f"Semantic cache audit: top-{self._similarity_top_k} overlap {overlap:.2f}")
+        else:
+            _semantic_cache.put(version, county, embedding, hits)
+        return hits
+
+    def _embed(self, query: str, deadline: Optional[Deadline]) -> np.ndarray:
+        with span("rag.embed"):
+            client = get_embedding_client(self.snapshot.shards.embed_model)
+            timeout = None
+            if deadline is not None:
+                deadline.check("embedding")
+                timeout = deadline.remaining()
+            return client.embed_query(query, None if timeout == float("inf") else timeout)
+
+    def retrieve(
+        self, query: str, county: Optional[str] = None, deadline: Optional[Deadline] = None
+    ) -> list[Chunk]:
+        try:
+            embedding = self._embed(query, deadline)
+        except EmbeddingUnavailable as e:
+            if deadline is not None:
+                deadline.check("lexical fallback")
+            global lexical_fallbacks
+            lexical_fallbacks += 1
+            print(f"Embedding unavailable ({e}); using lexical fallback")
+            with span("rag.scan", county=county, lexical=True):
+                hits = self._merge(
+                    county, lambda shard: shard.lexical_index().search(query, self._similarity_top_k), deadline
+                )
+        else:
+            hits = self._search(embedding, county, deadline)
+        with span("rag.assemble", chunks=len(hits)):
+            return [self._shard(name).node_store.chunk(row, score) for name, row, score in hits]
+
+
+    def topic_rows(self, material: str, county: str) -> list[tuple[str, np.ndarray]]:
+        """
+        ``(shard, rows)`` of the county's topic pages for ``material``.
+
+        The material's taxonomy categories are tried most specific first
+        ("lithium battery": lithium_batteries, then batteries); the first one
+        the county has a page for wins.
+        """
+        for category in get_material_expander().match_categories(material, covered=True):
+            found = []
+            for name in self.snapshot.shards.for_county(county):
+                for _, rows in self._shard(name).topic_index().lookup(county, category.name):
+                    found.append((name, rows))
+            if found:
+                return found
+        return []
+
+    def retrieve_topic(
+        self, material: str, query: str, county: str, deadline: Optional[Deadline] = None
+    ) -> list[Chunk]:
+        """
+        Chunks of the county's topic pages for ``material`` ([] if it has none).
+
+        Pages with at most ``similarity_top_k`` chunks are returned whole, in
+        page order and without embedding the query. Larger ones are ranked by
+        scoring only their chunks; if the query cannot be embedded, their
+        first chunks are returned.
+        """
+        global topic_routed, topic_direct
+        with span("rag.topic_lookup", county=county) as lookup:
+            found = self.topic_rows(material, county)
+            if lookup is not None:
+                lookup.set(pages=len(found))
+        if not found:
+            return []
+        total = sum(len(rows) for _, rows in found)
+        if total > self._similarity_top_k:
+            try:
+                embedding = self._embed(query, deadline)
+            except EmbeddingUnavailable as e:
+                print(f"Embedding unavailable ({e}); returning the topic page as is")
+            else:
+                topic_routed += 1
+                with span("rag.scan", county=county, topic_rows=total):
+                    hits = [
+                        (name, row, score)
+                        for name, rows in found
+                        for row, score in self._shard(name).dense_index.search_rows(
+                            embedding, rows, self._similarity_top_k
+                        )
+                    ]
+                    hits.sort(key=lambda hit: -hit[2])
+                with span("rag.assemble", chunks=min(len(hits), self._similarity_top_k)):
+                    return [
+                        self._shard(name).node_store.chunk(row, score)
+                        for name, row, score in hits[: self._similarity_top_k]
+                    ]
+        topic_direct += 1
+        hits = [(name, int(row)) for name, rows in found for row in rows][: self._similarity_top_k]
+        with span("rag.assemble", chunks=len(hits)):
+            return [self._shard(name).node_store.chunk(row) for name, row in hits]
+
+
+def get_index_manager() -> IndexManager:
+    return _index_manager
+
+
+def get_semantic_cache() -> SemanticCache:
+    return _semantic_cache
+
+
+def load_serving_index() -> IndexSnapshot:
+    """Return the snapshot currently served (loaded on first use)."""
+    return _index_manager.current()
+
+
+def get_rag_retriever(snapshot: Optional[IndexSnapshot] = None) -> DenseRetriever:
+    """Get a retriever for direct chunk retrieval (bypasses LLM synthesis).
+
+    The retriever pins the current snapshot (or ``snapshot``), so a request
+    keeps using it even if a newer one is swapped in meanwhile.
+    """
+    return DenseRetriever(snapshot or load_serving_index(), similarity_top_k=SIMILARITY_TOP_K)
 
 
 def extract_county_from_location(location: str) -> Optional[str]:
@@ -78,148 +240,182 @@ def extract_county_from_location(location: str) -> Optional[str]:
     Extract county name from location string.
     
     Args:
-        location: Location string (e.g., "Ithaca, NY", "Albany, NY 12201")
+        location: Location string (e.g., "Ithaca, NY", "Albany, NY 12201",
+            "Brooklyn, NY", "St. Lawrence County")
         
     Returns:
-        County name ("albany" or "tompkins") or None if not detected
+        County key as used by the index shards ("tompkins", "kings",
+        "stlawrence", see counties.yaml) or None if not detected
     """
-    location_lower = location.lower()
-    
-    # Check for albany
-    if "albany" in location_lower:
-        return "albany"
-    
-    # Check for tompkins (Ithaca is in Tompkins County)
-    if "tompkins" in location_lower or "ithaca" in location_lower:
-        return "tompkins"
-    
-    return None
+    return get_county_detector().detect(location)
+
+
+def county_at(coordinates: tuple[float, float]) -> Optional[str]:
+    """County containing (longitude, latitude), or None outside every county."""
+    grid = get_county_grid()
+    return grid.locate(*coordinates) if grid is not None else None
+
+
+def resolve_county(
+    location: str, coordinates: Optional[tuple[float, float]] = None
+) -> Optional[str]:
+    """
+    County of a request: from its coordinates when it has them, else from
+    the location text.
+
+    Args:
+        location: Location string, used when there are no coordinates or
+            they fall outside every county of the boundaries file
+        coordinates: (longitude, latitude) of the geocoded address
+
+    Returns:
+        County key as used by the index shards, or None if not detected
+    """
+    county = county_at(coordinates) if coordinates is not None else None
+    return county or extract_county_from_location(location)
 
 
 def normalize_and_expand_material(material: str) -> list[str]:
     """
     Normalize and expand material names to improve RAG retrieval.
     
-    Maps brand names, singular forms, and specific types to the terminology
-    used in the RAG knowledge base.
+    Maps brand names, plurals, resin codes and specific types to the
+    terminology used in the RAG knowledge base, using the taxonomy in
+    material_taxonomy.yaml (see material_synonyms.py).
     
     Args:
         material: Material name from vision service (e.g., "Battery", "Tupperware")
         
     Returns:
-        List of material terms to search for (original + normalized/expanded terms)
+        List of material terms to search for (original + ranked expanded terms)
     """
-    material_lower = material.lower().strip()
-    terms = [material]  # Always include original term
-    
-    # Battery normalization - map singular and specific types to "Batteries"
-    if "battery" in material_lower:
-        if "batteries" not in material_lower:
-            terms.append("Batteries")
-        # Also include specific battery types that might be in docs
-        if "lithium" in material_lower:
-            terms.extend(["Lithium batteries", "Batteries"])
-        elif "alkaline" in material_lower:
-            terms.extend(["Alkaline batteries", "Batteries"])
-        elif "lead" in material_lower or "acid" in material_lower:
-            terms.extend(["Car Batteries", "Lead acid batteries", "Batteries"])
-        else:
-            terms.append("Batteries")
-    
-    # Plastic container normalization - map brand names and generic terms
-    plastic_indicators = [
-        "tupperware", "rubbermaid", "gladware", "ziploc container",
-        "plastic container", "plastic food container", "food storage container"
+    return get_material_expander().expand(material)
+
+
+def build_query(term: str, county: Optional[str], location: str, condition: str) -> str:
+    parts = [term, "recycling"]
+    if county:
+        parts.append(get_county_detector().display_name(county))
+    if "new york" in location.lower() or "ny" in location.lower():
+        parts.append("New York")
+    if condition and condition.lower() not in ["unknown", "none", ""]:
+        parts.append(condition)
+    return " ".join(parts)
+
+
+def plan_queries(
+    material: str,
+    location: str,
+    condition: str = "",
+    coordinates: Optional[tuple[float, float]] = None,
+) -> list[tuple[str, str]]:
+    """Return the ``(term, retrieval query)`` pairs ``query_rag`` runs, in order."""
+    county = resolve_county(location, coordinates)
+    return plan_county_queries(material, county, location, condition)
+
+
+def plan_county_queries(
+    material: str, county: Optional[str], location: str, condition: str = ""
+) -> list[tuple[str, str]]:
+    return [
+        (term, build_query(term, county, location, condition))
+        for term in normalize_and_expand_material(material)
     ]
-    
-    if any(indicator in material_lower for indicator in plastic_indicators):
-        terms.extend([
-            "Plastic Containers",
-            "plastic containers",
-            "Plastic containers #1",
-            "Plastic containers #2",
-            "Plastic containers #5"
-        ])
-    
-    # Generic plastic normalization
-    if "plastic" in material_lower and "container" not in material_lower:
-        terms.append("Plastic Containers")
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_terms = []
-    for term in terms:
-        term_lower = term.lower()
-        if term_lower not in seen:
-            seen.add(term_lower)
-            unique_terms.append(term)
-    
-    return unique_terms
+
+
+def query_key(
+    material: str,
+    location: str,
+    condition: str = "",
+    coordinates: Optional[tuple[float, float]] = None,
+) -> tuple[str, ...]:
+    """
+    Key under which requests are equivalent: the same retrieval queries in
+    the same order (case-insensitive) produce the same result. ``context``
+    does not take part in retrieval.
+    """
+    return tuple(q.lower() for _, q in plan_queries(material, location, condition, coordinates))
 
 
 def query_rag(
     material: str,
     location: str,
     condition: str = "",
-    context: str = ""
+    context: str = "",
+    deadline: Optional[Deadline] = None,
+    coordinates: Optional[tuple[float, float]] = None,
+    snapshot: Optional[IndexSnapshot] = None,
 ) -> tuple[str, list[str]]:
     """
     Query RAG for recycling information using direct vector retrieval only.
 
     This bypasses LLM synthesis and always returns raw chunks from the index.
+    With a ``deadline``, no new term is started once less than
+    ``RAG_MIN_TERM_BUDGET_MS`` is left and the best result so far is returned
+    with ``deadline.partial`` set. ``coordinates`` (longitude, latitude)
+    decide the county when they fall inside one (``resolve_county``).
+    ``snapshot`` retrieves from that snapshot instead of the served one
+    (shadow replay of a candidate index).
     """
+    global partial_results, cancelled_queries, geo_resolved, geo_unresolved
     try:
         # Ensure index and retriever are ready
-        get_rag_query_engine()  # loads _index and configures Settings
-        retriever = get_rag_retriever()
-
-        county = extract_county_from_location(location)
-        material_terms = normalize_and_expand_material(material)
-
-        def build_query(term: str) -> str:
-            parts = [term, "recycling"]
-            if county:
-                parts += [county.capitalize(), "County"]
-            if "new york" in location.lower() or "ny" in location.lower():
-                parts.append("New York")
-            if condition and condition.lower() not in ["unknown", "none", ""]:
-                parts.append(condition)
-            return " ".join(parts)
-
-        def extract_sources_from_nodes(nodes) -> list[str]:
-            out: list[str] = []
-            for node in nodes:
-                n = getattr(node, "node", node)
-                md = getattr(n, "metadata", {}) or {}
-                if "source_url" in md:
-                    out.append(md["source_url"])
-                elif "source_file" in md:
-                    out.append(md["source_file"])
-            return out
-
-        def extract_text_from_nodes(nodes) -> str:
-            texts: list[str] = []
-            for node in nodes:
-                n = getattr(node, "node", node)
-                txt = getattr(n, "text", None)
-                if txt:
-                    texts.append(txt)
-            return "\n\n".join(texts)
+        retriever = get_rag_retriever(snapshot)
+
+        def extract_sources_from_nodes(nodes: list[Chunk]) -> list[str]:
+            return [c.source for c in nodes if c.source]
+
+        def extract_text_from_nodes(nodes: list[Chunk]) -> str:
+            return CHUNK_SEPARATOR.join(c.text for c in nodes if c.text)
 
         best_text = ""
         best_sources: list[str] = []
+        with span("rag.plan") as plan_span:
+            # Same result as resolve_county(), counting how coordinates fared
+            county = county_at(coordinates) if coordinates is not None else None
+            if coordinates is not None:
+                if county is not None:
+                    geo_resolved += 1
+                else:
+                    geo_unresolved += 1
+            if county is None:
+                county = extract_county_from_location(location)
 
-        for term in material_terms:
-            q = build_query(term)
-            print(f"RAG RAW RETRIEVAL: term={term}, query={q}")
+            plan = plan_county_queries(material, county, location, condition)
+            # The county's topic page for the material first; the vector scan over
+            # the expanded terms is the fallback
+            steps = [(term, q, False) for term, q in plan]
+            if TOPIC_ROUTING and county and plan:
+                steps.insert(0, (material, plan[0][1], True))
+            if plan_span is not None:
+                plan_span.set(county=county, terms=len(plan))
+
+        for term, q, by_topic in steps:
+            print(f"RAG RAW RETRIEVAL: term={term}, query={q}{' (topic page)' if by_topic else ''}")
             try:
-                nodes = retriever.retrieve(q)
+                if deadline is not None:
+                    deadline.check(f"term '{term}'", MIN_TERM_BUDGET)
+                with span("rag.term", term=term, topic_page=by_topic) as term_span:
+                    if by_topic:
+                        nodes = retriever.retrieve_topic(material, q, county, deadline)
+                    else:
+                        nodes = retriever.retrieve(q, county, deadline)
+                    if term_span is not None:
+                        term_span.set(chunks=len(nodes))
+            except DeadlineExceeded as e:
+                print(f"RAG query stopped: {e}; returning the terms retrieved so far")
+                deadline.partial = True
+                if e.cancelled:
+                    cancelled_queries += 1
+                else:
+                    partial_results += 1
+                break
             except Exception as e:
                 print(f"Error retrieving for term '{term}': {e}")
                 continue
 
             if not nodes:
-                print(f"No nodes retrieved for term '{term}'")
+                print(f"No {'topic page' if by_topic else 'nodes retrieved'} for term '{term}'")
                 continue
 
             raw_text = extract_text_from_nodes(nodes)
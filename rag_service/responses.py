@@ -0,0 +1,170 @@
+"""Response encoding: fast JSON rendering and negotiated compression.
+
+``/query`` answers carry up to ~15 chunks of regulation text (tens of KB of
+JSON). ``FastJSONResponse`` renders them with ``orjson`` when it is
+installed (falling back to the standard encoder), and endpoints on the hot
+path build it directly from plain dicts, skipping Pydantic validation and
+``jsonable_encoder``.
+
+``CompressionMiddleware`` compresses JSON and text responses of at least
+``RAG_COMPRESS_MIN_BYTES`` with brotli (when the ``brotli`` package is
+installed) or gzip, whichever the client's ``Accept-Encoding`` prefers.
+Streaming responses are compressed chunk by chunk with a flush after each,
+so clients still see every chunk as it is sent. Node's fetch decompresses
+both transparently.
+"""
+import importlib.util
+import os
+import zlib
+from typing import Any, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+if ORJSON_AVAILABLE:
+    import orjson
+if BROTLI_AVAILABLE:
+    import brotli
+
+# Smaller bodies are sent as they are: not worth the CPU or the header bytes
+COMPRESS_MIN_BYTES = int(os.getenv("RAG_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RAG_GZIP_LEVEL", "4"))
+BROTLI_QUALITY = int(os.getenv("RAG_BROTLI_QUALITY", "4"))
+
+_COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        if not ORJSON_AVAILABLE:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick ``"br"``, ``"gzip"`` or None (identity) from an Accept-Encoding header."""
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+    wildcard = weights.get("*", 0.0)
+    candidates = (["br"] if BROTLI_AVAILABLE else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = weights.get(name, wildcard)
+        # On equal weight the earlier (better compressing) coding wins
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class _Compressor:
+    """Incremental brotli or gzip stream with one interface."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def flush(self, data: bytes) -> bytes:
+        """Compress ``data`` and flush, so the peer can decode all of it now."""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body with ``encoding`` (``"br"`` or ``"gzip"``)."""
+    return _Compressor(encoding).finish(data)
+
+
+class CompressionMiddleware:
+    """Compress large JSON/text responses with the encoding the client prefers."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is not None:
+                responder = _CompressingResponder(self.app, encoding, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressingResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None  # type: ignore[assignment]
+        self.start: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body part shows whether to compress
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start["headers"])
+            content_type = headers.get("content-type", "")
+            if (
+                "content-encoding" in headers
+                or not content_type.startswith(_COMPRESSIBLE_TYPES)
+                or (not more_body and len(body) < self.minimum_size)
+            ):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.compressor = _Compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send(self.start)
+
+        data = self.compressor.flush(body) if more_body else self.compressor.finish(body)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
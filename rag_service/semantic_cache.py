@@ -0,0 +1,151 @@
+"""Semantic cache of recent retrievals.
+
+Paraphrased requests ("plastic tub" / "plastic food container" in the same
+county) produce queries whose embeddings are nearly identical, so their
+rankings are too. The cache keeps the embeddings of recent queries, in one
+small in-memory matrix, with the ranked ``(shard, row, score)`` hits they
+retrieved; a new query whose cosine similarity to a cached query of the
+same county reaches the threshold reuses that ranking and skips the index
+scan.
+
+Entries hold row numbers of one snapshot, so the cache is tied to a
+snapshot version and emptied when the served version changes. The table is
+bounded: when it is full the least recently used entry is replaced.
+
+A sample of hits (``audit_rate``) is also checked against a full search.
+A hit whose top-k rows overlap the true top-k by less than
+``min_overlap`` counts as a false hit. The audit numbers are used to tune
+the threshold.
+"""
+import os
+import random
+import threading
+from typing import Optional
+
+import numpy as np
+
+CACHE_SIZE = int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "1024"))
+THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+AUDIT_RATE = float(os.getenv("RAG_SEMANTIC_CACHE_AUDIT_RATE", "0.02"))
+MIN_OVERLAP = float(os.getenv("RAG_SEMANTIC_CACHE_MIN_OVERLAP", "0.6"))
+
+Hits = list[tuple[str, int, float]]
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        capacity: int = CACHE_SIZE,
+        threshold: float = THRESHOLD,
+        audit_rate: float = AUDIT_RATE,
+        min_overlap: float = MIN_OVERLAP,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self._reset(None)
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.audits = 0
+        self.false_hits = 0
+        self._overlap_sum = 0.0
+
+    def _reset(self, version: Optional[str]) -> None:
+        self.version = version
+        self._vectors: Optional[np.ndarray] = None  # capacity x dims, allocated lazily
+        # Counties as small ints so the same-county mask is one comparison
+        self._county_codes: dict[Optional[str], int] = {}
+        self._counties = np.full(self.capacity, -1, dtype=np.int32)
+        self._hits: list[Optional[Hits]] = [None] * self.capacity
+        self._last_used = np.zeros(self.capacity, dtype=np.int64)  # 0 = free slot
+        self._clock = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def clear(self, version: Optional[str] = None) -> None:
+        """Drop every entry; only entries of ``version`` are accepted afterwards."""
+        with self._lock:
+            self._reset(version)
+
+    def lookup(self, version: str, county: Optional[str], embedding: np.ndarray) -> Optional[Hits]:
+        """Return the cached ranking of a near-identical query, if any."""
+        if not self.enabled:
+            return None
+        query = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            self.lookups += 1
+            if version != self.version or self._vectors is None or len(query) != self._vectors.shape[1]:
+                return None
+            code = self._county_codes.get(county)
+            if code is None:
+                return None
+            candidates = np.flatnonzero((self._counties == code) & (self._last_used > 0))
+            if not len(candidates):
+                return None
+            sims = self._vectors[candidates] @ query
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            slot = int(candidates[best])
+            self._clock += 1
+            self._last_used[slot] = self._clock
+            self.hits += 1
+            return self._hits[slot]
+
+    def put(self, version: str, county: Optional[str], embedding: np.ndarray, hits: Hits) -> None:
+        if not self.enabled:
+            return
+        query = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            if self.version is None:
+                self.version = version
+            if version != self.version:
+                # Retrieved from a snapshot that is no longer served
+                return
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                self._vectors = np.zeros((self.capacity, len(query)), dtype=np.float32)
+                self._last_used[:] = 0
+            slot = int(np.argmin(self._last_used))
+            if self._last_used[slot]:
+                self.evictions += 1
+            self._clock += 1
+            self._vectors[slot] = query
+            self._counties[slot] = self._county_codes.setdefault(county, len(self._county_codes))
+            self._hits[slot] = hits
+            self._last_used[slot] = self._clock
+
+    def should_audit(self) -> bool:
+        return random.random() < self.audit_rate
+
+    def record_audit(self, cached: Hits, actual: Hits) -> float:
+        """Compare a cache hit with the full search; returns the top-k overlap."""
+        k = max(len(actual), 1)
+        overlap = len({hit[:2] for hit in cached} & {hit[:2] for hit in actual}) / k
+        with self._lock:
+            self.audits += 1
+            self._overlap_sum += overlap
+            if overlap < self.min_overlap:
+                self.false_hits += 1
+        return overlap
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "version": self.version,
+            "entries": int(np.count_nonzero(self._last_used)),
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "evictions": self.evictions,
+            "audits": self.audits,
+            "false_hits": self.false_hits,
+            "false_hit_rate": self.false_hits / self.audits if self.audits else 0.0,
+            "mean_audit_overlap": self._overlap_sum / self.audits if self.audits else None,
+        }
@@ -0,0 +1,142 @@
+"""Per-conversation reuse of retrievals for the chat flow.
+
+The Node backend queries the service on every chat turn with the material
+and location of the original analysis. Those turns would repeat the same
+retrieval, so the first turn of a conversation (``session_id``) stores its
+result here and later turns with the same retrieval key return it without
+searching. Materials the user's message brings up that the conversation has
+not covered yet are retrieved once each and kept with the session too.
+
+Sessions expire ``RAG_SESSION_TTL_SECONDS`` after their last use. At most
+``RAG_SESSION_MAX`` are kept (least recently used first out), each with at
+most ``RAG_SESSION_MAX_TERMS`` follow-up materials. The store is per worker
+and emptied on an index swap; a conversation that lands on another worker
+just retrieves again.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, Optional
+
+SESSION_TTL = float(os.getenv("RAG_SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("RAG_SESSION_MAX", "2048"))
+MAX_SESSION_TERMS = int(os.getenv("RAG_SESSION_MAX_TERMS", "8"))
+
+
+@dataclass
+class Retrieval:
+    regulations: str
+    sources: list[str]
+
+
+@dataclass
+class Session:
+    """What one conversation has retrieved so far."""
+
+    key: Hashable  # query_key() of the conversation's material and location
+    base: Retrieval
+    # Material categories the base retrieval already covers
+    categories: frozenset[str]
+    # Follow-up material category -> its retrieval, oldest first
+    terms: OrderedDict[str, Retrieval] = field(default_factory=OrderedDict)
+    expires: float = 0.0
+
+
+class SessionStore:
+    """Bounded TTL store of ``Session`` objects by session id."""
+
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL,
+        capacity: int = MAX_SESSIONS,
+        max_terms: int = MAX_SESSION_TERMS,
+    ):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.max_terms = max_terms
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.term_retrievals = 0
+        self.term_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.ttl > 0
+
+    def _purge(self, now: float) -> None:
+        # Sessions are kept in last-use order, so the expired ones come first
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.expires > now:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+    def get(self, session_id: str, key: Hashable) -> Optional[Session]:
+        """The live session for ``session_id`` if it was started with ``key``."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(session_id)
+            if session is None or session.key != key:
+                self.misses += 1
+                return None
+            session.expires = now + self.ttl
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return session
+
+    def start(self, session_id: str, key: Hashable, base: Retrieval, categories: frozenset[str]) -> Optional[Session]:
+        """Store a new session (replacing any with the same id); None when disabled."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        session = Session(key, base, categories, expires=now + self.ttl)
+        with self._lock:
+            self._purge(now)
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.capacity:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return session
+
+    def add_term(self, session: Session, category: str, retrieval: Retrieval) -> None:
+        with self._lock:
+            self.term_retrievals += 1
+            session.terms[category] = retrieval
+            while len(session.terms) > self.max_terms:
+                session.terms.popitem(last=False)
+
+    def term(self, session: Session, category: str) -> Optional[Retrieval]:
+        with self._lock:
+            retrieval = session.terms.get(category)
+            if retrieval is not None:
+                session.terms.move_to_end(category)
+                self.term_hits += 1
+            return retrieval
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._sessions),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "term_retrievals": self.term_retrievals,
+            "term_hits": self.term_hits,
+        }
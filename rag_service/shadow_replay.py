@@ -0,0 +1,206 @@
+"""Replay captured ``/query`` traffic against two index snapshots and compare them.
+
+Before a rebuilt or re-chunked index is published, this answers the
+requests of a capture log (``RAG_CAPTURE_FILE``, see capture.py) from the
+served snapshot and from the candidate, side by side, with ``query_rag`` in a
+thread pool. Per snapshot it reports the latency distribution, response
+payload sizes (the JSON body ``/query`` would send) and empty answers. For
+each request it compares the two answers' distinct sources: the same list,
+the same top source, and their Jaccard overlap. The requests
+whose answers differ most are listed at the end.
+
+Query embeddings are fetched in batches before each block of requests is
+replayed, so the latencies are retrieval only (no embedding API time), as
+on a warm embedding cache. The semantic cache is off, since it serves one
+snapshot at a time. Chat follow-ups are replayed as plain retrievals of
+their material.
+
+Usage (from rag_service/):
+    python shadow_replay.py rag_capture.jsonl --candidate 20250201-120000
+    python shadow_replay.py rag_capture.jsonl --baseline 20250101-120000 --candidate /tmp/idx/snapshots/x
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+import rag_query
+from bulk_query import read_pairs
+from embedding_client import get_embedding_client
+from index_manager import IndexSnapshot
+from rag_query import RAG_INDEX_PATH, plan_queries, query_rag
+from responses import FastJSONResponse
+from semantic_cache import SemanticCache
+from snapshots import resolve_current, snapshot_dir
+
+DEFAULT_BLOCK = 128
+SIDES = ("baseline", "candidate")
+
+
+def open_snapshot(root: Path, spec: str) -> IndexSnapshot:
+    """``current`` (the manifest's), a version under ``root`` or a snapshot directory."""
+    if spec == "current":
+        resolved = resolve_current(root)
+        if resolved is None:
+            raise SystemExit(f"No current snapshot under {root}")
+        version, path = resolved
+    elif Path(spec).is_dir():
+        path = Path(spec)
+        version = path.name
+    else:
+        version, path = spec, snapshot_dir(root, spec)
+    snapshot = IndexSnapshot.load(version, path)
+    snapshot.warm()
+    return snapshot
+
+
+def _prefetch(snapshots: dict[str, IndexSnapshot], pairs: list[dict]) -> None:
+    """Embed every query the block's retrievals may make, once per embedding model."""
+    queries = list(dict.fromkeys(
+        q
+        for pair in pairs
+        for _, q in plan_queries(pair["material"], pair["location"], pair["condition"], pair["coordinates"])
+    ))
+    for model in {s.shards.embed_model for s in snapshots.values()}:
+        try:
+            get_embedding_client(model).prefetch(queries)
+        except Exception as e:
+            # query_rag embeds per query (timed) or falls back to keyword search
+            print(f"Batch embedding failed: {e}", file=sys.stderr)
+
+
+def _answer(snapshot: IndexSnapshot, pair: dict) -> dict:
+    start = time.perf_counter()
+    text, sources = query_rag(
+        pair["material"], pair["location"], pair["condition"],
+        coordinates=pair["coordinates"], snapshot=snapshot,
+    )
+    latency_ms = (time.perf_counter() - start) * 1e3
+    body = FastJSONResponse({"regulations": text, "sources": sources or [], "partial": False}).body
+    return {"latency_ms": latency_ms, "bytes": len(body), "sources": sources}
+
+
+def compare_sources(baseline: list[str], candidate: list[str]) -> dict:
+    """Overlap of two answers' sources (one per chunk, so repeats are dropped first)."""
+    a, b = set(baseline), set(candidate)
+    return {
+        "identical": list(dict.fromkeys(baseline)) == list(dict.fromkeys(candidate)),
+        "same_top": bool(baseline) and bool(candidate) and baseline[0] == candidate[0],
+        "jaccard": len(a & b) / len(a | b) if a | b else 1.0,
+    }
+
+
+def replay(snapshots: dict[str, IndexSnapshot], pairs, concurrency: int, block: int) -> list[dict]:
+    results = []
+    pairs = iter(pairs)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while chunk := list(islice(pairs, block)):
+            _prefetch(snapshots, chunk)
+            futures = []
+            for n, pair in enumerate(chunk):
+                # Alternate which snapshot goes first
+                order = SIDES if n % 2 == 0 else SIDES[::-1]
+                futures.append({side: pool.submit(_answer, snapshots[side], pair) for side in order})
+            for pair, sides in zip(chunk, futures):
+                answers = {side: future.result() for side, future in sides.items()}
+                results.append({
+                    "index": pair["index"],
+                    "material": pair["material"],
+                    "location": pair["location"],
+                    **answers,
+                    **compare_sources(answers["baseline"]["sources"], answers["candidate"]["sources"]),
+                })
+    return results
+
+
+def report(results: list[dict], snapshots: dict[str, IndexSnapshot], top: int) -> str:
+    n = len(results)
+    lines = [
+        f"{n} requests replayed: baseline {snapshots['baseline'].version}, "
+        f"candidate {snapshots['candidate'].version}",
+        f"{'':<24}{'baseline':>14}{'candidate':>14}",
+    ]
+
+    def row(label: str, values: dict[str, float], fmt: str) -> None:
+        lines.append(f"{label:<24}" + "".join(f"{values[side]:>14{fmt}}" for side in SIDES))
+
+    latencies = {side: np.array([r[side]["latency_ms"] for r in results]) for side in SIDES}
+    payloads = {side: np.array([r[side]["bytes"] for r in results]) for side in SIDES}
+    for q in (50, 95, 99):
+        row(f"latency p{q} ms", {side: np.percentile(latencies[side], q) for side in SIDES}, ".2f")
+    row("latency max ms", {side: latencies[side].max() for side in SIDES}, ".2f")
+    row("payload mean bytes", {side: payloads[side].mean() for side in SIDES}, ".0f")
+    row("payload p95 bytes", {side: np.percentile(payloads[side], 95) for side in SIDES}, ".0f")
+    counts = {side: np.array([len(r[side]["sources"]) for r in results]) for side in SIDES}
+    row("chunks per answer", {side: counts[side].mean() for side in SIDES}, ".2f")
+    row("empty answers", {side: int((counts[side] == 0).sum()) for side in SIDES}, "d")
+
+    newly_empty = sum(bool(r["baseline"]["sources"]) and not r["candidate"]["sources"] for r in results)
+    newly_answered = sum(not r["baseline"]["sources"] and bool(r["candidate"]["sources"]) for r in results)
+    lines += [
+        "",
+        f"identical sources {sum(r['identical'] for r in results) / n:.1%}, "
+        f"same top source {sum(r['same_top'] for r in results) / n:.1%}, "
+        f"mean source overlap (Jaccard) {np.mean([r['jaccard'] for r in results]):.3f}",
+        f"answers lost by the candidate: {newly_empty}, gained: {newly_answered}",
+    ]
+    changed = sorted((r for r in results if not r["identical"]), key=lambda r: r["jaccard"])[:top]
+    if changed:
+        lines.append(f"\nleast overlap (of {sum(not r['identical'] for r in results)} changed answers):")
+        for r in changed:
+            tops = [r[side]["sources"][0] if r[side]["sources"] else "-" for side in SIDES]
+            lines.append(
+                f"  #{r['index']} {r['material']!r} @ {r['location']!r}: overlap {r['jaccard']:.2f}, "
+                f"top source {tops[0]} -> {tops[1]}"
+            )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", type=Path, help="capture log (JSONL with material and location)")
+    parser.add_argument("--index", type=Path, default=RAG_INDEX_PATH, help="snapshot root")
+    parser.add_argument("--baseline", default="current", help="'current', a version or a snapshot directory")
+    parser.add_argument("--candidate", required=True, help="a version or a snapshot directory")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--concurrency", type=int, default=2, help="retrievals run at once (default: 2)")
+    parser.add_argument(
+        "--block", type=int, default=DEFAULT_BLOCK,
+        help=f"requests embedded together before replay (default: {DEFAULT_BLOCK})",
+    )
+    parser.add_argument("--top", type=int, default=10, help="most changed answers to list")
+    parser.add_argument("--json", type=Path, help="also write every request's comparison here")
+    parser.add_argument("--verbose", action="store_true", help="keep the retrieval logs")
+    args = parser.parse_args()
+
+    snapshots = {side: open_snapshot(args.index, spec) for side, spec in zip(SIDES, (args.baseline, args.candidate))}
+    if snapshots["baseline"].path.resolve() == snapshots["candidate"].path.resolve():
+        print("warning: baseline and candidate are the same snapshot", file=sys.stderr)
+    rag_query._semantic_cache = SemanticCache(capacity=0)
+
+    pairs = islice(read_pairs(args.log), args.limit)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            # query_rag logs every term it tries
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        results = replay(snapshots, pairs, args.concurrency, args.block)
+    if not results:
+        raise SystemExit("No requests in the log")
+    print(report(results, snapshots, args.top))
+    print(f"\nreplayed in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
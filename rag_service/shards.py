@@ -0,0 +1,202 @@
+"""Per-county shards of a serving snapshot, loaded lazily under a memory budget.
+
+A sharded snapshot holds one complete serving export (dense index + chunk
+store) per county, keyed by the ``county`` front matter of the scraped
+documents, plus a statewide shard for chunks that belong to no county:
+
+    snapshots/<version>/
+        shards.json                 {"format": 1, "embed_model": ..., "shards": {name: {...}}}
+        shards/<county>/            dense_index + node_store files
+        shards/_statewide/
+
+A query for a county searches that county's shard and the statewide shard;
+a query whose county is unknown searches the statewide shard only (mapping
+every county for it would evict the warm ones). Shards are mapped on
+first use and kept in LRU order; when the scan matrices of the loaded shards
+exceed ``RAG_SHARD_BUDGET_MB`` the coldest shards are dropped (their mmaps
+are released once no request uses them), so a worker's memory follows the
+counties it is asked about rather than the size of the corpus.
+
+Snapshots without ``shards.json`` (one monolithic export) are served as a
+single shard. The layout itself is defined in snapshots.py, which the build
+script imports.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from dense_index import DenseIndex
+from lexical_index import LexicalIndex
+from material_synonyms import get_material_expander
+from node_store import NodeStore
+from snapshots import (
+    SHARD_FORMAT_VERSION,
+    SHARDS_DIR,
+    SHARDS_MANIFEST,
+    STATEWIDE_SHARD,
+    is_sharded,
+    shard_key,
+)
+from topic_index import TopicIndex
+
+# Name of the single shard of a monolithic export
+MONOLITHIC_SHARD = "_all"
+
+SHARD_BUDGET_BYTES = int(float(os.getenv("RAG_SHARD_BUDGET_MB", "256")) * 1e6)
+
+
+class IndexShard:
+    """Dense index and chunk store of one shard."""
+
+    def __init__(self, name: str, path: Path):
+        if not (path / "meta.json").exists() or not NodeStore.exists(path):
+            raise FileNotFoundError(f"Incomplete serving index shard at {path}")
+        self.name = name
+        self.path = path
+        self.dense_index = DenseIndex(path)
+        self.node_store = NodeStore(path)
+        self._lexical: Optional[LexicalIndex] = None
+        self._lexical_lock = threading.Lock()
+        self._topics: Optional[TopicIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.dense_index)
+
+    @property
+    def resident_bytes(self) -> int:
+        return self.dense_index.resident_bytes
+
+    def warm(self) -> None:
+        """Page in the scan matrix and exercise the search path once."""
+        if len(self.dense_index):
+            dims = self.dense_index.vectors_full.shape[1]
+            self.dense_index.search(np.ones(dims, dtype=np.float32), top_k=1)
+            self.node_store.text(0)
+
+    def lexical_index(self) -> LexicalIndex:
+        """Keyword index for the embedding fallback, built on first use."""
+        with self._lexical_lock:
+            if self._lexical is None:
+                start = time.perf_counter()
+                self._lexical = LexicalIndex.build(self.node_store)
+                print(f"Built lexical fallback index for shard {self.name} in {time.perf_counter() - start:.2f}s")
+            return self._lexical
+
+    def topic_index(self) -> TopicIndex:
+        """Topic pages of this shard (topic_index.py), built on first use."""
+        if self._topics is None:
+            # Cheap (one pass over the interned columns); a racing build is harmless
+            self._topics = TopicIndex.build(self.node_store, get_material_expander())
+        return self._topics
+
+
+class ShardSet:
+    """The shards of one snapshot, mapped on demand and evicted LRU."""
+
+    def __init__(self, path: Path, budget_bytes: int = SHARD_BUDGET_BYTES):
+        self.path = Path(path)
+        self.budget_bytes = budget_bytes
+        self._loaded: OrderedDict[str, IndexShard] = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        if is_sharded(self.path):
+            with open(self.path / SHARDS_MANIFEST, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != SHARD_FORMAT_VERSION:
+                raise ValueError(f"Unsupported shard format {manifest.get('format')} in {self.path}")
+            self.sharded = True
+            self.names: list[str] = sorted(manifest["shards"])
+            self.info: dict[str, dict] = manifest["shards"]
+            self.embed_model: Optional[str] = manifest.get("embed_model")
+        else:
+            self.sharded = False
+            self.names = [MONOLITHIC_SHARD]
+            main = self.get(MONOLITHIC_SHARD)
+            self.info = {MONOLITHIC_SHARD: {"count": len(main)}}
+            self.embed_model = main.dense_index.meta.get("embed_model")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.info
+
+    @property
+    def count(self) -> int:
+        return sum(info["count"] for info in self.info.values())
+
+    def _shard_path(self, name: str) -> Path:
+        return self.path if name == MONOLITHIC_SHARD else self.path / SHARDS_DIR / name
+
+    def get(self, name: str) -> IndexShard:
+        """Return shard ``name``, mapping it (and evicting cold shards) if needed."""
+        with self._lock:
+            shard = self._loaded.get(name)
+            if shard is not None:
+                self._loaded.move_to_end(name)
+                return shard
+        # Map outside the lock; a racing load of the same shard is harmless
+        shard = IndexShard(name, self._shard_path(name))
+        with self._lock:
+            existing = self._loaded.get(name)
+            if existing is not None:
+                return existing
+            self._loaded[name] = shard
+            self.loads += 1
+            self._evict()
+        return shard
+
+    def _evict(self) -> None:
+        # Called with self._lock held; the shard just loaded is never evicted
+        while len(self._loaded) > 1 and self.resident_bytes > self.budget_bytes:
+            self._loaded.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(shard.resident_bytes for shard in self._loaded.values())
+
+    def for_county(self, county: Optional[str]) -> list[str]:
+        """Names of the shards a query about ``county`` searches."""
+        if not self.sharded:
+            return [MONOLITHIC_SHARD]
+        statewide = [STATEWIDE_SHARD] if STATEWIDE_SHARD in self.info else []
+        key = shard_key(county) if county else None
+        if key and key != STATEWIDE_SHARD and key in self.info:
+            return [key] + statewide
+        if statewide:
+            return statewide
+        # Every chunk of this snapshot has a county: its largest shard
+        return [max(self.names, key=lambda name: self.info[name]["count"])]
+
+    def warm(self) -> None:
+        """Map and page in the shards every query may need."""
+        for name in (MONOLITHIC_SHARD,) if not self.sharded else (STATEWIDE_SHARD,):
+            if name in self.info:
+                self.get(name).warm()
+
+    def describe(self) -> str:
+        if not self.sharded:
+            main = self.get(MONOLITHIC_SHARD)
+            return (
+                f"{main.dense_index.quantization}, {len(main)} chunks, "
+                f"{main.resident_bytes / 1e6:.1f} MB scan matrix"
+            )
+        return f"{len(self.names)} shards, {self.count} chunks, budget {self.budget_bytes / 1e6:.0f} MB"
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = list(self._loaded)
+        return {
+            "sharded": self.sharded,
+            "shards": len(self.names),
+            "loaded": loaded,
+            "resident_mb": round(self.resident_bytes / 1e6, 2),
+            "budget_mb": round(self.budget_bytes / 1e6, 2),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,77 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+The first caller for a key (the leader) starts the computation; callers that
+arrive with the same key while it is running (followers) await the same
+result instead of repeating it. Nothing is cached: once the computation
+finishes, the next call for the key starts a new one.
+
+A caller that goes away does not cancel the computation for the others, but
+once every caller of a key has gone the computation is cancelled, so work
+nobody is waiting for stops.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent ``do(key, fn)`` calls with equal keys."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of ``fn()``, sharing it with concurrent callers of
+        the same ``key``. Exceptions are shared the same way.
+
+        The computation runs as its own task, so a caller that is cancelled
+        (e.g. the client disconnected) does not cancel it for the others; the
+        task is cancelled when the last caller is.
+        """
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = self._inflight[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.followers += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                self.abandoned += 1
+                # New callers start afresh instead of joining a cancelled task
+                self._forget(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            "calls": calls,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            # Share of calls served by another call's computation
+            "coalescing_ratio": self.followers / calls if calls else 0.0,
+            "inflight": len(self._inflight),
+            # Computations cancelled because all their callers went away
+            "abandoned": self.abandoned,
+        }
@@ -0,0 +1,171 @@
+"""Versioned serving-index snapshots and their manifest.
+
+Each build of the serving export goes into its own directory and is then
+published by pointing the manifest at it:
+
+    rag_index_morechunked/
+        manifest.json               {"current": "<version>", "snapshots": [...]}
+        snapshots/<version>/        dense_index + node_store files, or one set
+                                    per county under shards/ (see shards.py)
+
+The manifest is replaced atomically, so readers (the service's file watcher
+in every worker) only ever see a complete snapshot. This module has no
+third-party dependencies; the build script imports it too.
+"""
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+MANIFEST_NAME = "manifest.json"
+SNAPSHOTS_DIR = "snapshots"
+# Export location used before snapshots existed
+LEGACY_SERVING_DIR = "serving"
+LEGACY_VERSION = "legacy"
+
+# Sharded snapshots: shards.json + shards/<name>/ (one export per county)
+SHARDS_MANIFEST = "shards.json"
+SHARDS_DIR = "shards"
+STATEWIDE_SHARD = "_statewide"
+SHARD_FORMAT_VERSION = 1
+
+# Seconds a snapshot that stopped being current is kept before pruning; must
+# exceed the services' RAG_INDEX_WATCH_SECONDS plus a reload
+PRUNE_GRACE_SECONDS = 600.0
+
+_NON_KEY = re.compile(r"[^a-z0-9]+")
+
+
+def new_version(root: Path) -> str:
+    """A sortable, unused version name based on the current UTC time."""
+    base = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    version, n = base, 1
+    while (Path(root) / SNAPSHOTS_DIR / version).exists():
+        version, n = f"{base}.{n}", n + 1
+    return version
+
+
+def snapshot_dir(root: Path, version: str) -> Path:
+    if version == LEGACY_VERSION:
+        return Path(root) / LEGACY_SERVING_DIR
+    return Path(root) / SNAPSHOTS_DIR / version
+
+
+def read_manifest(root: Path) -> Optional[dict]:
+    path = Path(root) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(root: Path, manifest: dict) -> None:
+    """Atomically replace the manifest."""
+    path = Path(root) / MANIFEST_NAME
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def manifest_mtime(root: Path) -> Optional[float]:
+    try:
+        return (Path(root) / MANIFEST_NAME).stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _retire(manifest: dict, version: str) -> None:
+    """Record when the current snapshot stops being current, for the prune grace period."""
+    old = manifest.get("current")
+    for entry in manifest["snapshots"]:
+        if entry["version"] == old and old != version:
+            entry["retired"] = time.time()
+        if entry["version"] == version:
+            entry.pop("retired", None)
+
+
+def publish_snapshot(
+    root: Path, version: str, info: dict, keep: int = 3, grace: float = PRUNE_GRACE_SECONDS
+) -> dict:
+    """
+    Make ``version`` the current snapshot and prune old ones.
+
+    Keeps the newest ``keep`` snapshots, plus any snapshot that was current
+    less than ``grace`` seconds ago. A sharded snapshot maps its shards on
+    first use and again after evicting them, so its files must stay on disk
+    until every worker has moved on. Each worker's watcher follows the
+    manifest within ``RAG_INDEX_WATCH_SECONDS``, well inside the grace
+    period. Such snapshots are pruned by a later publish.
+    """
+    manifest = read_manifest(root) or {"snapshots": []}
+    entries = [e for e in manifest["snapshots"] if e["version"] != version]
+    entries.append({"version": version, "created": time.time(), **info})
+    entries.sort(key=lambda e: e["version"])
+    manifest["snapshots"] = entries
+    _retire(manifest, version)
+
+    now = time.time()
+    old = entries[:-keep] if keep and len(entries) > keep else []
+    # Entries of manifests older than the grace period count as retired long ago
+    pruned = [e for e in old if now - e.get("retired", 0) >= grace]
+    entries = [e for e in entries if e not in pruned]
+    manifest = {"current": version, "snapshots": entries}
+    write_manifest(root, manifest)
+
+    for entry in pruned:
+        shutil.rmtree(snapshot_dir(root, entry["version"]), ignore_errors=True)
+    return manifest
+
+
+def snapshot_entry(root: Path, version: str, manifest: Optional[dict] = None) -> dict:
+    """The manifest's entry for ``version``; KeyError if it lists no such snapshot."""
+    manifest = manifest if manifest is not None else read_manifest(root)
+    for entry in (manifest or {}).get("snapshots", []):
+        if entry["version"] == version:
+            return entry
+    raise KeyError(f"Unknown snapshot version {version!r}")
+
+
+def set_current(root: Path, version: str) -> dict:
+    """Point the manifest at an existing snapshot (rollback / roll forward)."""
+    manifest = read_manifest(root)
+    snapshot_entry(root, version, manifest)
+    _retire(manifest, version)
+    manifest["current"] = version
+    write_manifest(root, manifest)
+    return manifest
+
+
+def resolve_current(root: Path) -> Optional[tuple[str, Path]]:
+    """Return ``(version, path)`` of the snapshot to serve, if any."""
+    manifest = read_manifest(root)
+    if manifest and manifest.get("current"):
+        version = manifest["current"]
+        return version, snapshot_dir(root, version)
+    legacy = Path(root) / LEGACY_SERVING_DIR
+    if (legacy / "meta.json").exists():
+        return LEGACY_VERSION, legacy
+    return None
+
+
+def shard_key(county: Optional[str]) -> str:
+    """Shard name for a ``county`` front-matter value ("St. Lawrence" -> "stlawrence")."""
+    key = _NON_KEY.sub("", (county or "").lower())
+    return key or STATEWIDE_SHARD
+
+
+def is_sharded(path: Path) -> bool:
+    return (Path(path) / SHARDS_MANIFEST).exists()
+
+
+def write_shards_manifest(out_dir: Path, shards: dict[str, dict], embed_model: Optional[str]) -> dict:
+    manifest = {"format": SHARD_FORMAT_VERSION, "embed_model": embed_model, "shards": shards}
+    with open(Path(out_dir) / SHARDS_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
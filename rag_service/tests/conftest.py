@@ -0,0 +1,77 @@
+"""
+Shared fixtures; the service modules import each other flat, as in app.py.
+The repo root is importable too, for the build scripts (ingest_queue.py).
+"""
+import json
+import sys
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(1, str(Path(__file__).resolve().parents[2]))
+
+import embedding_client  # noqa: E402
+from dense_index import write_dense_index  # noqa: E402
+from embedding_client import EmbeddingClient  # noqa: E402
+from node_store import write_node_store  # noqa: E402
+from snapshots import publish_snapshot, snapshot_dir  # noqa: E402
+
+# Embedding models of the fake provider and their dimensions
+MODEL_DIMS = {"text-embedding-3-small": 4, "text-embedding-3-large": 6}
+
+
+@pytest.fixture
+def make_snapshot(tmp_path):
+    """Write and publish a small monolithic snapshot under ``tmp_path``; returns its directory."""
+
+    def make(version: str, embed_model: str = "text-embedding-3-small", count: int = 4) -> Path:
+        out = snapshot_dir(tmp_path, version)
+        dims = MODEL_DIMS[embed_model]
+        vectors = np.random.default_rng(len(version)).standard_normal((count, dims)).astype(np.float32)
+        meta = write_dense_index(
+            out, [f"n{i}" for i in range(count)], vectors, "float32", embed_model=embed_model
+        )
+        write_node_store(
+            out,
+            [f"chunk {i} of {version}" for i in range(count)],
+            [{"source_url": f"https://example.org/{version}/{i}"} for i in range(count)],
+        )
+        publish_snapshot(tmp_path, version, {"count": meta["count"], "embed_model": embed_model})
+        return out
+
+    return make
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    """
+    Route the embedding clients to an in-process provider. A vector has the
+    dimensions of the requested model, filled with the text's length. Yields
+    the model of every request made.
+    """
+    calls = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        calls.append(payload["model"])
+        dims = MODEL_DIMS[payload["model"]]
+        data = [{"index": i, "embedding": [float(len(t))] * dims} for i, t in enumerate(payload["input"])]
+        return httpx.Response(200, json={"data": data})
+
+    init = EmbeddingClient.__init__
+
+    def init_offline(self, *args, **kwargs):
+        init(self, *args, hedge_after=0, **kwargs)
+        self._client.close()
+        self._client = httpx.Client(base_url="http://provider", transport=httpx.MockTransport(handle))
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("RAG_EMBED_MODEL", raising=False)
+    monkeypatch.setattr(embedding_client, "_clients", {})
+    monkeypatch.setattr(EmbeddingClient, "__init__", init_offline)
+    yield calls
+    for client in embedding_client.embedding_clients():
+        client.close()
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+import pytest
+
+import app
+from deadline import Deadline
+
+
+@pytest.fixture
+def retrievals(monkeypatch):
+    """Stub query_rag: each call waits for ``release``, then is partial when its deadline has passed."""
+    calls = []
+    release = threading.Event()
+
+    def query_rag(material, location, condition, context, deadline, coordinates):
+        calls.append(deadline)
+        release.wait(5)
+        deadline.partial = deadline.expired
+        return f"regulations for {material}", ["https://example.org/a"]
+
+    monkeypatch.setattr(app, "query_rag", query_rag)
+    monkeypatch.setattr(app, "_query_flight", app.SingleFlight())
+    return calls, release
+
+
+def request():
+    return app.RAGQueryRequest(material="Plastic", location="Albany, NY")
+
+
+def test_follower_with_time_left_does_not_take_a_partial_result(retrievals):
+    calls, release = retrievals
+
+    async def run():
+        short, long = Deadline(0.05), Deadline(10)
+        leader = asyncio.ensure_future(app._coalesced(request(), "", short, "Plastic"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(app._coalesced(request(), "", long, "Plastic"))
+        await asyncio.sleep(0.1)
+        release.set()
+        return await leader, await follower
+
+    leader, follower = asyncio.run(run())
+    assert leader[2] is True
+    assert follower[2] is False
+    assert len(calls) == 2
+
+
+def test_complete_result_is_shared(retrievals):
+    calls, release = retrievals
+    release.set()
+
+    async def run():
+        return await asyncio.gather(
+            *(app._coalesced(request(), "", Deadline(10), "Plastic") for _ in range(3))
+        )
+
+    results = asyncio.run(run())
+    assert [r[2] for r in results] == [False, False, False]
+    assert len(calls) == 1
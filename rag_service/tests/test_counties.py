@@ -0,0 +1,37 @@
+import pytest
+
+from counties import CountyDetector
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return CountyDetector.from_file()
+
+
+@pytest.mark.parametrize(
+    "location, county",
+    [
+        # "<name> County" first, then places, then bare county names
+        ("Hamilton County, NY", "hamilton"),
+        ("Hamilton, NY", "madison"),
+        ("Saratoga Springs, NY", "saratoga"),
+        ("Albany, NY", "albany"),
+        ("Albany NY 12207", "albany"),
+        ("Albany, New York, USA", "albany"),
+        ("St. Lawrence County", "stlawrence"),
+        ("Brooklyn, NY 11201", "kings"),
+        # Streets and institutions named like a county
+        ("123 Madison Ave, New York, NY", "manhattan"),
+        ("Columbia University, New York, NY", "manhattan"),
+        ("500 Erie Blvd, Syracuse, NY", "onondaga"),
+        ("Monroe Street, Smalltown, NY", None),
+        # New York City; the state alone names no county
+        ("New York, NY", "manhattan"),
+        ("NYC", "manhattan"),
+        ("Smalltown, New York", None),
+        ("NY", None),
+        ("", None),
+    ],
+)
+def test_detect(detector, location, county):
+    assert detector.detect(location) == county
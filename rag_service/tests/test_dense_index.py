@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from dense_index import DenseIndex, write_dense_index
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((50, 16)).astype(np.float32)
+
+
+def test_float32_scan_reuses_full_vectors(tmp_path, vectors):
+    write_dense_index(tmp_path, [f"n{i}" for i in range(50)], vectors, "float32")
+    assert not (tmp_path / "vectors.q.npy").exists()
+
+    index = DenseIndex(tmp_path)
+    assert index.vectors_q is index.vectors_full
+    assert index.search(vectors[7], 3)[0][0] == 7
+
+
+@pytest.mark.parametrize("quantization, dims", [("int8", None), ("float32", 8)])
+def test_other_scans_write_their_matrix(tmp_path, vectors, quantization, dims):
+    write_dense_index(tmp_path, [f"n{i}" for i in range(50)], vectors, quantization, dims=dims)
+    assert (tmp_path / "vectors.q.npy").exists()
+
+    index = DenseIndex(tmp_path)
+    assert index.vectors_q.shape == (50, dims or 16)
+    assert index.search(vectors[7], 3)[0][0] == 7
+
+
+def test_rewrite_as_float32_removes_stale_scan_matrix(tmp_path, vectors):
+    write_dense_index(tmp_path, [f"n{i}" for i in range(50)], vectors, "int8")
+    write_dense_index(tmp_path, [f"n{i}" for i in range(50)], vectors, "float32")
+    assert not (tmp_path / "vectors.q.npy").exists()
+    assert not (tmp_path / "scales.npy").exists()
@@ -0,0 +1,79 @@
+import httpx
+import numpy as np
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+from embedding_client import EmbeddingClient, EmbeddingUnavailable, embedding_clients, get_embedding_client
+
+
+def test_one_client_per_model(fake_embeddings):
+    small = get_embedding_client("text-embedding-3-small")
+    large = get_embedding_client("text-embedding-3-large")
+    assert small is not large
+    assert (small.model, large.model) == ("text-embedding-3-small", "text-embedding-3-large")
+    assert get_embedding_client("text-embedding-3-small") is small
+    assert embedding_clients() == [small, large]
+
+
+def test_query_cache_is_per_model(fake_embeddings):
+    small = get_embedding_client("text-embedding-3-small")
+    large = get_embedding_client("text-embedding-3-large")
+    assert small.embed_query("glass jars").shape == (4,)
+    # A cached vector of the other model must not be returned
+    assert large.embed_query("glass jars").shape == (6,)
+    assert small.prefetch(["glass jars", "tires"]) == 1
+    assert large.embed_query("tires").shape == (6,)
+    assert fake_embeddings == ["text-embedding-3-small", "text-embedding-3-large", "text-embedding-3-small",
+                       "text-embedding-3-large"]
+
+
+def test_default_model(fake_embeddings, monkeypatch):
+    monkeypatch.setenv("RAG_EMBED_MODEL", "text-embedding-3-large")
+    assert get_embedding_client().model == "text-embedding-3-large"
+    # A snapshot's recorded model wins over the env default
+    assert get_embedding_client("text-embedding-3-small").model == "text-embedding-3-small"
+    np.testing.assert_array_equal(get_embedding_client().embed_query("can"), [3.0] * 6)
+
+
+def client_answering(*statuses):
+    """A client whose provider answers with ``statuses`` in turn (200 with a vector)."""
+    replies = iter(statuses)
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        status = next(replies)
+        if status != 200:
+            return httpx.Response(status, json={"error": {"message": "nope"}})
+        return httpx.Response(200, json={"data": [{"index": 0, "embedding": [1.0, 0.0]}]})
+
+    client = EmbeddingClient("test", hedge_after=0, breaker=CircuitBreaker(2, reset_timeout=0.0))
+    client._client.close()
+    client._client = httpx.Client(base_url="http://provider", transport=httpx.MockTransport(handle))
+    return client
+
+
+def test_client_error_leaves_half_open_breaker_half_open():
+    client = client_answering(500, 500, 400, 200)
+    for _ in range(2):
+        with pytest.raises(EmbeddingUnavailable):
+            client.embed(["can"])
+    assert client.breaker.state == HALF_OPEN
+
+    with pytest.raises(httpx.HTTPStatusError):
+        client.embed(["can"])
+    assert client.breaker.state == HALF_OPEN
+    # The next trial call still decides
+    client.embed(["can"])
+    assert client.breaker.state == CLOSED
+    client.close()
+
+
+def test_client_error_does_not_reset_failure_count():
+    client = client_answering(500, 401, 500)
+    with pytest.raises(EmbeddingUnavailable):
+        client.embed(["can"])
+    with pytest.raises(httpx.HTTPStatusError):
+        client.embed(["can"])
+    with pytest.raises(EmbeddingUnavailable):
+        client.embed(["can"])
+    assert client.breaker.opened == 1
+    client.close()
@@ -0,0 +1,114 @@
+import math
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import ingest_queue
+
+DAY = ingest_queue.DAY
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The queue's time.time(), moved forward by ``clock.now += seconds``."""
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(ingest_queue, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "queue.sqlite"
+
+
+def pdf_jobs(count):
+    # Local files: no per-host politeness between claims
+    return [("pdf", "albany", "NY", f"rag_pdf_data/albany/{i}.pdf") for i in range(count)]
+
+
+def test_concurrent_workers_never_claim_the_same_job(db):
+    ingest_queue.seed(ingest_queue.connect(db), pdf_jobs(40))
+    claimed = []
+
+    def worker(owner):
+        conn = ingest_queue.connect(db)
+        while (job := ingest_queue.claim(conn, owner, lease=300)) is not None:
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == list(range(1, 41))
+
+
+def test_expired_lease_is_taken_over(db, clock):
+    first, second = ingest_queue.connect(db), ingest_queue.connect(db)
+    ingest_queue.seed(first, pdf_jobs(1))
+    job = ingest_queue.claim(first, "a", lease=300)
+    assert ingest_queue.claim(second, "b", lease=300) is None
+
+    clock.now += 301
+    taken = ingest_queue.claim(second, "b", lease=300)
+
+    assert taken["id"] == job["id"]
+    assert taken["attempts"] == 2
+    # The first worker has lost the job and cannot finish it
+    assert not ingest_queue.renew(first, job["id"], "a", 300)
+    ingest_queue.fail(first, job, "a", "late", max_attempts=4)
+    row = second.execute("SELECT status, lease_owner FROM jobs").fetchone()
+    assert (row["status"], row["lease_owner"]) == ("leased", "b")
+
+
+def test_job_fails_after_max_attempts(db, clock):
+    conn = ingest_queue.connect(db)
+    ingest_queue.seed(conn, pdf_jobs(1))
+
+    job = ingest_queue.claim(conn, "a", lease=300)
+    assert ingest_queue.fail(conn, job, "a", "boom", max_attempts=2) == "pending"
+    # Backing off
+    assert ingest_queue.claim(conn, "a", lease=300) is None
+
+    clock.now += 31
+    job = ingest_queue.claim(conn, "a", lease=300)
+    assert ingest_queue.fail(conn, job, "a", "boom", max_attempts=2) == "failed"
+
+    clock.now += ingest_queue.MAX_BACKOFF
+    assert ingest_queue.claim(conn, "a", lease=300) is None
+    row = conn.execute("SELECT status, attempts, error FROM jobs").fetchone()
+    assert tuple(row) == ("failed", 2, "boom")
+
+
+def test_old_sqlite_is_refused(db, monkeypatch):
+    monkeypatch.setattr(ingest_queue.sqlite3, "sqlite_version_info", (3, 31, 1))
+    with pytest.raises(RuntimeError, match="3.35.0"):
+        ingest_queue.connect(db)
+
+
+def test_unchanged_source_is_fetched_less_and_less_often():
+    # The prior alone: a change a week, due when it is likely (p = 0.5)
+    assert ingest_queue.recrawl_interval(0, 0) == pytest.approx(7 * DAY * math.log(2))
+    intervals = [ingest_queue.recrawl_interval(0, days * DAY) for days in (0, 14, 30, 60)]
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == pytest.approx(67 * DAY * math.log(2))
+
+
+def test_source_that_changes_on_every_fetch_is_fetched_more_often():
+    # Fetched every 3 days for a month, changed each time
+    interval = ingest_queue.recrawl_interval(10, 30 * DAY)
+    assert interval == pytest.approx(37 / 11 * DAY * math.log(2))
+    assert interval < 3 * DAY
+
+
+def test_interval_is_clamped():
+    # A change a day or more would call for fetching more than daily
+    assert ingest_queue.recrawl_interval(100, 100 * DAY) == ingest_queue.MIN_INTERVAL
+    # A year without a change would wait far longer than 90 days
+    assert ingest_queue.recrawl_interval(0, 365 * DAY) == ingest_queue.MAX_INTERVAL
+
+
+def test_higher_stale_probability_waits_longer():
+    assert ingest_queue.recrawl_interval(2, 30 * DAY, 0.8) > ingest_queue.recrawl_interval(2, 30 * DAY, 0.5)
@@ -0,0 +1,41 @@
+import pytest
+
+from material_synonyms import get_material_expander
+
+
+@pytest.fixture(scope="module")
+def expander():
+    return get_material_expander()
+
+
+def test_phrase_inside_longer_match_is_not_a_category(expander):
+    assert [c.name for c in expander.match_categories("plastic bags")] == ["plastic_bags_film"]
+    assert [c.name for c in expander.match_categories("Car Battery")] == ["lead_acid_batteries"]
+    # Topic page lookup still falls back to the general category
+    assert [c.name for c in expander.match_categories("Car Battery", covered=True)] == [
+        "lead_acid_batteries",
+        "batteries",
+    ]
+
+
+def test_expand_skips_term_equal_to_query(expander):
+    assert expander.expand("plastic bags") == ["plastic bags", "Plastic film"]
+
+
+def test_expand_keeps_category_term_order(expander):
+    assert expander.expand("Car Battery") == [
+        "Car Battery",
+        "Car Batteries",
+        "Lead acid batteries",
+        "Batteries",
+    ]
+
+
+def test_separate_materials_each_contribute(expander):
+    names = [c.name for c in expander.match_categories("metal glass plastic cartons")]
+    assert set(names) == {"plastic", "cartons", "glass", "scrap_metal"}
+    assert expander.expand("metal glass plastic cartons")[1:] == [
+        "Plastic Containers",
+        "Cartons",
+        "Glass bottles and jars",
+    ]
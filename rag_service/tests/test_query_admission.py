@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import app
+import rag_query
+from admission import AdmissionControl
+from node_store import Chunk
+from singleflight import SingleFlight
+
+
+class SlowRetriever:
+    """Takes ``delay`` seconds per term (or until ``release`` is set); chunks have no source."""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.release = threading.Event()
+        self.release.set()
+        self.calls = []
+
+    def retrieve(self, query, county=None, deadline=None):
+        self.calls.append(query)
+        self.release.wait(5)
+        time.sleep(self.delay)
+        return [Chunk(f"text for {query}", None)]
+
+    def retrieve_topic(self, material, query, county, deadline=None):
+        return []
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    retriever = SlowRetriever()
+    monkeypatch.setattr(rag_query, "get_rag_retriever", lambda snapshot=None: retriever)
+    monkeypatch.setattr(app, "_query_flight", SingleFlight())
+    monkeypatch.setattr(app, "_admission", AdmissionControl(max_inflight=1, max_queued=0))
+    return retriever
+
+
+def post(client, material, timeout_ms=None):
+    headers = {"X-Request-Timeout-Ms": str(timeout_ms)} if timeout_ms is not None else {}
+    return client.post("/query", json={"material": material, "location": "Albany, NY"}, headers=headers)
+
+
+def run(scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://rag") as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_complete_answer(retriever):
+    response = run(lambda client: post(client, "Plastic", 10_000))
+
+    assert response.status_code == 200
+    assert response.json()["partial"] is False
+    assert "text for" in response.json()["regulations"]
+
+
+def test_saturated_worker_sheds_with_retry_after(retriever):
+    retriever.release.clear()
+
+    async def scenario(client):
+        first = asyncio.ensure_future(post(client, "Plastic", 10_000))
+        while not retriever.calls:
+            await asyncio.sleep(0.01)
+        second = await post(client, "Glass", 10_000)
+        retriever.release.set()
+        return await first, second
+
+    first, second = run(scenario)
+    assert first.status_code == 200
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == "1"
+
+
+def test_queued_request_that_cannot_finish_in_time_is_shed(retriever, monkeypatch):
+    admission = AdmissionControl(max_inflight=1, max_queued=4)
+    admission.service_time = 1.0
+    monkeypatch.setattr(app, "_admission", admission)
+    retriever.release.clear()
+
+    async def scenario(client):
+        first = asyncio.ensure_future(post(client, "Plastic", 10_000))
+        while not retriever.calls:
+            await asyncio.sleep(0.01)
+        second = await post(client, "Glass", 500)
+        retriever.release.set()
+        return await first, second
+
+    first, second = run(scenario)
+    assert first.status_code == 200
+    assert second.status_code == 503
+    assert "before the deadline" in second.json()["detail"]
+
+
+def test_short_deadline_returns_partial_result(retriever):
+    # Load the county data first so that it does not eat into the deadline
+    run(lambda client: post(client, "Plastic", 10_000))
+    retriever.calls.clear()
+    retriever.delay = 0.3
+
+    response = run(lambda client: post(client, "Plastic", 500))
+
+    assert response.status_code == 200
+    assert response.json()["partial"] is True
+    # The first term made it in; the deadline stopped the rest
+    assert response.json()["regulations"]
+    assert 1 <= len(retriever.calls) < len(rag_query.normalize_and_expand_material("Plastic"))
+
+
+def test_expired_deadline_retrieves_nothing(retriever):
+    response = run(lambda client: post(client, "Plastic", 0))
+
+    assert response.status_code == 200
+    assert response.json() == {"regulations": "", "sources": [], "partial": True}
+    assert retriever.calls == []
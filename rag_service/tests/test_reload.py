@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import app
+from index_manager import IndexManager
+from snapshots import resolve_current
+
+
+@pytest.fixture
+def manager(tmp_path, make_snapshot, monkeypatch):
+    make_snapshot("v1")
+    manager = IndexManager(tmp_path)
+    manager.reload()
+    monkeypatch.setattr(app, "get_index_manager", lambda: manager)
+    return manager
+
+
+def test_reload_switches_manifest(manager, make_snapshot, tmp_path):
+    make_snapshot("v2")
+    # Publishing made v2 current; go back to v1 and forward again
+    asyncio.run(app.reload_index(app.ReloadRequest(version="v1")))
+    assert resolve_current(tmp_path)[0] == "v1"
+    result = asyncio.run(app.reload_index(app.ReloadRequest(version="v2")))
+    assert result == {"status": "ok", "previous_version": "v1", "version": "v2"}
+    assert resolve_current(tmp_path)[0] == "v2"
+
+
+@pytest.mark.parametrize("damaged", ["vectors.f32.npy", "meta.json"])
+def test_failed_reload_keeps_manifest(manager, make_snapshot, tmp_path, damaged):
+    broken = make_snapshot("v2")
+    (broken / damaged).write_bytes(b"not what it should be")
+    asyncio.run(app.reload_index(app.ReloadRequest(version="v1")))
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(app.reload_index(app.ReloadRequest(version="v2")))
+    assert raised.value.status_code == 422
+    assert resolve_current(tmp_path)[0] == "v1"
+    assert manager.version == "v1"
+
+
+def test_unknown_version_is_not_found(manager, tmp_path):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(app.reload_index(app.ReloadRequest(version="missing")))
+    assert raised.value.status_code == 404
+    assert resolve_current(tmp_path)[0] == "v1"
@@ -0,0 +1,62 @@
+import numpy as np
+
+from index_manager import IndexManager
+from semantic_cache import SemanticCache
+
+HITS = [("albany", 3, 0.9), ("albany", 7, 0.8)]
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_near_identical_query_hits():
+    cache = SemanticCache(capacity=4, threshold=0.97)
+    cache.put("v1", "albany", vector(1, 0, 0), HITS)
+
+    assert cache.lookup("v1", "albany", vector(1, 0.1, 0)) == HITS
+    # cos = 0.89: too different
+    assert cache.lookup("v1", "albany", vector(1, 0.5, 0)) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_other_county_misses():
+    cache = SemanticCache(capacity=4, threshold=0.97)
+    cache.put("v1", "albany", vector(1, 0, 0), HITS)
+    cache.put("v1", "tompkins", vector(0, 1, 0), HITS)
+
+    assert cache.lookup("v1", "erie", vector(1, 0, 0)) is None
+    assert cache.lookup("v1", "tompkins", vector(1, 0, 0)) is None
+
+
+def test_version_swap_empties_cache(tmp_path, make_snapshot):
+    make_snapshot("v1")
+    manager = IndexManager(tmp_path)
+    manager.reload()
+    cache = SemanticCache(capacity=4)
+    manager.add_swap_listener(lambda old, new: cache.clear(new))
+    cache.put("v1", "albany", vector(1, 0, 0), HITS)
+
+    make_snapshot("v2")
+    manager.reload()
+
+    assert cache.version == "v2"
+    assert cache.lookup("v2", "albany", vector(1, 0, 0)) is None
+    # A retrieval that finishes on the old snapshot is not stored
+    cache.put("v1", "albany", vector(1, 0, 0), HITS)
+    assert cache.stats()["entries"] == 0
+
+
+def test_full_cache_replaces_least_recently_used():
+    cache = SemanticCache(capacity=2, threshold=0.97)
+    cache.put("v1", "albany", vector(1, 0, 0), [("albany", 1, 1.0)])
+    cache.put("v1", "albany", vector(0, 1, 0), [("albany", 2, 1.0)])
+    # Using the first entry makes the second the least recently used
+    assert cache.lookup("v1", "albany", vector(1, 0, 0)) is not None
+
+    cache.put("v1", "albany", vector(0, 0, 1), [("albany", 3, 1.0)])
+
+    assert cache.lookup("v1", "albany", vector(0, 1, 0)) is None
+    assert cache.lookup("v1", "albany", vector(1, 0, 0)) == [("albany", 1, 1.0)]
+    assert cache.lookup("v1", "albany", vector(0, 0, 1)) == [("albany", 3, 1.0)]
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app
+import sessions
+from deadline import Deadline
+from sessions import Retrieval, SessionStore
+from singleflight import SingleFlight
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(sessions, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def start(store, session_id, key="key"):
+    return store.start(session_id, key, Retrieval(f"text {session_id}", [f"https://example.org/{session_id}"]), frozenset())
+
+
+def test_session_expires_after_ttl_since_last_use(clock):
+    store = SessionStore(ttl=60)
+    start(store, "c1")
+
+    clock.now += 50
+    assert store.get("c1", "key") is not None
+    # The lookup renewed it
+    clock.now += 50
+    assert store.get("c1", "key") is not None
+
+    clock.now += 61
+    assert store.get("c1", "key") is None
+    assert store.stats()["expired"] == 1
+
+
+def test_other_retrieval_key_is_a_miss(clock):
+    store = SessionStore()
+    start(store, "c1", key="plastic")
+    assert store.get("c1", "glass") is None
+
+
+def test_full_store_drops_least_recently_used(clock):
+    store = SessionStore(capacity=2)
+    start(store, "c1")
+    start(store, "c2")
+    store.get("c1", "key")
+
+    start(store, "c3")
+
+    assert store.get("c2", "key") is None
+    assert store.get("c1", "key") is not None
+    assert store.get("c3", "key") is not None
+    assert store.stats()["evicted"] == 1
+
+
+@pytest.fixture
+def retrievals(monkeypatch):
+    """Stub query_rag: one source per material."""
+    calls = []
+
+    def query_rag(material, location, condition, context, deadline, coordinates):
+        calls.append(material)
+        return f"regulations for {material}", [f"https://example.org/{material}"]
+
+    monkeypatch.setattr(app, "query_rag", query_rag)
+    monkeypatch.setattr(app, "_query_flight", SingleFlight())
+    monkeypatch.setattr(app, "_sessions", SessionStore())
+    return calls
+
+
+def turn(message=None):
+    request = app.RAGQueryRequest(
+        material="Plastic", location="Albany, NY", session_id="c1", message=message
+    )
+    return asyncio.run(app._answer(request, "", Deadline(10)))
+
+
+def test_follow_up_turn_reuses_first_turn_sources(retrievals):
+    first = turn()
+    assert retrievals == ["Plastic"]
+
+    assert turn("Which bin does it go in?") == first
+    assert retrievals == ["Plastic"]
+
+
+def test_new_material_in_message_is_retrieved_once(retrievals):
+    _, first_sources, _ = turn()
+
+    _, sources, partial = turn("And the car battery?")
+    assert retrievals == ["Plastic", "Car Batteries"]
+    assert sources == first_sources + ["https://example.org/Car Batteries"]
+    assert partial is False
+
+    assert turn("Where do I take the car battery?")[1] == sources
+    assert retrievals == ["Plastic", "Car Batteries"]
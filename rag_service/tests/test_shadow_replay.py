@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+import rag_query
+import shadow_replay
+from bulk_query import read_pairs
+from semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def snapshots(tmp_path, make_snapshot, fake_embeddings, monkeypatch):
+    make_snapshot("v1", embed_model="text-embedding-3-small")
+    make_snapshot("v2", embed_model="text-embedding-3-large")
+    monkeypatch.setattr(rag_query, "_semantic_cache", SemanticCache(capacity=0))
+    monkeypatch.setattr(rag_query, "lexical_fallbacks", 0)
+    return {side: shadow_replay.open_snapshot(tmp_path, v) for side, v in zip(shadow_replay.SIDES, ("v1", "v2"))}
+
+
+def test_replay_embeds_each_side_with_its_model(snapshots, fake_embeddings, tmp_path):
+    log = tmp_path / "capture.jsonl"
+    log.write_text(
+        "".join(json.dumps({"material": m, "location": "Albany, NY"}) + "\n" for m in ("glass jar", "pizza box")),
+        encoding="utf-8",
+    )
+    results = shadow_replay.replay(snapshots, read_pairs(log), concurrency=2, block=8)
+
+    assert len(results) == 2
+    # Prefetched once per model; replayed retrievals hit each model's own cache
+    assert sorted(set(fake_embeddings)) == ["text-embedding-3-large", "text-embedding-3-small"]
+    assert len(fake_embeddings) == 2
+    assert rag_query.lexical_fallbacks == 0
+    for r in results:
+        assert r["baseline"]["sources"] and all("/v1/" in s for s in r["baseline"]["sources"])
+        assert r["candidate"]["sources"] and all("/v2/" in s for s in r["candidate"]["sources"])
+        assert r["jaccard"] == 0.0
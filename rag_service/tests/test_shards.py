@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from dense_index import write_dense_index
+from node_store import write_node_store
+from shards import ShardSet
+from snapshots import SHARDS_DIR, STATEWIDE_SHARD, publish_snapshot, set_current, snapshot_dir, write_shards_manifest
+
+
+def write_sharded(path, counts: dict[str, int]) -> None:
+    rng = np.random.default_rng(0)
+    for name, count in counts.items():
+        write_dense_index(path / SHARDS_DIR / name, [f"{name}{i}" for i in range(count)], rng.random((count, 4)))
+        write_node_store(path / SHARDS_DIR / name, [f"{name} {i}" for i in range(count)], [{}] * count)
+    write_shards_manifest(path, {name: {"count": count} for name, count in counts.items()}, None)
+
+
+def test_unknown_county_searches_statewide_only(tmp_path):
+    write_sharded(tmp_path, {"albany": 3, "erie": 2, STATEWIDE_SHARD: 1})
+    shards = ShardSet(tmp_path)
+    assert shards.for_county("Albany") == ["albany", STATEWIDE_SHARD]
+    assert shards.for_county(None) == [STATEWIDE_SHARD]
+    assert shards.for_county("Nowhere") == [STATEWIDE_SHARD]
+
+
+def test_unknown_county_without_statewide_shard(tmp_path):
+    write_sharded(tmp_path, {"albany": 3, "erie": 5})
+    assert ShardSet(tmp_path).for_county(None) == ["erie"]
+
+
+def publish(root, version, keep=1, grace=600.0):
+    snapshot_dir(root, version).mkdir(parents=True)
+    return publish_snapshot(root, version, {}, keep=keep, grace=grace)
+
+
+def test_prune_keeps_recently_current_snapshots(tmp_path):
+    publish(tmp_path, "v1")
+    manifest = publish(tmp_path, "v2")
+    # v1 was current a moment ago: a worker may still map its shards
+    assert [e["version"] for e in manifest["snapshots"]] == ["v1", "v2"]
+    assert snapshot_dir(tmp_path, "v1").exists()
+
+    manifest = publish(tmp_path, "v3", grace=0)
+    assert [e["version"] for e in manifest["snapshots"]] == ["v3"]
+    assert not snapshot_dir(tmp_path, "v1").exists() and not snapshot_dir(tmp_path, "v2").exists()
+
+
+def test_rollback_retires_the_current_snapshot(tmp_path):
+    publish(tmp_path, "v1", keep=3)
+    publish(tmp_path, "v2", keep=3)
+    set_current(tmp_path, "v1")
+    manifest = publish(tmp_path, "v3")
+    # v2 was rolled away from just now, v1 was current until this publish
+    assert [e["version"] for e in manifest["snapshots"]] == ["v1", "v2", "v3"]
+
+
+@pytest.mark.parametrize("retired_ago, kept", [(60, True), (3600, False)])
+def test_prune_after_grace(tmp_path, retired_ago, kept, monkeypatch):
+    import snapshots
+
+    publish(tmp_path, "v1")
+    publish(tmp_path, "v2")
+    now = snapshots.time.time()
+    monkeypatch.setattr(snapshots.time, "time", lambda: now + retired_ago)
+    manifest = publish(tmp_path, "v3")
+    assert ("v1" in [e["version"] for e in manifest["snapshots"]]) == kept
+    assert snapshot_dir(tmp_path, "v1").exists() == kept
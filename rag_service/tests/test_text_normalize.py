@@ -0,0 +1,42 @@
+import random
+import re
+
+import pytest
+
+from text_normalize import normalize_display_text
+
+
+def strip_links(text: str) -> str:
+    """The request-time cleanup app.py used before display text was precomputed."""
+    if not text:
+        return ""
+    text = re.sub(r"\(\s*\[[^\]]+\]\((https?:\/\/[^\s)]+)\)\s*\)", "", text)
+    text = re.sub(r"\[[^\]]+\]\((https?:\/\/[^\s)]+)\)", "", text)
+    text = re.sub(r"https?:\/\/\S+", "", text)
+    text = re.sub(r"\s+([.,;:])", r"\1", text)
+    text = re.sub(r"\s{2,}", " ", text)
+    return text.strip()
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Rinse jars ([guide](https://ny.gov/a)) before recycling .", "Rinse jars before recycling."),
+        ("See [the list](https://ny.gov/b)  and  https://ny.gov/c ,thanks", "See and,thanks"),
+        # Removing the inner link makes a new outer one: the passes run in order
+        ("[a,([l](https://u));b", "[a,;b"),
+        ("[x]([y](https://u)(https://v))", "[x](("),
+        ("  \n\t ", ""),
+    ],
+)
+def test_normalize_display_text(text, expected):
+    assert normalize_display_text(text) == expected
+    assert strip_links(text) == expected
+
+
+def test_matches_strip_links_on_random_link_syntax():
+    rng = random.Random(0)
+    alphabet = ["[", "]", "(", ")", "https://u", "http://x.y/z", " ", "  ", "\n", "\t", ".", ",", ";", ":", "a", "l"]
+    for _ in range(20000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 16)))
+        assert normalize_display_text(text) == strip_links(text), repr(text)
@@ -0,0 +1,53 @@
+"""Display-text normalization shared by the index build and the RAG service.
+
+The index build (``store_rag_index.py``) runs ``normalize_display_text`` once
+per chunk and stores the result on the node, so the serving path only has to
+concatenate precomputed strings. The same function is used at request time as
+a fallback for indexes built before the normalization stage existed.
+"""
+import re
+
+# Metadata key holding the precomputed, link-free text of a chunk.
+DISPLAY_TEXT_KEY = "display_text"
+
+# Separator used between chunks in the returned regulations text. Chunks are
+# already whitespace-collapsed, so a single space matches the output of the
+# old request-time cleanup over the "\n\n"-joined text.
+CHUNK_SEPARATOR = " "
+
+# Links are removed in the order the old request-time ``strip_links`` removed
+# them: citations like ([label](https://...)), then links like
+# [label](https://...), then bare URLs. Each removal can join text into a new
+# match of the next pattern (e.g. "[a,([l](https://u));b"), so they stay
+# separate passes.
+_CITATION_RE = re.compile(r"\(\s*\[[^\]]+\]\(https?://[^\s)]+\)\s*\)")
+_MARKDOWN_LINK_RE = re.compile(r"\[[^\]]+\]\(https?://[^\s)]+\)")
+_URL_RE = re.compile(r"https?://\S+")
+# Whitespace cleanup in one pass: runs of two or more characters collapse to
+# a space, and whitespace before punctuation is removed. Single spaces never
+# reach the callback; the lookahead lets the engine skip to whitespace.
+_WHITESPACE = re.compile(r"(?=\s)(?:(?P<run>\s{2,})(?![\s.,;:])|\s+(?=[.,;:]))")
+
+
+def _replace(m: re.Match) -> str:
+    return " " if m.lastgroup == "run" else ""
+
+
+def normalize_display_text(text: str) -> str:
+    """
+    Remove links and collapse whitespace.
+
+    Gives the same result as the old five-substitution ``strip_links``:
+    citations, links and bare URLs are dropped, runs of two or more
+    whitespace characters become a single space, whitespace before ``.,;:``
+    is removed and the result is stripped. Passes whose pattern cannot occur
+    in the text are skipped.
+    """
+    if not text:
+        return ""
+    if "](" in text:
+        text = _CITATION_RE.sub("", text)
+        text = _MARKDOWN_LINK_RE.sub("", text)
+    if "://" in text:
+        text = _URL_RE.sub("", text)
+    return _WHITESPACE.sub(_replace, text).strip()
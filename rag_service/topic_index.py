@@ -0,0 +1,94 @@
+"""Topic pages of a shard: (county, topic) -> chunk rows, and topic -> materials.
+
+``store_rag_index.py`` records the last path segment of every source URL as
+the chunk's ``topic`` ("electronics", "Household-Hazardous-Waste",
+"metal-glass-plastic-cartons", ...). Many county sites have one page per
+material, and when a material maps cleanly to such a page, its few chunks
+are the answer: there is no need to scan the whole index for them.
+
+The index is derived from the chunk store's interned county/topic columns
+when a shard is first asked for it, so exports need no extra files. Topic
+slugs are split into words and matched against the material taxonomy
+(``MaterialExpander.primary_categories``). Topics that match no category,
+like "recycling" or "faq", or more than ``RAG_TOPIC_MAX_CATEGORIES``
+categories, like an A-to-Z guide, are not topic pages.
+"""
+import os
+import re
+from typing import Optional
+from urllib.parse import unquote
+
+import numpy as np
+
+from material_synonyms import MaterialExpander
+from node_store import NodeStore
+from snapshots import shard_key
+
+# Topics covering more categories than this are general guides, not topic pages
+MAX_CATEGORIES = int(os.getenv("RAG_TOPIC_MAX_CATEGORIES", "4"))
+
+_CAMEL = re.compile(r"(?<=[a-z])(?=[A-Z])")
+# "tirerecycling", "glassrecycling": a material glued to a generic suffix
+_GLUED_SUFFIX = re.compile(r"(?<=[a-z])(recycling|disposal)\b")
+
+
+def topic_words(topic: str) -> str:
+    """Lowercase words of a topic slug ("E-Waste" -> "e waste", "tirerecycling" -> "tire recycling")."""
+    text = _CAMEL.sub(" ", unquote(topic))
+    text = _GLUED_SUFFIX.sub(r" \1", text.lower())
+    return re.sub(r"[-_+]+", " ", text)
+
+
+class TopicIndex:
+    """Chunk rows of every (county, topic) page of one shard."""
+
+    def __init__(self, pages: dict[tuple[Optional[str], str], np.ndarray], categories: dict[str, tuple[str, ...]]):
+        self.pages = pages
+        # Taxonomy categories each topic page covers
+        self.categories = categories
+        # (county, category) -> topics covering it, in topic order
+        self._by_category: dict[tuple[Optional[str], str], list[str]] = {}
+        for county, topic in pages:
+            for category in categories.get(topic, ()):
+                self._by_category.setdefault((county, category), []).append(topic)
+
+    @classmethod
+    def build(cls, store: NodeStore, expander: MaterialExpander) -> "TopicIndex":
+        counties = store.field_table("counties")
+        topics = store.field_table("topics")
+        county_codes = np.asarray(store.field_codes("counties"), dtype=np.int64)
+        topic_codes = np.asarray(store.field_codes("topics"), dtype=np.int64)
+
+        categories: dict[str, tuple[str, ...]] = {}
+        for topic in topics:
+            matched = [c.name for c in expander.primary_categories(topic_words(topic))]
+            if 0 < len(matched) <= MAX_CATEGORIES:
+                categories[topic] = tuple(matched)
+
+        pages: dict[tuple[Optional[str], str], np.ndarray] = {}
+        keep = topic_codes >= 0
+        if keep.any():
+            # Group rows by (county, topic) code pair; rows stay in ascending order
+            keys = (county_codes[keep] + 1) * len(topics) + topic_codes[keep]
+            rows = np.flatnonzero(keep)
+            order = np.argsort(keys, kind="stable")
+            keys, rows = keys[order], rows[order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            for start, end in zip(starts, np.r_[starts[1:], len(keys)]):
+                county_code, topic_code = divmod(int(keys[start]), len(topics))
+                topic = topics[topic_code]
+                if topic in categories:
+                    # Keyed like the county detector's results ("St. Lawrence" -> "stlawrence")
+                    county = shard_key(counties[county_code - 1]) if county_code else None
+                    pages[(county, topic)] = rows[start:end]
+        return cls(pages, categories)
+
+    def lookup(self, county: Optional[str], category: str) -> list[tuple[str, np.ndarray]]:
+        """``(topic, rows)`` of the pages of ``county`` covering ``category``."""
+        return [
+            (topic, self.pages[(county, topic)])
+            for topic in self._by_category.get((county, category), ())
+        ]
+
+    def __len__(self) -> int:
+        return len(self.pages)
@@ -0,0 +1,287 @@
+"""Request tracing with W3C trace context.
+
+``TracingMiddleware`` continues the trace of the caller's ``traceparent``
+header on ``/query`` (or starts one) and the retrieval records a span per
+stage, so a slow request of the Node backend can be broken down into
+county/term planning, query embedding, index scan and chunk assembly:
+
+    with span("rag.embed", model=client.model):
+        ...
+
+Spans nest through a context variable, which Starlette copies into the
+threads retrieval runs in. Outgoing embedding requests carry the current
+span as their ``traceparent``.
+
+A trace's spans are handed to the exporter together when its server span
+ends. ``RAG_TRACE_EXPORTER`` chooses it:
+
+- ``console``: an indented tree of span durations on stdout;
+- ``file``: one JSON object per span, appended to ``RAG_TRACE_FILE``;
+- ``package.module:factory``: any object with ``export(spans)``, built by
+  calling ``factory()`` (e.g. an adapter to an OpenTelemetry exporter);
+- unset: nothing is recorded (spans cost one context variable lookup).
+
+Requests without a sampled parent are recorded with probability
+``RAG_TRACE_SAMPLE_RATE`` (default 1).
+"""
+import importlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+TRACE_EXPORTER = os.getenv("RAG_TRACE_EXPORTER", "")
+TRACE_FILE = Path(os.getenv("RAG_TRACE_FILE", "rag_traces.jsonl"))
+SAMPLE_RATE = float(os.getenv("RAG_TRACE_SAMPLE_RATE", "1"))
+
+TRACEPARENT_HEADER = "traceparent"
+TRACESTATE_HEADER = "tracestate"
+# Trace Context Level 2: the server's own span, returned to the caller
+TRACERESPONSE_HEADER = "traceresponse"
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_SAMPLED = 0x01
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """The caller's span from a ``traceparent`` header; None if absent or invalid."""
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & _SAMPLED))
+
+
+def _new_id(digits: int) -> str:
+    return f"{random.getrandbits(digits * 4):0{digits}x}"
+
+
+class Span:
+    __slots__ = ("name", "context", "parent_id", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_unix_nano": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Exporter(Protocol):
+    def export(self, spans: list[Span]) -> None: ...
+
+
+class ConsoleExporter:
+    """Prints each trace as a tree of span durations."""
+
+    def export(self, spans: list[Span]) -> None:
+        children: dict[Optional[str], list[Span]] = {}
+        ids = {s.context.span_id for s in spans}
+        for s in sorted(spans, key=lambda s: s.start_ns):
+            # Spans whose parent is outside this process start the tree
+            children.setdefault(s.parent_id if s.parent_id in ids else None, []).append(s)
+        lines = [f"trace {spans[0].context.trace_id}"]
+
+        def walk(parent_id: Optional[str], depth: int) -> None:
+            for s in children.get(parent_id, ()):
+                attributes = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+                error = f" ERROR {s.error}" if s.error else ""
+                lines.append(f"{'  ' * depth}{s.name} {s.duration_ms:.2f} ms {attributes}{error}".rstrip())
+                walk(s.context.span_id, depth + 1)
+
+        walk(None, 1)
+        print("\n".join(lines))
+
+
+class FileExporter:
+    """Appends one JSON line per span."""
+
+    def __init__(self, path: Path = TRACE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        data = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+def load_exporter(spec: str) -> Optional[Exporter]:
+    if not spec or spec == "none":
+        return None
+    if spec == "console":
+        return ConsoleExporter()
+    if spec == "file":
+        return FileExporter()
+    module, _, factory = spec.partition(":")
+    if not factory:
+        raise ValueError(f"RAG_TRACE_EXPORTER must be console, file or module:factory, not {spec!r}")
+    return getattr(importlib.import_module(module), factory)()
+
+
+_exporter: Optional[Exporter] = None
+_exporter_loaded = False
+
+
+def get_exporter() -> Optional[Exporter]:
+    """The configured exporter (built on first use), or None when tracing is off."""
+    global _exporter, _exporter_loaded
+    if not _exporter_loaded:
+        _exporter = load_exporter(TRACE_EXPORTER)
+        _exporter_loaded = True
+    return _exporter
+
+
+def set_exporter(exporter: Optional[Exporter]) -> None:
+    global _exporter, _exporter_loaded
+    _exporter, _exporter_loaded = exporter, True
+
+
+class _Trace:
+    """The spans of one request in this process."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, s: Span) -> None:
+        with self._lock:
+            self.spans.append(s)
+
+
+_current: ContextVar[Optional[tuple[_Trace, Span]]] = ContextVar("rag_trace_span", default=None)
+
+
+def current_traceparent() -> Optional[str]:
+    """``traceparent`` for an outgoing request made inside the current span."""
+    current = _current.get()
+    return current[1].context.traceparent() if current else None
+
+
+@contextmanager
+def _record(trace: _Trace, s: Span) -> Iterator[Span]:
+    token = _current.set((trace, s))
+    try:
+        yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+        trace.add(s)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """A child span of the current one; a no-op outside a recorded trace."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    context = SpanContext(parent.context.trace_id, _new_id(16), parent.context.sampled)
+    with _record(trace, Span(name, context, parent.context.span_id, attributes)) as s:
+        yield s
+
+
+@contextmanager
+def server_span(
+    name: str, traceparent: Optional[str] = None, tracestate: Optional[str] = None, **attributes
+) -> Iterator[Optional[Span]]:
+    """
+    The span of one incoming request, continuing the caller's trace.
+
+    Yields None (and records nothing) when tracing is off or the request is
+    not sampled. Its spans are exported when it ends.
+    """
+    exporter = get_exporter()
+    parent = parse_traceparent(traceparent)
+    sampled = parent.sampled if parent else random.random() < SAMPLE_RATE
+    if exporter is None or not sampled:
+        yield None
+        return
+    if tracestate:
+        attributes["tracestate"] = tracestate
+    trace = _Trace()
+    context = SpanContext(parent.trace_id if parent else _new_id(32), _new_id(16))
+    try:
+        with _record(trace, Span(name, context, parent.span_id if parent else None, attributes)) as s:
+            yield s
+    finally:
+        try:
+            exporter.export(trace.spans)
+        except Exception as e:
+            print(f"Trace export failed: {e}")
+
+
+class TracingMiddleware:
+    """Runs requests to ``paths`` in a server span and returns ``traceresponse``."""
+
+    def __init__(self, app: ASGIApp, paths: tuple[str, ...] = ("/query",)):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        name = f"{scope['method']} {scope['path']}"
+        with server_span(name, headers.get(TRACEPARENT_HEADER), headers.get(TRACESTATE_HEADER)) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_traced(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.set(status=message["status"])
+                    MutableHeaders(scope=message).append(TRACERESPONSE_HEADER, root.context.traceparent())
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
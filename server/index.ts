@@ -6,6 +6,7 @@ import { dirname, join } from 'path';
 import { existsSync } from 'fs';
 import analyzeRouter from './routes/analyze.js';
 import chatRouter from './routes/chat.js';
+import { traceRequests } from './services/tracing.js';
 
 // Load environment variables
 dotenv.config();
@@ -28,6 +29,9 @@ if (!process.env.OPENAI_API_KEY) {
   process.exit(1);
 }
 
+// Trace id and stage timings for every API request (see services/tracing.ts)
+app.use('/api', traceRequests);
+
 // API Routes (must come before static file serving)
 app.use('/api/analyze', analyzeRouter);
 app.use('/api/chat', chatRouter);
@@ -1,6 +1,8 @@
 import { Router, type Request, type Response } from 'express';
 import { analyzeImage } from '../services/visionService.js';
 import { analyzeRecyclability } from '../services/gpt5Service.js';
+import { parseCoordinates } from '../services/ragService.js';
+import { traceStage } from '../services/tracing.js';
 import type { AnalyzeRequest, VisionResponse } from '../types.js';
 
 const router = Router();
@@ -16,7 +18,7 @@ router.post('/vision', async (req: Request, res: Response) => {
     }
 
     // Analyze image with Vision API
-    const visionResult = await analyzeImage(image);
+    const visionResult = await traceStage('vision', () => analyzeImage(image));
 
     // Return vision result with stage indicator
     res.json({ stage: 'vision', result: visionResult });
@@ -32,7 +34,7 @@ router.post('/vision', async (req: Request, res: Response) => {
 // New endpoint: Recyclability analysis only
 router.post('/recyclability', async (req: Request, res: Response) => {
   try {
-    const { visionResult, location, context }: { visionResult?: VisionResponse | null; location: string; context: string } = req.body;
+    const { visionResult, location, context, coordinates }: { visionResult?: VisionResponse | null; location: string; context: string; coordinates?: unknown } = req.body;
 
     // Validate request
     if (!location || typeof location !== 'string' || location.trim().length === 0) {
@@ -48,10 +50,8 @@ router.post('/recyclability', async (req: Request, res: Response) => {
     const contextValue = context || '';
 
     // Analyze recyclability with GPT-5 + web search
-    const analysisResult = await analyzeRecyclability(
-      visionResult || null,
-      contextValue,
-      location
+    const analysisResult = await traceStage('recyclability', () =>
+      analyzeRecyclability(visionResult || null, contextValue, location, parseCoordinates(coordinates))
     );
 
     // Return recyclability result with stage indicator
@@ -68,7 +68,7 @@ router.post('/recyclability', async (req: Request, res: Response) => {
 // Original endpoint: Keep for backward compatibility
 router.post('/', async (req: Request, res: Response) => {
   try {
-    const { image, location, context }: AnalyzeRequest = req.body;
+    const { image, location, context, coordinates }: AnalyzeRequest = req.body;
 
     // Validate request
     if (!location || typeof location !== 'string' || location.trim().length === 0) {
@@ -87,14 +87,12 @@ router.post('/', async (req: Request, res: Response) => {
 
     // Step 1: Analyze image with Vision API (only if image is provided)
     if (image) {
-      visionResult = await analyzeImage(image);
+      visionResult = await traceStage('vision', () => analyzeImage(image));
     }
 
     // Step 2: Analyze recyclability with GPT-5 + web search
-    const analysisResult = await analyzeRecyclability(
-      visionResult,
-      contextValue,
-      location
+    const analysisResult = await traceStage('recyclability', () =>
+      analyzeRecyclability(visionResult, contextValue, location, parseCoordinates(coordinates))
     );
 
     // Return combined result
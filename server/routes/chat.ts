@@ -6,10 +6,11 @@ const router = Router();
 
 router.post('/', async (req: Request, res: Response) => {
   try {
-    const { message, conversationHistory, context }: {
+    const { message, conversationHistory, context, conversationId }: {
       message: string;
       conversationHistory?: ChatMessage[];
       context?: ChatContext;
+      conversationId?: string;
     } = req.body;
 
     // Validate request
@@ -22,6 +23,7 @@ router.post('/', async (req: Request, res: Response) => {
       message: message.trim(),
       conversationHistory,
       context,
+      conversationId: typeof conversationId === 'string' ? conversationId : undefined,
     });
 
     // Return response
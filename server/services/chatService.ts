@@ -1,5 +1,6 @@
 import OpenAI from 'openai';
-import { queryRAG } from './ragService.js';
+import { parseCoordinates, queryRAG } from './ragService.js';
+import { traceStage } from './tracing.js';
 import type { ChatMessage, ChatContext } from '../types.js';
 
 function normalizeHttpUrl(url: string): string | null {
@@ -95,6 +96,8 @@ export interface ChatRequest {
   message: string;
   conversationHistory?: ChatMessage[];
   context?: ChatContext;
+  // Stable across the turns of one conversation (see useChat)
+  conversationId?: string;
 }
 
 export interface ChatResponse {
@@ -127,7 +130,7 @@ Your role:
     let ragSources: string[] = [];
     
     if (request.context) {
-      const { analysisData, location, material, visionData } = request.context;
+      const { analysisData, location, material, visionData, coordinates } = request.context;
       
       // Build context summary for system prompt
       if (analysisData || visionData || material) {
@@ -160,11 +163,15 @@ Your role:
         const conditionForRAG = visionData?.condition || analysisData?.category || '';
         const contextForRAG = analysisData?.reasoning || '';
         
+        // With the conversation id, later turns reuse the first turn's
+        // retrieval; only materials new in the message are searched
         const ragResult = await queryRAG(
           materialForRAG,
           locationForRAG,
           conditionForRAG,
-          contextForRAG
+          contextForRAG,
+          parseCoordinates(coordinates),
+          request.conversationId ? { id: request.conversationId, message: request.message } : undefined
         );
         
         if (ragResult && ragResult.regulations) {
@@ -198,18 +205,20 @@ Your role:
     }
     
     // Use Responses API with web search enabled
-    const response = await openai.responses.create({
-      model: 'gpt-4.1',
-      input: input,
-      tools: [
-        {
-          // Use web search tool for grounded citations.
-          // Cast to any to avoid SDK type drift across versions.
-          type: 'web_search' as any,
-          user_location: userLocation,
-        },
-      ],
-    } as any);
+    const response = await traceStage('llm', () =>
+      openai.responses.create({
+        model: 'gpt-4.1',
+        input: input,
+        tools: [
+          {
+            // Use web search tool for grounded citations.
+            // Cast to any to avoid SDK type drift across versions.
+            type: 'web_search' as any,
+            user_location: userLocation,
+          },
+        ],
+      } as any)
+    );
     
     const outputText = response.output_text || '';
     if (!outputText) {
@@ -1,6 +1,7 @@
 import OpenAI from 'openai';
 import type { VisionResponse, AnalyzeResponse, Facility } from '../types.js';
 import { queryRAG } from './ragService.js';
+import { traceStage } from './tracing.js';
 
 // Lazy initialization of OpenAI client
 function getOpenAIClient() {
@@ -182,7 +183,8 @@ function extractWebSearchUrlsFromResponse(response: any): string[] {
 export async function analyzeRecyclability(
   visionResult: VisionResponse | null,
   context: string,
-  location: string
+  location: string,
+  coordinates?: [number, number]
 ): Promise<AnalyzeResponse> {
   try {
     const openai = getOpenAIClient();
@@ -206,7 +208,7 @@ export async function analyzeRecyclability(
     // Only attempt RAG when it is configured. Otherwise, let the analysis fall back to web search.
     if (materialForRAG && ragServiceUrl) {
       try {
-        const ragResult = await queryRAG(materialForRAG, location, conditionForRAG, context);
+        const ragResult = await queryRAG(materialForRAG, location, conditionForRAG, context, coordinates);
         ragQueried = true;
 
         if (ragResult) {
@@ -374,11 +376,13 @@ For the last three fields in "facilities", try to find each facility's contact i
       tools[0].user_location = userLocation;
     }
 
-    const response = await openai.responses.create({
-      model: 'gpt-4.1',
-      tools,
-      input,
-    });
+    const response = await traceStage('llm', () =>
+      openai.responses.create({
+        model: 'gpt-4.1',
+        tools,
+        input,
+      })
+    );
 
     const outputText = response.output_text || '';
     if (!outputText) throw new Error('No output text from Responses API');
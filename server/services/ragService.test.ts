@@ -0,0 +1,54 @@
+import { afterEach, beforeEach, describe, it } from 'node:test';
+import assert from 'node:assert/strict';
+import { parseCoordinates, queryRAG } from './ragService.js';
+
+const realFetch = globalThis.fetch;
+let requests: { url: string; body: Record<string, unknown> }[] = [];
+
+beforeEach(() => {
+  requests = [];
+  process.env.RAG_SERVICE_URL = 'http://rag.test';
+  globalThis.fetch = (async (url: string, init?: RequestInit) => {
+    requests.push({ url, body: JSON.parse(String(init?.body)) });
+    return new Response(JSON.stringify({ regulations: '', sources: [] }), {
+      status: 200,
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }) as typeof fetch;
+});
+
+afterEach(() => {
+  globalThis.fetch = realFetch;
+  delete process.env.RAG_SERVICE_URL;
+});
+
+describe('queryRAG', () => {
+  it('sends coordinates as latitude and longitude', async () => {
+    await queryRAG('Plastic', 'Albany, NY', '', '', [-73.75, 42.65]);
+
+    assert.equal(requests.length, 1);
+    assert.equal(requests[0].url, 'http://rag.test/query');
+    assert.equal(requests[0].body.longitude, -73.75);
+    assert.equal(requests[0].body.latitude, 42.65);
+  });
+
+  it('leaves them out when the location is not geocoded', async () => {
+    await queryRAG('Plastic', 'Albany, NY');
+
+    assert.ok(!('latitude' in requests[0].body));
+    assert.ok(!('longitude' in requests[0].body));
+  });
+});
+
+describe('parseCoordinates', () => {
+  it('accepts a [longitude, latitude] pair', () => {
+    assert.deepEqual(parseCoordinates([-73.75, 42.65]), [-73.75, 42.65]);
+  });
+
+  it('rejects anything else', () => {
+    assert.equal(parseCoordinates(undefined), undefined);
+    assert.equal(parseCoordinates([42.65]), undefined);
+    assert.equal(parseCoordinates(['-73.75', '42.65']), undefined);
+    assert.equal(parseCoordinates([-73.75, 142.65]), undefined);
+  });
+});
@@ -1,17 +1,54 @@
 /**
  * RAG Service client for querying recycling regulations.
  */
+import { traceHeaders, traceStage } from './tracing.js';
 
 export interface RAGQueryRequest {
   material: string;
   location: string;
   condition?: string;
   context?: string;
+  // Geocoded location; decides the county when it falls inside one
+  latitude?: number;
+  longitude?: number;
+  // Chat conversation and the user's message in it (see RAGSession)
+  session_id?: string;
+  message?: string;
+}
+
+export interface RAGSession {
+  // Same for every turn of one conversation: the service reuses its retrieval
+  id: string;
+  // The user's message; materials it names are retrieved on top
+  message?: string;
 }
 
 export interface RAGQueryResponse {
   regulations: string;
   sources: string[];
+  // True when the RAG service ran out of time and skipped some search terms
+  partial?: boolean;
+}
+
+// Time reserved for the response to travel back before our own timeout fires
+const RAG_DEADLINE_MARGIN_MS = 250;
+
+/**
+ * Coordinates from a request body as [longitude, latitude], or undefined
+ * when they are missing or not a valid position.
+ */
+export function parseCoordinates(value: unknown): [number, number] | undefined {
+  if (!Array.isArray(value) || value.length !== 2) {
+    return undefined;
+  }
+  const [longitude, latitude] = value;
+  if (
+    typeof longitude !== 'number' || !Number.isFinite(longitude) || Math.abs(longitude) > 180 ||
+    typeof latitude !== 'number' || !Number.isFinite(latitude) || Math.abs(latitude) > 90
+  ) {
+    return undefined;
+  }
+  return [longitude, latitude];
 }
 
 /**
@@ -21,13 +58,17 @@ export interface RAGQueryResponse {
  * @param location - User location (e.g., "Ithaca, NY", "Albany, NY 12201")
  * @param condition - Item condition (e.g., "clean", "soiled")
  * @param context - Additional context from user
+ * @param coordinates - Geocoded location as [longitude, latitude], if known
+ * @param session - Chat conversation this query belongs to, if any
  * @returns RAG query response with regulations and sources, or null if query fails
  */
 export async function queryRAG(
   material: string,
   location: string,
   condition: string = '',
-  context: string = ''
+  context: string = '',
+  coordinates?: [number, number],
+  session?: RAGSession
 ): Promise<RAGQueryResponse | null> {
   const ragServiceUrl = process.env.RAG_SERVICE_URL;
   const timeoutMs = Number(process.env.RAG_TIMEOUT_MS || 30000);
@@ -38,28 +79,52 @@ export async function queryRAG(
     return null;
   }
   
+  const body: RAGQueryRequest = {
+    material,
+    location,
+    condition: condition || '',
+    context: context || '',
+  };
+  if (coordinates) {
+    [body.longitude, body.latitude] = coordinates;
+  }
+  if (session) {
+    body.session_id = session.id;
+    body.message = session.message;
+  }
+
   try {
-    const response = await fetch(`${ragServiceUrl}/query`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        material,
-        location,
-        condition: condition || '',
-        context: context || '',
-      }),
-      // RAG can be slow on first request (index load + embeddings). Default to 30s.
-      signal: AbortSignal.timeout(timeoutMs),
-    });
+    const response = await traceStage('rag', () =>
+      fetch(`${ragServiceUrl}/query`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          // Lets the RAG service stop working (and answer with what it has) before we give up
+          'X-Request-Timeout-Ms': String(Math.max(timeoutMs - RAG_DEADLINE_MARGIN_MS, 0)),
+          // The RAG service records its spans in this request's trace
+          ...traceHeaders(),
+        },
+        body: JSON.stringify(body),
+        // RAG can be slow on first request (index load + embeddings). Default to 30s.
+        signal: AbortSignal.timeout(timeoutMs),
+      })
+    );
     
+    if (response.status === 503) {
+      // Load shedding: the service is saturated, continue without RAG
+      console.warn('RAG service overloaded, skipping RAG query');
+      return null;
+    }
+
     if (!response.ok) {
       console.error(`RAG service error: ${response.status} ${response.statusText}`);
       return null;
     }
     
     const data: RAGQueryResponse = await response.json();
+    if (data.partial) {
+      console.warn('RAG service returned partial results (deadline reached)');
+    }
     return data;
     
   } catch (error) {
@@ -0,0 +1,89 @@
+/**
+ * Request tracing with W3C trace context.
+ *
+ * Every API request runs in a trace: the caller's `traceparent` is continued,
+ * or a new trace is started. Services time their stages with `traceStage()`,
+ * and calls to the RAG service send a child `traceparent`, so the RAG
+ * service's spans for a request share its trace id. When the request ends,
+ * one line with the trace id and the stage timings is logged (`TRACE_LOG=0`
+ * turns this off).
+ */
+import { AsyncLocalStorage } from 'async_hooks';
+import { randomBytes } from 'crypto';
+import type { NextFunction, Request, Response } from 'express';
+
+export interface TraceContext {
+  traceId: string;
+  // Span of the incoming request; outgoing calls are its children
+  spanId: string;
+  sampled: boolean;
+  // Stages timed with traceStage(), in the order they finished
+  stages: { name: string; ms: number }[];
+}
+
+const storage = new AsyncLocalStorage<TraceContext>();
+const TRACEPARENT = /^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$/;
+
+function randomHex(bytes: number): string {
+  return randomBytes(bytes).toString('hex');
+}
+
+function formatTraceparent(traceId: string, spanId: string, sampled: boolean): string {
+  return `00-${traceId}-${spanId}-${sampled ? '01' : '00'}`;
+}
+
+export function currentTrace(): TraceContext | undefined {
+  return storage.getStore();
+}
+
+/**
+ * Express middleware: runs the rest of the request in a trace and logs its
+ * stage timings when the response is sent.
+ */
+export function traceRequests(req: Request, res: Response, next: NextFunction) {
+  const header = req.headers.traceparent;
+  const incoming = typeof header === 'string' ? TRACEPARENT.exec(header.trim().toLowerCase()) : null;
+  const valid = incoming && incoming[1] !== 'ff' && !/^0+$/.test(incoming[2]) && !/^0+$/.test(incoming[3]);
+  const trace: TraceContext = {
+    traceId: valid ? incoming[2] : randomHex(16),
+    spanId: randomHex(8),
+    sampled: valid ? (parseInt(incoming[4], 16) & 1) === 1 : true,
+    stages: [],
+  };
+  res.setHeader('traceresponse', formatTraceparent(trace.traceId, trace.spanId, trace.sampled));
+
+  const start = performance.now();
+  res.on('finish', () => {
+    if (process.env.TRACE_LOG === '0') return;
+    const stages = trace.stages.map((s) => `${s.name} ${Math.round(s.ms)} ms`).join(', ');
+    console.log(
+      `[trace ${trace.traceId}] ${req.method} ${req.originalUrl} ${res.statusCode} ` +
+        `${Math.round(performance.now() - start)} ms${stages ? ` (${stages})` : ''}`
+    );
+  });
+  storage.run(trace, next);
+}
+
+/**
+ * `traceparent` header for an outgoing call, as a new child span of the
+ * current request; empty outside a trace.
+ */
+export function traceHeaders(): Record<string, string> {
+  const trace = currentTrace();
+  if (!trace) return {};
+  return { traceparent: formatTraceparent(trace.traceId, randomHex(8), trace.sampled) };
+}
+
+/**
+ * Runs `fn` and records how long it took as stage `name` of the current
+ * request. Stages may nest (the RAG query runs inside recyclability).
+ */
+export async function traceStage<T>(name: string, fn: () => Promise<T>): Promise<T> {
+  const trace = currentTrace();
+  const start = performance.now();
+  try {
+    return await fn();
+  } finally {
+    trace?.stages.push({ name, ms: performance.now() - start });
+  }
+}
@@ -3,6 +3,7 @@ export interface AnalyzeRequest {
   image?: string; // optional - either image or context required
   location: string;
   context: string;
+  coordinates?: [number, number]; // [longitude, latitude] of the location, if geocoded
 }
 
 export interface VisionResponse {
@@ -56,5 +57,6 @@ export interface ChatContext {
   location?: string;
   material?: string;
   visionData?: VisionResponse;
+  coordinates?: [number, number]; // [longitude, latitude] of the location, if geocoded
 }
 
@@ -2,6 +2,15 @@ import { useState, useCallback, useRef, useEffect } from 'react';
 import { sendChatMessage } from '../utils/api';
 import type { ChatMessage, ChatContext, ChatState } from '../types/recycleiq';
 
+// Identifies one conversation to the backend, which lets the RAG service
+// reuse the conversation's retrieval across turns
+function newConversationId(): string {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 export function useChat(initialContext?: ChatContext) {
   const [state, setState] = useState<ChatState>({
     messages: [],
@@ -13,6 +22,7 @@ export function useChat(initialContext?: ChatContext) {
   // Use ref to always have latest context and messages
   const contextRef = useRef(state.context);
   const messagesRef = useRef(state.messages);
+  const conversationIdRef = useRef(newConversationId());
   
   // Update refs when state changes
   useEffect(() => {
@@ -22,6 +32,7 @@ export function useChat(initialContext?: ChatContext) {
 
   // Initialize with context if provided
   const initializeWithContext = useCallback((context: ChatContext) => {
+    conversationIdRef.current = newConversationId();
     setState(prev => {
       contextRef.current = context;
       return {
@@ -83,7 +94,8 @@ export function useChat(initialContext?: ChatContext) {
       const response = await sendChatMessage(
         message.trim(),
         conversationHistory,
-        contextRef.current || undefined
+        contextRef.current || undefined,
+        conversationIdRef.current
       );
 
       const assistantMessage: ChatMessage = {
@@ -128,6 +140,7 @@ export function useChat(initialContext?: ChatContext) {
   }, []);
 
   const clearChat = useCallback(() => {
+    conversationIdRef.current = newConversationId();
     contextRef.current = null;
     messagesRef.current = [];
     setState({
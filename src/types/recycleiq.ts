@@ -2,6 +2,7 @@ export interface AnalyzeRequest {
   image?: string; // base64-encoded image (optional - either image or context required)
   location: string;
   context: string;
+  coordinates?: [number, number]; // [longitude, latitude] of the location, if geocoded
 }
 
 export interface VisionResponse {
@@ -71,6 +72,7 @@ export interface ChatContext {
   location?: string;
   material?: string;
   visionData?: VisionResponse;
+  coordinates?: [number, number]; // [longitude, latitude] of the location, if geocoded
 }
 
 export interface ChatState {
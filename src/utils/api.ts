@@ -62,12 +62,13 @@ export interface ChatApiResponse {
 export async function sendChatMessage(
   message: string,
   conversationHistory?: ChatMessage[],
-  context?: ChatContext
+  context?: ChatContext,
+  conversationId?: string
 ): Promise<ChatApiResponse> {
   const response = await fetch('/api/chat', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ message, conversationHistory, context }),
+    body: JSON.stringify({ message, conversationHistory, context, conversationId }),
   });
 
   if (!response.ok) {
@@ -1,40 +1,317 @@
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+import argparse
+from contextlib import nullcontext
+from pathlib import Path
+
+from llama_index.core import Settings, SimpleDirectoryReader, StorageContext, VectorStoreIndex
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.embeddings.openai import OpenAIEmbedding
+import numpy as np
 import yaml
 import dotenv
+from build_manifest import BuildProfile, count_tokens, dir_bytes, embedding_batches, inputs_hash
+from rag_service.dense_index import (
+    DEFAULT_EMBED_MODEL,
+    QUANTIZATIONS,
+    REDUCTIONS,
+    normalize_rows,
+    reduce_dims,
+    write_dense_index,
+)
+from rag_service.node_store import COMPRESSIONS, write_node_store
+from rag_service.snapshots import (
+    MANIFEST_NAME,
+    SHARDS_DIR,
+    new_version,
+    publish_snapshot,
+    shard_key,
+    snapshot_dir,
+    write_shards_manifest,
+)
+from rag_service.text_normalize import DISPLAY_TEXT_KEY, normalize_display_text
 
 dotenv.load_dotenv()
 
-splitter = SentenceSplitter(chunk_size=800, chunk_overlap=120)
-docs = SimpleDirectoryReader("./rag/rag_docs").load_data()
-
-for d in docs:
-    text = d.text
-    if text.startswith("---"):
-        _, yaml_block, _ = text.split("---", 2)
-        metadata = yaml.safe_load(yaml_block) or {}
-        url = ''
-        if (metadata["content_type"] == "pdf"):
-            url:str = metadata["source_file"]
-        elif(metadata["content_type"] == "html"):
-            url:str = metadata["source_url"]
-        lastInd =url.rfind("/")
-        if (lastInd < len(url) - 1):
-            # Get text after last / but ignore anything after a . (to avoid things like .com, .php)
-            topic = url[lastInd+1:].split(".")[0]
-            metadata["topic"] = topic
+DOCS_DIR = "./rag/rag_docs"
+PERSIST_DIR = "./rag_service/rag_index_morechunked"
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 120
+
+
+def front_matter_metadata(text: str) -> dict:
+    """Metadata from a scraped document's YAML front matter, plus its ``topic``."""
+    if not text.startswith("---"):
+        return {}
+    _, yaml_block, _ = text.split("---", 2)
+    metadata = yaml.safe_load(yaml_block) or {}
+    url = ''
+    if (metadata["content_type"] == "pdf"):
+        url:str = metadata["source_file"]
+    elif(metadata["content_type"] == "html"):
+        url:str = metadata["source_url"]
+    lastInd =url.rfind("/")
+    if (lastInd < len(url) - 1):
+        # Get text after last / but ignore anything after a . (to avoid things like .com, .php)
+        topic = url[lastInd+1:].split(".")[0]
+        metadata["topic"] = topic
+    return metadata
+
+
+def load_documents(docs_dir: str = DOCS_DIR):
+    docs = SimpleDirectoryReader(docs_dir).load_data()
+
+    for d in docs:
+        d.metadata.update(front_matter_metadata(d.text))
+    return docs
+
+
+def build_nodes(docs, splitter=None):
+    splitter = splitter or SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    nodes = splitter.get_nodes_from_documents(docs)
+
+    # Normalization stage: precompute the link-free display text of every chunk so
+    # the RAG service only concatenates strings at request time. The field is kept
+    # out of the embedding and LLM views of the node.
+    for node in nodes:
+        node.metadata[DISPLAY_TEXT_KEY] = normalize_display_text(node.text)
+        node.excluded_embed_metadata_keys.append(DISPLAY_TEXT_KEY)
+        node.excluded_llm_metadata_keys.append(DISPLAY_TEXT_KEY)
+    return nodes
+
+
+def _write_export(out_dir, node_ids, vectors, texts, metadata, quantization, dims, reduction,
+                  embed_model, compression, projection=None):
+    meta = write_dense_index(
+        out_dir, node_ids, vectors, quantization, dims, reduction,
+        embed_model=embed_model, projection=projection,
+    )
+    store_meta = write_node_store(out_dir, texts, metadata, compression)
+    return meta, store_meta
+
+
+def shard_manifest_entry(meta):
+    """What the shards manifest records about one shard export."""
+    return {
+        "count": meta["count"],
+        "scan_bytes": meta["count"] * meta["scan_dims"] * np.dtype(meta["quantization"]).itemsize,
+    }
 
+
+def export_serving_index(
+    storage_context,
+    out_dir,
+    quantization,
+    dims=None,
+    reduction="pca",
+    embed_model=DEFAULT_EMBED_MODEL,
+    compression=None,
+    shard=True,
+    profile=None,
+):
+    """Write the serving export from persisted llama_index storage."""
+    embedding_dict = storage_context.vector_store.data.embedding_dict
+    node_ids = list(embedding_dict)
+    vectors = np.array([embedding_dict[i] for i in node_ids], dtype=np.float32)
+
+    # Chunk texts and metadata in the same row order, so the service does not
+    # need the docstore
+    nodes = storage_context.docstore.get_nodes(node_ids)
+    texts = [
+        n.metadata.get(DISPLAY_TEXT_KEY) or normalize_display_text(n.text) for n in nodes
+    ]
+    metadata = [n.metadata for n in nodes]
+    return write_serving_export(
+        out_dir, node_ids, vectors, texts, metadata,
+        quantization, dims, reduction, embed_model, compression, shard, profile,
+    )
+
+
+def write_serving_export(
+    out_dir,
+    node_ids,
+    vectors,
+    texts,
+    metadata,
+    quantization,
+    dims=None,
+    reduction="pca",
+    embed_model=DEFAULT_EMBED_MODEL,
+    compression=None,
+    shard=True,
+    profile=None,
+):
+    """
+    Write the serving export of chunks given as parallel rows.
+
+    With ``shard`` (the default) every county gets its own export under
+    ``shards/`` plus a statewide shard for chunks without a county (see
+    rag_service/shards.py); otherwise one monolithic export is written.
+    A ``BuildProfile`` records the time and size of each shard's export.
+    """
+    if not shard:
+        meta, store_meta = _write_export(
+            out_dir, node_ids, vectors, texts, metadata,
+            quantization, dims, reduction, embed_model, compression,
+        )
+        print(
+            f"Exported {meta['count']} vectors to {out_dir} "
+            f"({meta['quantization']}, {meta['scan_dims']}/{meta['dims']} dims; "
+            f"chunk texts {store_meta['compression'] or 'uncompressed'}, "
+            f"{len(store_meta['sources'])} distinct sources)"
+        )
+        return meta
+
+    # One PCA basis for all shards, fitted on the whole corpus: small
+    # shards have too few rows to fit their own
+    projection = None
+    if dims and reduction == "pca":
+        _, projection = reduce_dims(normalize_rows(vectors), dims, reduction)
+
+    groups = {}
+    for row, md in enumerate(metadata):
+        groups.setdefault(shard_key(md.get("county")), []).append(row)
+
+    shards = {}
+    for name, rows in sorted(groups.items()):
+        shard_dir = Path(out_dir) / SHARDS_DIR / name
+        timed = profile.stage("shard_export", county=name, shard=name) if profile else nullcontext({})
+        with timed as counters:
+            meta, _ = _write_export(
+                shard_dir,
+                [node_ids[r] for r in rows],
+                vectors[rows],
+                [texts[r] for r in rows],
+                [metadata[r] for r in rows],
+                quantization, dims, reduction, embed_model, compression, projection,
+            )
+            counters.update(chunks=len(rows), bytes=dir_bytes(shard_dir))
+        shards[name] = shard_manifest_entry(meta)
+    write_shards_manifest(out_dir, shards, embed_model)
+    print(
+        f"Exported {len(node_ids)} vectors to {out_dir} in {len(shards)} shards "
+        f"({meta['quantization']}, {meta['scan_dims']}/{meta['dims']} dims; "
+        f"largest shard {max(s['count'] for s in shards.values())} chunks)"
+    )
+    return {**meta, "count": len(node_ids), "shards": len(shards)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the RAG vector index.")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR)
+    parser.add_argument("--docs", default=DOCS_DIR, help="scraped corpus to index")
+    parser.add_argument(
+        "--quantize",
+        choices=QUANTIZATIONS,
+        help="type of the serving export's scan matrix (default: int8 with --dims, else float32)",
+    )
+    parser.add_argument(
+        "--dims", type=int, help="reduce serving vectors to this many dimensions"
+    )
+    parser.add_argument("--reduction", choices=REDUCTIONS, default="pca")
+    parser.add_argument(
+        "--embed-model",
+        default=DEFAULT_EMBED_MODEL,
+        help="OpenAI embedding model (recorded in the export for query embeddings)",
+    )
+    parser.add_argument(
+        "--compress-chunks",
+        choices=[c or "none" for c in COMPRESSIONS],
+        default="none",
+        help="compress chunk texts per block (zstd needs `zstandard` in the service)",
+    )
+    parser.add_argument(
+        "--no-shards",
+        action="store_true",
+        help="write one monolithic export instead of one shard per county",
+    )
+    parser.add_argument(
+        "--keep", type=int, default=3, help="serving snapshots to keep (default: 3)"
+    )
+    parser.add_argument(
+        "--export-only",
+        action="store_true",
+        help="skip embedding and export from the existing --persist-dir",
+    )
+    parser.add_argument(
+        "--manifest", type=Path, help="build manifest to write (default: build_manifests/index-<time>.json)"
+    )
+    args = parser.parse_args()
+
+    # What changes the output; paths and retention do not
+    config = {k: v for k, v in vars(args).items() if k not in ("persist_dir", "docs", "manifest", "keep")}
+    config.update(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    profile = BuildProfile("index", config)
+    if args.export_only:
+        with profile.stage("load"):
+            storage_context = StorageContext.from_defaults(persist_dir=args.persist_dir)
     else:
-        metadata = {}
-    d.metadata.update(metadata)
+        docs_dir = Path(args.docs)
+        profile.inputs = inputs_hash(
+            f"{p.name}:{p.stat().st_size}" for p in docs_dir.iterdir() if p.is_file() and not p.name.startswith(".")
+        )
+        Settings.embed_model = OpenAIEmbedding(model=args.embed_model)
+        with profile.stage("load"):
+            docs = load_documents(args.docs)
+        for d in docs:
+            profile.count("load", county=d.metadata.get("county"), documents=1, bytes=len(d.text.encode("utf-8")))
+        with profile.stage("chunk"):
+            nodes = build_nodes(docs)
+        for node in nodes:
+            tokens = count_tokens(node.get_content(metadata_mode=MetadataMode.EMBED))
+            profile.count("chunk", county=node.metadata.get("county"), chunks=1, tokens=tokens)
+        # Embedding requests are recorded one batch at a time as "embed" items
+        with profile.stage("index"), embedding_batches(profile):
+            index = VectorStoreIndex(nodes)
+        with profile.stage("persist"):
+            index.storage_context.persist(args.persist_dir)
+        storage_context = index.storage_context
+
+    # Self-contained serving export, written as a new versioned snapshot and
+    # published through the manifest; running services swap it in live
+    version = new_version(args.persist_dir)
+    # Includes the per-shard "shard_export" stages
+    with profile.stage("serving_export"):
+        meta = export_serving_index(
+            storage_context,
+            snapshot_dir(args.persist_dir, version),
+            args.quantize,
+            args.dims,
+            args.reduction,
+            args.embed_model,
+            None if args.compress_chunks == "none" else args.compress_chunks,
+            shard=not args.no_shards,
+            profile=profile,
+        )
+    info = {k: meta[k] for k in ("count", "dims", "scan_dims", "quantization", "embed_model", "shards") if k in meta}
+    with profile.stage("publish"):
+        publish_snapshot(args.persist_dir, version, info, keep=args.keep)
+
+    stages = profile.stages
+    profile.totals = {
+        "documents": stages.get("load", {}).get("documents", 0),
+        "chunks": meta["count"],
+        "tokens_embedded": stages.get("embed", {}).get("tokens", 0),
+        "embedding_requests": stages.get("embed", {}).get("calls", 0),
+    }
+    profile.outputs = {
+        "snapshot": version,
+        "snapshot_bytes": dir_bytes(snapshot_dir(args.persist_dir, version)),
+        # llama_index JSON storage (docstore, vector store) next to the snapshots
+        "storage_bytes": sum(
+            p.stat().st_size for p in Path(args.persist_dir).glob("*.json") if p.name != MANIFEST_NAME
+        ),
+    }
+    path = profile.write(args.manifest)
+    print(f"Published serving snapshot {version}; build manifest {path}")
+
 
-nodes = splitter.get_nodes_from_documents(docs)
-index = VectorStoreIndex(nodes)
-index.storage_context.persist("./rag_service/rag_index_morechunked")
+if __name__ == "__main__":
+    main()
 
 # Less chunked code
 #docs = SimpleDirectoryReader("./rag/rag_docs").load_data()
 #index = VectorStoreIndex.from_documents(docs, show_progress=True)
 #index.storage_context.persist(
 #    persist_dir=("./rag/rag_index")
-#)
\ No newline at end of file
+#)